@@ -1,10 +1,23 @@
 # Import packages
-import os, sys
-from typing import List, Tuple
+# Only light modules are imported here; sentence_transformers, chromadb and openai load on
+# first use (or on background warm-up threads while the prompt is already shown).
+import os, sys, json, time, asyncio, argparse, threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from dotenv import load_dotenv
-from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from query_cache import open_default as open_query_cache
+from answer_cache import answer_key, open_default as open_answer_cache
+from semantic_cache import open_default as open_semantic_cache
+from llm_scheduler import estimate_tokens, with_retries
+from lexical_index import LEXICAL_WEIGHT
+from context_packer import pack_context
+from embed_batcher import EMBED_BATCH
+import embed_batcher
+from reranker import RERANK, RERANK_FETCH, RERANK_MODEL, Reranker
+from tracing import TRACE_METRICS_PORT, bind, serve_metrics, span, trace
+import tracing
+import model_registry
 
 # Runtime and performance settings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -19,77 +32,374 @@ load_dotenv()
 
 DB_PATH       = os.getenv("CHROMA_PATH", "./vector_db")
 COLL_NAME = os.getenv("CHROMA_COLLECTION", "Implementation_Phase")
+EMBED_STORE   = os.getenv("EMBED_STORE")  # optional binary embedding store; used instead of Chroma
+FEDERATED     = os.getenv("FEDERATED", "0") == "1"  # search every phase collection at once
+FEDERATED_BACKEND = os.getenv("FEDERATED_BACKEND", "chroma")  # or "store" / "snapshot" (published by ingest.py)
+INDEX_SNAPSHOT = os.getenv("INDEX_SNAPSHOT", "0") == "1"  # serve COLL_NAME from its published read-only snapshot
+PHASE_ROUTER  = os.getenv("PHASE_ROUTER", "0") == "1"
 TOP_K         = int(os.getenv("TOP_K", "6"))
 CHAT_MODEL    = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")  # or "onnx" / "openvino" (sentence-transformers >= 3.2)
+EMBED_MODEL_PATH = os.getenv("EMBED_MODEL_PATH")  # local copy written by --export-encoder (single collection)
+STARTUP_CACHE = os.getenv("QNA_STARTUP_CACHE", "./qna_startup.json")  # cached dimension checks
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # e.g. Coding/mock_llm_server.py for offline runs
 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY missing in .env")
 
-# Initialize embedding model
-print("[init] Loading SBERT model ...")
-sbert = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device="cpu")
+# Set by the loaders below on first use
+EMBED_MODEL = None  # the collection's encoder, from the model registry
+embed_models: Dict[str, str] = {}  # collection -> encoder
+store = fed = coll = shard = None
+qcache = scache = None
+acache = open_answer_cache()
+reranker = Reranker() if RERANK else None
+
+
+class Lazy:
+    # Builds a value once, on first use, from whichever thread gets there first
+    _unset = object()
+
+    def __init__(self, build):
+        self.build = build
+        self.lock = threading.Lock()
+        self.value = self._unset
+
+    def get(self):
+        if self.value is self._unset:
+            with self.lock:
+                if self.value is self._unset:
+                    self.value = self.build()
+        return self.value
+
+    @property
+    def ready(self) -> bool:
+        return self.value is not self._unset
+
+
+# Embedding models: each collection is queried with the encoder the registry recorded for it
+def _resolve_models() -> Dict[str, str]:
+    global EMBED_MODEL, embed_models
+    if FEDERATED or EMBED_STORE or INDEX_SNAPSHOT:
+        _backend.get()  # the opened shards know their models
+        shards = fed.shards if fed is not None else [shard]
+        embed_models = {s.name: s.model for s in shards}
+    else:
+        # Straight from the registry / sqlite catalog, so the encoder loads while Chroma opens
+        embed_models = {COLL_NAME: model_registry.resolve(COLL_NAME, DB_PATH).name}
+    EMBED_MODEL = sorted(set(embed_models.values()))[0] if embed_models else None
+    print(f"[init] Embedding models: {embed_models}")
+    return embed_models
+
+_models = Lazy(_resolve_models)
+
+def _local_path(model: str) -> Optional[str]:
+    return EMBED_MODEL_PATH if EMBED_MODEL_PATH and not FEDERATED else None
+
+def _encoder_for(model: str):
+    # Shared with anything else in the process that asked for the same model
+    return model_registry.get_encoder(model, EMBED_BACKEND, _local_path(model))
 
-# Connect vector database
-print(f"[init] Opening Chroma database at {DB_PATH}...")
-db = PersistentClient(path=DB_PATH)
-print("[debug] DB abs path:", os.path.abspath(DB_PATH))
-print("[debug] collections now:", [c.name for c in db.list_collections()])
+def export_encoder(out_dir: str, backend: str = "onnx") -> str:
+    # Serialize the collection's encoder once (ONNX export happens on load); then run with
+    # EMBED_MODEL_PATH=<out_dir> EMBED_BACKEND=<backend> to skip the conversion at startup
+    _models.get()
+    model_registry.get_encoder(EMBED_MODEL, backend).save_pretrained(out_dir)
+    return out_dir
 
-coll = db.get_or_create_collection(name=COLL_NAME)
 
-# Database probe utility
-def probe_index(c):
+# Collection version (from the ingest manifest) so cached results go stale on re-index
+def collection_version() -> str:
+    _backend.get()
+    return _collection_version()
+
+def _collection_version() -> str:
+    if fed is not None:
+        return f"federated:{fed.fusion}:{int(fed.routing)}:{fed.version()}"
+    if store is not None:
+        return f"store:{store.info['path']}:{shard.version()}"
+    manifest_fp = os.path.join(DB_PATH, "index_manifest.json")
+    if os.path.exists(manifest_fp):
+        with open(manifest_fp, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("collection") == COLL_NAME and manifest.get("version"):
+            return f"{COLL_NAME}:{manifest['version']}"
+    return f"{COLL_NAME}:count={coll.count()}"
+
+def _load_startup_cache() -> dict:
+    try:
+        with open(STARTUP_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_startup_cache(cache: dict):
     try:
-        peek = c.get(limit=1, include=["documents", "metadatas", "embeddings", "ids"])
-        print("[probe] id:", peek["ids"][0])
-        meta0 = (peek.get("metadatas") or [None])[0] or {}
-        doc0 = (peek.get("documents") or [None])[0]
-        if not doc0:
-            for k in ("text", "content", "page_content", "chunk", "raw"):
-                if k in meta0 and meta0[k]:
-                    doc0 = meta0[k]
-                    break
-        print("[probe] doc preview:", (doc0 or "")[:200].replace("\n", " "))
-        emb_dim = len((peek.get("embeddings") or [[]])[0])
-        print("[probe] embedding dim:", emb_dim)
-        return emb_dim
-    except Exception as e:
-        print("[probe] error:", e)
-        return None
-
-# Embedding dimension validation
-emb_dim = probe_index(coll)
-try:
-    _probe_vec = sbert.encode(["test"], normalize_embeddings=True)[0]
-    model_dim = len(_probe_vec)
-    if emb_dim and model_dim != emb_dim:
-        print(f"Embedding dim mismatch: collection={emb_dim}, model={model_dim}")
-        sys.exit(1)
+        with open(STARTUP_CACHE + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(STARTUP_CACHE + ".tmp", STARTUP_CACHE)
+    except OSError as e:
+        print("[check] could not save startup cache:", e)
+
+def _check_dims():
+    # Each shard's vectors already match its registered model (checked when it opened); this
+    # checks the encoder that will actually run (local export, backend) produces that dimension.
+    # Cached per (model, collection version), so a warm start needs no model load.
+    cache = _load_startup_cache()
+    model_dims, checks = cache.setdefault("model_dims", {}), cache.setdefault("checks", {})
+    if fed is None:
+        print("[debug] DB abs path:", os.path.abspath(EMBED_STORE or DB_PATH))
+    for s in list(fed.shards if fed is not None else [shard]):
+        model_key = f"{_local_path(s.model) or s.model}|{EMBED_BACKEND}"
+        check_key = f"{model_key}|{s.name}:{s.version()}"
+        if check_key in checks:
+            continue
+        if model_key not in model_dims:
+            model_dims[model_key] = _encoder_for(s.model).get_sentence_embedding_dimension()
+        if s.dim and model_dims[model_key] != s.dim:
+            msg = f"Embedding dim mismatch in {s.name}: collection={s.dim}, {s.model}={model_dims[model_key]}"
+            if fed is None:
+                raise RuntimeError(msg)
+            print(f"[check] skip {msg}")
+            fed.shards.remove(s)
+            continue
+        checks[check_key] = s.dim
+    if fed is not None:
+        if not fed.shards:
+            raise RuntimeError("No collection matches its registered embedding model")
+        print(f"[check] federating {fed.names} with {fed.models} "
+              f"(fusion={fed.fusion}, router={'on' if fed.routing else 'off'})")
+    else:
+        print(f"[check] ok: collection={shard.dim}, model={shard.model}")
+    _save_startup_cache(cache)
+
+
+# Connect vector database (or memory-map a binary embedding store, or federate every phase)
+def _open_backend():
+    global store, fed, coll, shard
+    t0 = time.perf_counter()
+    from federated import ChromaShard, FederatedRetriever, StoreShard
+    if FEDERATED:
+        print(f"[init] Opening every phase collection ({FEDERATED_BACKEND}) for federated retrieval...")
+        fed = FederatedRetriever.open_default(backend=FEDERATED_BACKEND, route=PHASE_ROUTER)
+    elif INDEX_SNAPSHOT:
+        from snapshots import current
+        snapshot = current(COLL_NAME)
+        if snapshot is None:
+            raise RuntimeError(f"No published snapshot for {COLL_NAME}; run ingest.py")
+        print(f"[init] Mapping snapshot {snapshot}...")
+        shard = StoreShard.from_snapshot(COLL_NAME, snapshot)
+        store = shard.store
+    elif EMBED_STORE:
+        print(f"[init] Mapping embedding store at {EMBED_STORE}...")
+        shard = StoreShard(COLL_NAME, EMBED_STORE)
+        store = shard.store
     else:
-        print(f"[check] ok: collection={emb_dim}, model={model_dim}")
-except Exception as e:
-    print("[check] error while validating embedding dim:", e)
-    sys.exit(1)
+        from chromadb import PersistentClient
+        print(f"[init] Opening Chroma database at {DB_PATH}...")
+        db = PersistentClient(path=DB_PATH)
+        coll = db.get_or_create_collection(name=COLL_NAME)
+        # Wraps the collection with its BM25 index (saved by ingest.py, else built from the documents)
+        shard = ChromaShard(COLL_NAME, DB_PATH, client=db)
+    _check_dims()
+    _open_caches()
+    if INDEX_SNAPSHOT or (FEDERATED and FEDERATED_BACKEND == "snapshot"):
+        threading.Thread(target=_watch_snapshots, name="snapshot-watch", daemon=True).start()
+    print(f"[init] Retrieval backend ready in {time.perf_counter() - t0:.2f}s")
+    return True
+
+def _open_caches():
+    # Keyed on the collection versions, so they are reopened when a new snapshot is swapped in
+    global qcache, scache
+    from federated import phases_of
+    models = "+".join(sorted({s.model for s in (fed.shards if fed is not None else [shard])}))
+    model_key = models if EMBED_BACKEND == "torch" else f"{models}:{EMBED_BACKEND}"
+    rerank_key = RERANK_MODEL if reranker else 0
+    qcache = open_query_cache(model_key, f"{_collection_version()}:lexical={LEXICAL_WEIGHT}:rerank={rerank_key}")
+    # Paraphrases: keyed per collection version, so re-indexing one collection drops only its entries.
+    # Near-duplicates naming different phases ("design" vs "implementation" plan) aren't reused.
+    shards = fed.shards if fed is not None else [shard]
+    layout = f"federated:{fed.fusion}:{int(fed.routing)}" if fed is not None else shard.kind
+    scache = open_semantic_cache(model_key, {s.name: s.version() for s in shards},
+                                 f"{layout}:lexical={LEXICAL_WEIGHT}:rerank={rerank_key}",
+                                 guard=lambda q, cached: phases_of(q) == phases_of(cached))
+
+_backend = Lazy(_open_backend)
+_reload_lock = threading.Lock()
+
+def reload_snapshots() -> List[str]:
+    # Opens any newly published snapshot beside the live one, then swaps it in; requests already
+    # searching finish on the old one. -> collections that moved
+    global shard, store
+    from federated import reload_shard
+    with _reload_lock:
+        live = fed.shards if fed is not None else [shard]
+        fresh = [reload_shard(s) or s for s in live]
+        moved = [s.name for s, old in zip(fresh, live) if s is not old]
+        if not moved:
+            return []
+        # A re-embedded collection's encoder loads before its first query
+        for model in {s.model for s in fresh} - {s.model for s in live}:
+            embed(["warm up"], model)
+        if fed is not None:
+            fed.shards = fresh
+        else:
+            shard, store = fresh[0], fresh[0].store
+        _models.value = _resolve_models()
+        _open_caches()
+        print(f"[snapshots] now serving {', '.join(f'{s.name}@{s.version()}' for s in fresh if s.name in moved)}")
+        return moved
+
+def _watch_snapshots():
+    from snapshots import SNAPSHOT_POLL_S
+    while True:
+        time.sleep(SNAPSHOT_POLL_S)
+        try:
+            reload_snapshots()
+        except Exception as e:
+            print(f"[snapshots] still on the current snapshot; reload failed: {type(e).__name__}: {e}")
+
+
+# Initialize OpenAI clients (the async one is used by server.py; retries go through llm_scheduler)
+def _openai_clients():
+    from openai import AsyncOpenAI, OpenAI
+    return (OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL),
+            AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0))
+
+_clients = Lazy(_openai_clients)
 
-# Initialize OpenAI client
-oa = OpenAI(api_key=OPENAI_API_KEY)
+
+def warm_up(background: bool = True) -> List[threading.Thread]:
+    # Load the backend, the encoder and the OpenAI client concurrently; errors resurface on first use
+    def run(name, fn):
+        try:
+            fn()
+        except Exception as e:
+            print(f"[warmup] {name} failed: {type(e).__name__}: {e}")
+    jobs = [("backend", _backend.get), ("encoder", lambda: [embed(["warm up"], m) for m in set(_models.get().values())]),
+            ("openai", _clients.get)]
+    if reranker:
+        jobs.append(("reranker", lambda: reranker.warm_up().result()))
+    threads = [threading.Thread(target=run, args=job, name=f"warmup-{job[0]}", daemon=True) for job in jobs]
+    for t in threads:
+        t.start()
+    if not background:
+        for t in threads:
+            t.join()
+    return threads
+
+def is_ready() -> bool:
+    return _backend.ready and _models.ready and all(
+        model_registry.is_loaded(m, EMBED_BACKEND, _local_path(m)) for m in _models.get().values())
 
 # Core embedding and retrieval utilities
-def embed(texts: List[str]) -> List[List[float]]:
-    return sbert.encode(texts, normalize_embeddings=True).tolist()
+def embed(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    # model defaults to the collection's registered encoder
+    _models.get()
+    return model_registry.encode(model or EMBED_MODEL, texts, backend=EMBED_BACKEND,
+                                 path=_local_path(model or EMBED_MODEL)).tolist()
+
+def _encode_query(query: str, model: str, s, future=None) -> List[float]:
+    # Through the micro-batcher, so concurrent questions share one forward pass
+    if not EMBED_BATCH:
+        return embed([query], model)[0]
+    future = future or embed_batcher.submit(model, query, EMBED_BACKEND, _local_path(model))
+    vec = future.result()
+    s.set(batch_size=future.batch_size, queue_ms=round(future.queue_wait * 1000, 3))
+    return vec.tolist()
+
+def embed_query(query: str) -> Union[List[float], Dict[str, List[float]]]:
+    # One vector, or {model: vector} when the federated collections use several encoders
+    _backend.get()
+    models = sorted(set(_models.get().values()))
+    cached = {m: qcache.get_embedding(query, m) if qcache else None for m in models}
+    # Every encoder's pass is queued before waiting on any, so several models encode side by side
+    pending = {m: embed_batcher.submit(m, query, EMBED_BACKEND, _local_path(m))
+               for m in models if cached[m] is None and EMBED_BATCH}
+    vecs = {}
+    for model in models:
+        with span("encode", model=model) as s:
+            vec = cached[model]
+            s.set(cache="hit" if vec is not None else "miss")
+            if vec is None:
+                vec = _encode_query(query, model, s, pending.get(model))
+                if qcache:
+                    qcache.put_embedding(query, vec, model)
+        vecs[model] = vec
+    return vecs if len(vecs) > 1 else next(iter(vecs.values()))
+
+def _unpack(hits) -> Tuple[list, list, list, list]:
+    return ([h.id for h in hits], [h.document for h in hits], [h.distance for h in hits],
+            [h.metadata for h in hits])
+
+def search(qv: Union[List[float], Dict[str, List[float]]], k: int = TOP_K, question: Optional[str] = None) -> Tuple[list, list, list, list]:
+    # Dense top-k, fused with BM25 hits for `question` (hybrid); distances are 1 - cosine
+    _backend.get()
+    with span("search", k=k, backend="federated" if fed is not None else shard.kind) as s:
+        if fed is not None:
+            ids, docs, dists, metas = _unpack(fed.search(qv, k, question))
+        else:
+            ids, docs, sims, metas = shard.search(qv, k, question)
+            dists = [1.0 - x for x in sims]
+        s.set(hits=len(ids))
+    return ids, docs, dists, metas
+
+def candidates(k: int) -> int:
+    # How many hits to fetch for a final top-k: over-fetched when the reranker is on
+    return max(k, RERANK_FETCH) if reranker else k
+
+def rerank(query: str, ids: list, docs: list, dists: list, k: int) -> Tuple[list, list, list, bool]:
+    # Cross-encoder order of the candidates, or their retrieval order (False) if over budget
+    with span("rerank", model=reranker.model_name, candidates=len(docs)) as s:
+        result = reranker.rerank(query, docs, k)
+        s.set(reranked=result.reranked)
+    pick = lambda xs: [xs[i] for i in result.order]
+    return pick(ids), pick(docs), pick(dists), result.reranked
+
+def _semantic_vec(qv: Union[List[float], Dict[str, List[float]]]) -> List[float]:
+    # The semantic cache compares questions with one encoder (the first, when federated over several)
+    return qv[min(qv)] if isinstance(qv, dict) else qv
+
+def _retrieve_fresh(query: str, qv, k: int) -> Tuple[list, list, list, bool]:
+    ids, docs, dists, _ = search(qv, candidates(k), query)
+    complete = True
+    if reranker:
+        ids, docs, dists, complete = rerank(query, ids, docs, dists, k)
+    return ids, docs, dists, complete
 
 def retrieve(query: str, k: int = TOP_K) -> Tuple[list, list, list]:
-    qv = embed([query])
-    res = coll.query(
-        query_embeddings=qv,
-        n_results=k,
-        include=["documents", "metadatas", "distances"]
-    )
-    ids   = res.get("ids", [[]])[0]
-    docs  = res.get("documents", [[]])[0]
-    dists = res.get("distances", [[]])[0]
-    return ids, docs, dists
+    _backend.get()
+    with span("retrieve", k=k) as s:
+        cached = qcache.get_results(query, k) if qcache else None
+        s.set(cache="hit" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+        qv = embed_query(query)
+        if scache:
+            with span("semantic_cache") as sc:
+                hit = scache.lookup(query, _semantic_vec(qv), k)
+                sc.set(cache="hit" if hit is not None else "miss")
+                if hit is not None:
+                    sc.set(similarity=round(hit.similarity, 4))
+                    # Sampled hits are re-retrieved off the request path to count false hits
+                    scache.check(hit, k, lambda: _retrieve_fresh(query, qv, k)[0])
+                    e = hit.entry
+                    return e.ids[:k], e.docs[:k], e.dists[:k]
+        ids, docs, dists, complete = _retrieve_fresh(query, qv, k)
+        # A budget fallback isn't cached, so the question gets reranked next time
+        if complete:
+            if qcache:
+                qcache.put_results(query, k, ids, docs, dists)
+            if scache:
+                scache.put(query, _semantic_vec(qv), k, ids, docs, dists)
+        return ids, docs, dists
+
+def record_count() -> int:
+    _backend.get()
+    if fed is not None:
+        return fed.count()
+    return len(store) if store is not None else coll.count()
 
 def pretty_sim(dist: float) -> float:
     try:
@@ -97,17 +407,6 @@ def pretty_sim(dist: float) -> float:
     except Exception:
         return float("nan")
 
-def retrieve_exact(substring: str, k: int = TOP_K) -> Tuple[list, list, list]:
-    res = coll.get(
-        where_document={"$contains": substring},
-        include=["documents", "metadatas"],
-        limit=k,
-    )
-    ids   = res.get("ids", [])
-    docs  = res.get("documents", [])
-    dists = [0.0] * len(docs)
-    return ids, docs, dists
-
 # Prompt construction and LLM interaction
 SYSTEM_PROMPT = (
     "You are an EPLC assistant. Answer only using the information in the CONTEXT. "
@@ -115,34 +414,171 @@ SYSTEM_PROMPT = (
     "If the context provides no relevant information, reply exactly: Not specified in the provided context."
 )
 
+def parent_section(chunk_id: str) -> Optional[Tuple[str, str]]:
+    # (parent id, section text) when the chunk was split out of a larger section
+    _backend.get()
+    return fed.parent(chunk_id) if fed is not None else shard.parent(chunk_id)
+
+def pack(ids: list, docs: list, dists: list) -> Tuple[list, list, list]:
+    # Retrieved chunks (best first) cut down to what fits CHAT_MODEL's context budget, in prompt
+    # order; a chunk is widened to its whole section while the budget has room
+    with span("pack", chunks=len(docs)) as s:
+        packed = pack_context(docs, ids, CHAT_MODEL, parents=[parent_section(i) for i in ids])
+        s.set(kept=len(packed.indices), tokens=packed.tokens)
+    return ([ids[i] for i in packed.indices], packed.texts, [dists[i] for i in packed.indices])
+
 def make_prompt(question: str, docs: List[str]) -> str:
-    context = "\n\n---\n\n".join(docs)
-    return f"CONTEXT:\n{context}\n\nQUESTION:\n{question}\n"
+    # docs as pack() returned them (deduped, budgeted, stable policy / framework chunks first);
+    # the question goes last, so the prefix after the system prompt repeats for prompt caching
+    with span("prompt"):
+        context = "\n\n---\n\n".join(docs)
+        return f"CONTEXT:\n{context}\n\nQUESTION:\n{question}\n"
 
-def ask_openai(prompt: str) -> str:
-    try:
-        resp = oa.responses.create(
-            model=CHAT_MODEL,
-            input=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0
-        )
-        return (resp.output_text or "").strip()
-    except Exception as e:
-        return f"[openai error] {e}"
+def _llm_input(prompt: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+def _usage(resp) -> Dict[str, int]:
+    usage = getattr(resp, "usage", None)
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+    }
+
+def _cache_answer(key: Optional[str], answer: str, question: Optional[str], resp,
+                  context_ids: Optional[List[str]] = None):
+    # Also records the call's token usage on the open "generate" span
+    tracing.current().set(**_usage(resp))
+    if key and answer:
+        acache.put(key, answer, CHAT_MODEL, question or "", _usage(resp))
+    if scache and question and answer:
+        scache.put_answer(question, context_ids or [], answer)
+
+def cached_answer(prompt: str, question: Optional[str] = None,
+                  context_ids: Optional[List[str]] = None) -> Tuple[Optional[str], Optional[str]]:
+    # -> (cache key, cached answer); temperature=0, so identical (question, context, model) calls can reuse
+    # the answer. The context text is part of the key: chunk ids survive a re-ingest that changes their text.
+    context = prompt.rpartition("\n\nQUESTION:\n")[0]
+    key = answer_key(SYSTEM_PROMPT, CHAT_MODEL, question or prompt, context_ids or [], context) if acache else None
+    hit = acache.get(key) if key else None
+    answer = hit["answer"] if hit is not None else None
+    # A paraphrase of an answered question, packed into the same context
+    if answer is None and scache and question:
+        answer = scache.answer_for(question, context_ids or [])
+    tracing.current().set(cache="hit" if answer is not None else "miss")
+    return key, answer
+
+async def _off_loop(fn, *args):
+    # SQLite reads/writes and the semantic cache scan run on the default executor, not the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, bind(fn), *args)
+
+def ask_openai(prompt: str, question: Optional[str] = None, context_ids: Optional[List[str]] = None) -> str:
+    with span("generate", model=CHAT_MODEL, stream=False):
+        key, answer = cached_answer(prompt, question, context_ids)
+        if answer is not None:
+            return answer
+        try:
+            resp = _clients.get()[0].responses.create(model=CHAT_MODEL, input=_llm_input(prompt), temperature=0)
+            answer = (resp.output_text or "").strip()
+        except Exception as e:
+            tracing.current().set(error=type(e).__name__)
+            return f"[openai error] {e}"
+        _cache_answer(key, answer, question, resp, context_ids)
+        return answer
+
+async def ask_openai_async(prompt: str, question: Optional[str] = None,
+                           context_ids: Optional[List[str]] = None, scheduler=None) -> str:
+    # Non-blocking variant for server.py; `scheduler` is an llm_scheduler.Scheduler (rate limits + retries)
+    with span("generate", model=CHAT_MODEL, stream=False):
+        key, answer = await _off_loop(cached_answer, prompt, question, context_ids)
+        if answer is not None:
+            return answer
+        aoa = _clients.get()[1]
+        call = lambda: aoa.responses.create(model=CHAT_MODEL, input=_llm_input(prompt), temperature=0)
+        try:
+            if scheduler is not None:
+                resp = await scheduler.run(CHAT_MODEL, call, estimate_tokens(SYSTEM_PROMPT + prompt))
+            else:
+                resp = await with_retries(call)
+            answer = (resp.output_text or "").strip()
+        except Exception as e:
+            tracing.current().set(error=type(e).__name__)
+            return f"[openai error] {e}"
+        await _off_loop(_cache_answer, key, answer, question, resp, context_ids)
+        return answer
+
+# Streaming: yields text deltas as they arrive; a cached answer comes back as a single delta
+def stream_openai(prompt: str, question: Optional[str] = None,
+                  context_ids: Optional[List[str]] = None) -> Iterator[str]:
+    with span("generate", model=CHAT_MODEL, stream=True):
+        key, answer = cached_answer(prompt, question, context_ids)
+        if answer is not None:
+            yield answer
+            return
+        parts, resp = [], None
+        try:
+            stream = _clients.get()[0].responses.create(model=CHAT_MODEL, input=_llm_input(prompt), temperature=0,
+                                                        stream=True)
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    resp = event.response
+        except Exception as e:
+            tracing.current().set(error=type(e).__name__)
+            yield f"[openai error] {e}"
+            return
+        _cache_answer(key, "".join(parts).strip(), question, resp, context_ids)
+
+async def stream_openai_async(prompt: str, question: Optional[str] = None,
+                              context_ids: Optional[List[str]] = None, scheduler=None) -> AsyncIterator[str]:
+    # The scheduler (rate limits + retries) covers opening the stream; tokens are relayed as they arrive
+    with span("generate", model=CHAT_MODEL, stream=True):
+        key, answer = await _off_loop(cached_answer, prompt, question, context_ids)
+        if answer is not None:
+            yield answer
+            return
+        aoa = _clients.get()[1]
+        call = lambda: aoa.responses.create(model=CHAT_MODEL, input=_llm_input(prompt), temperature=0, stream=True)
+        parts, resp = [], None
+        try:
+            if scheduler is not None:
+                stream = await scheduler.run(CHAT_MODEL, call, estimate_tokens(SYSTEM_PROMPT + prompt))
+            else:
+                stream = await with_retries(call)
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    resp = event.response
+        except Exception as e:
+            tracing.current().set(error=type(e).__name__)
+            yield f"[openai error] {e}"
+            return
+        await _off_loop(_cache_answer, key, "".join(parts).strip(), question, resp, context_ids)
 
 # Interactive main loop
-def main():
-    try:
-        cnt = coll.count()
-        print(f"[startup] Loaded collection '{COLL_NAME}' with {cnt} records.")
-    except Exception as e:
-        print("[startup] Collection error:", e)
-        sys.exit(1)
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Interactive EPLC Q&A.")
+    ap.add_argument("--eager", action="store_true", help="load everything before showing the prompt")
+    ap.add_argument("--export-encoder", metavar="DIR",
+                    help="save an ONNX copy of the encoder to DIR and exit (then set EMBED_MODEL_PATH/EMBED_BACKEND)")
+    args = ap.parse_args(argv)
+    if args.export_encoder:
+        print("[export] encoder saved to", export_encoder(args.export_encoder))
+        return
 
-    print(f"[ready] Using GPT model: {CHAT_MODEL} | top_k={TOP_K}")
+    # The prompt is shown right away; the first question waits for whatever is still loading
+    warm_up(background=not args.eager)
+    if TRACE_METRICS_PORT:
+        serve_metrics(TRACE_METRICS_PORT)
+    print(f"[ready] Using GPT model: {CHAT_MODEL} | top_k={TOP_K} | answer cache={'on' if acache else 'off'} "
+          f"| rerank={RERANK_MODEL if reranker else 'off'}")
     print("Ask any EPLC question. Type 'exit' to quit.")
 
     while True:
@@ -153,20 +589,45 @@ def main():
             break
 
         if not q or q.lower() in {"exit", "quit"}:
+            if acache:
+                print("[cache] answers:", acache.stats())
+            if scache:
+                print("[cache] paraphrases:", scache.stats())
+            if reranker:
+                print("[rerank]", reranker.stats())
+            if EMBED_BATCH:
+                print("[embed] batches:", embed_batcher.metrics.summary())
+            print("[trace] stages:", tracing.metrics.summary())
             print("bye.")
             break
 
-        ids, docs, dists = retrieve_exact(q, TOP_K)
-        if not docs:
-            ids, docs, dists = retrieve(q, TOP_K)
-        if not docs:
-            print("A> Not specified in the provided context.")
-            continue
+        # One trace per question: spans for encode, search, rerank, pack, prompt and generate
+        with trace("ask", chat_model=CHAT_MODEL, question_chars=len(q)):
+            # Only a backend that can't open ends the session; a failed search skips the question
+            try:
+                _backend.get()
+            except Exception as e:
+                print("[startup] Collection error:", e)
+                sys.exit(1)
+            try:
+                ids, docs, dists = retrieve(q, TOP_K)
+            except Exception as e:
+                print(f"[error] retrieval failed: {type(e).__name__}: {e}")
+                continue
+            if not docs:
+                print("A> Not specified in the provided context.")
+                continue
 
-        prompt = make_prompt(q, docs)
-        answer = ask_openai(prompt)
-        print("\nA>", answer if answer else "Not specified in the provided context.")
-        print("   citations:", ids)
+            # Citations as soon as retrieval is done, then the answer token by token
+            ids, docs, dists = pack(ids, docs, dists)
+            print("   citations:", ids)
+            prompt = make_prompt(q, docs)
+            print("\nA> ", end="", flush=True)
+            answered = False
+            for delta in stream_openai(prompt, q, ids):
+                answered = answered or bool(delta.strip())
+                print(delta, end="", flush=True)
+            print("" if answered else "Not specified in the provided context.")
 
         # Debug
         print(f"\n[DEBUG] ids={ids}")
@@ -0,0 +1,305 @@
+# server.py
+# Long-lived async HTTP service over the qna.py pipeline. Models, the collection and the
+# caches are loaded once per process, in the background from startup (/healthz answers 503
+# until they are ready); each request then runs retrieval (SBERT, Chroma and BM25), context
+# packing and cache lookups (blocking) on a thread pool and the LLM call on the event loop.
+#
+#   uvicorn server:app --app-dir "Coding/Q&A" --host 0.0.0.0 --port 8000
+#   python "Coding/Q&A/server.py" --port 8000
+#
+#   POST /ask     {"question": "...", "k": 6}  -> {"answer", "citations", "contexts", "timings_ms"}
+#   POST /ask/stream                           -> server-sent events: citations, token..., done
+#   POST /search  {"question": "...", "k": 6}  -> {"hits": [{"id", "distance", "metadata", "preview"}]}
+#   GET  /healthz                              -> collection / model / cache status (503 while loading)
+#   GET  /metrics                              -> Prometheus text format (request, per-span and embedding batch metrics)
+import os, sys, json, time, asyncio, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import qna
+from llm_scheduler import Scheduler
+from tracing import bind, trace
+import embed_batcher
+import tracing
+
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "4"))
+MAX_BODY_BYTES  = int(os.getenv("MAX_BODY_BYTES", str(64 * 1024)))
+MAX_TOP_K       = int(os.getenv("MAX_TOP_K", "50"))
+ROUTES          = ("/ask", "/ask/stream", "/search", "/healthz", "/metrics")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Metrics:
+    # Request counters and per-stage latency histograms, rendered in Prometheus text format
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.in_flight = 0
+        self.stages: Dict[str, List[float]] = {}  # stage -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            h = self.stages.setdefault(stage, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    h[i] += 1
+            h[len(self.buckets)] += 1
+            h[-1] += seconds
+
+    def count_request(self, path: str, status: int):
+        with self.lock:
+            self.requests[(path, status)] = self.requests.get((path, status), 0) + 1
+
+    def render(self) -> str:
+        with self.lock:
+            lines = ["# TYPE qna_uptime_seconds gauge", f"qna_uptime_seconds {time.time() - self.started:.3f}",
+                     "# TYPE qna_in_flight_requests gauge", f"qna_in_flight_requests {self.in_flight}",
+                     "# TYPE qna_requests_total counter"]
+            for (path, status), n in sorted(self.requests.items()):
+                lines.append(f'qna_requests_total{{path="{path}",status="{status}"}} {n}')
+            lines.append("# TYPE qna_stage_seconds histogram")
+            for stage, h in sorted(self.stages.items()):
+                for le, n in zip(self.buckets, h):
+                    lines.append(f'qna_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {n}')
+                lines.append(f'qna_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h[len(self.buckets)]}')
+                lines.append(f'qna_stage_seconds_sum{{stage="{stage}"}} {h[-1]:.6f}')
+                lines.append(f'qna_stage_seconds_count{{stage="{stage}"}} {h[len(self.buckets)]}')
+        if qna.acache:
+            for name, value in qna.acache.stats().items():
+                lines.append(f'qna_answer_cache{{stat="{name}"}} {value}')
+        if qna.qcache:
+            for name, value in qna.qcache.stats().items():
+                lines.append(f'qna_query_cache{{stat="{name}"}} {value}')
+        if qna.scache:
+            for name, value in qna.scache.stats().items():
+                lines.append(f'qna_semantic_cache{{stat="{name}"}} {value}')
+        if qna.reranker:
+            for name, value in qna.reranker.stats().items():
+                lines.append(f'qna_reranker{{stat="{name}"}} {value}')
+        # Per-span latency, cache and token counters from the tracing layer, then embedding batches
+        return "\n".join(lines) + "\n" + tracing.metrics.render() + embed_batcher.metrics.render()
+
+
+class QnAService:
+    def __init__(self, threads: int = ENCODER_THREADS):
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="encoder")
+        self.scheduler: Optional[Scheduler] = None  # asyncio primitives bind to the running loop; created lazily
+        self.metrics = Metrics()
+
+    async def _timed(self, stage: str, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            # bind: spans opened on the pool thread nest under this request's trace
+            return await asyncio.get_running_loop().run_in_executor(self.pool, bind(fn), *args)
+        finally:
+            self.metrics.observe(stage, time.perf_counter() - t0)
+
+    @staticmethod
+    def _prompt(question: str, ids: list, docs: list, dists: list):
+        # Token counting, dedupe and parent-section lookups, then the prompt text
+        ids, docs, dists = qna.pack(ids, docs, dists)
+        return ids, docs, dists, qna.make_prompt(question, docs) if docs else None
+
+    async def search(self, question: str, k: int) -> Dict[str, Any]:
+        with trace("request", route="/search", k=k):
+            ids, docs, dists, metas = await self._timed(
+                "search", lambda: qna.search(qna.embed_query(question), k, question))
+            return {"hits": [{"id": i, "distance": d, "metadata": m or {}, "preview": (doc or "")[:300]}
+                             for i, doc, d, m in zip(ids, docs, dists, metas)]}
+
+    async def ask(self, question: str, k: int) -> Dict[str, Any]:
+        with trace("request", route="/ask", k=k):
+            if self.scheduler is None:
+                self.scheduler = Scheduler()
+            t0 = time.perf_counter()
+            ids, docs, dists = await self._timed("retrieve", qna.retrieve, question, k)
+            timings = {"retrieve": time.perf_counter() - t0}
+            ids, docs, dists, prompt = await self._timed("pack", self._prompt, question, ids, docs, dists)
+            if not docs:
+                answer = "Not specified in the provided context."
+            else:
+                t1 = time.perf_counter()
+                answer = await qna.ask_openai_async(prompt, question, ids, self.scheduler)
+                timings["generate"] = time.perf_counter() - t1
+                self.metrics.observe("generate", timings["generate"])
+            timings["total"] = time.perf_counter() - t0
+            self.metrics.observe("total", timings["total"])
+            return {
+                "answer": answer or "Not specified in the provided context.",
+                "citations": ids,
+                "contexts": [{"id": i, "distance": d, "preview": (doc or "")[:300]} for i, doc, d in zip(ids, docs, dists)],
+                "timings_ms": {s: round(v * 1000, 3) for s, v in timings.items()},
+            }
+
+    async def ask_stream(self, question: str, k: int):
+        # -> async iterator of (event, data): "citations" once retrieval is done, a "token" per delta, then "done"
+        with trace("request", route="/ask/stream", k=k):
+            if self.scheduler is None:
+                self.scheduler = Scheduler()
+            t0 = time.perf_counter()
+            ids, docs, dists = await self._timed("retrieve", qna.retrieve, question, k)
+            timings = {"retrieve": time.perf_counter() - t0}
+            ids, docs, dists, prompt = await self._timed("pack", self._prompt, question, ids, docs, dists)
+            yield "citations", {"citations": ids, "contexts": [{"id": i, "distance": d, "preview": (doc or "")[:300]}
+                                                               for i, doc, d in zip(ids, docs, dists)]}
+            stamps = []
+            if docs:
+                async for delta in qna.stream_openai_async(prompt, question, ids, self.scheduler):
+                    stamps.append(time.perf_counter())
+                    yield "token", {"delta": delta}
+            else:
+                yield "token", {"delta": "Not specified in the provided context."}
+            timings["total"] = time.perf_counter() - t0
+            if stamps:
+                timings["ttft"] = stamps[0] - t0
+                self.metrics.observe("ttft", timings["ttft"])
+                if len(stamps) > 1:
+                    timings["itl"] = (stamps[-1] - stamps[0]) / (len(stamps) - 1)
+                    self.metrics.observe("itl", timings["itl"])
+            self.metrics.observe("total", timings["total"])
+            yield "done", {"timings_ms": {s: round(v * 1000, 3) for s, v in timings.items()}}
+
+    async def health(self) -> Dict[str, Any]:
+        if not qna.is_ready():
+            raise HTTPError(503, "starting: model and collection are still loading")
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(self.pool, qna.record_count)
+        version = await loop.run_in_executor(self.pool, qna.collection_version)
+        return {
+            "status": "ok",
+            "collection": qna.fed.names if qna.fed is not None else (qna.EMBED_STORE or qna.COLL_NAME),
+            "records": count,
+            "version": version,
+            "embed_models": qna.embed_models,
+            "chat_model": qna.CHAT_MODEL,
+            "answer_cache": bool(qna.acache),
+            "query_cache": bool(qna.qcache),
+            "semantic_cache": bool(qna.scache),
+        }
+
+
+# ASGI plumbing
+async def _read_json(receive) -> Dict[str, Any]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, "request body too large")
+        if not message.get("more_body"):
+            break
+    try:
+        payload = json.loads(body or b"{}")
+    except json.JSONDecodeError as e:
+        raise HTTPError(400, f"invalid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "expected a JSON object")
+    return payload
+
+def _question_and_k(payload: Dict[str, Any]) -> Tuple[str, int]:
+    question = str(payload.get("question") or "").strip()
+    if not question:
+        raise HTTPError(400, "missing 'question'")
+    try:
+        k = int(payload.get("k") or qna.TOP_K)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "'k' must be an integer")
+    return question, max(1, min(k, MAX_TOP_K))
+
+async def _send(send, status: int, body: bytes, content_type: str = "application/json"):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_events(send, events):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+    try:
+        async for event, data in events:
+            chunk = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except Exception as e:
+        # Headers are already out; report the failure in-band
+        print(f"[server] stream failed: {type(e).__name__}: {e}")
+        chunk = f"event: error\ndata: {json.dumps({'error': f'{type(e).__name__}: {e}'})}\n\n".encode("utf-8")
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+def _json(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def create_app(service: Optional[QnAService] = None):
+    service = service or QnAService()
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    qna.warm_up(background=True)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    service.pool.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        status = 200
+        service.metrics.in_flight += 1
+        try:
+            if method == "GET" and path == "/healthz":
+                await _send(send, 200, _json(await service.health()))
+            elif method == "GET" and path == "/metrics":
+                await _send(send, 200, service.metrics.render().encode(), "text/plain; version=0.0.4")
+            elif method == "POST" and path == "/ask/stream":
+                question, k = _question_and_k(await _read_json(receive))
+                await _send_events(send, service.ask_stream(question, k))
+            elif method == "POST" and path in ("/ask", "/search"):
+                question, k = _question_and_k(await _read_json(receive))
+                result = await (service.ask(question, k) if path == "/ask" else service.search(question, k))
+                await _send(send, 200, _json(result))
+            else:
+                raise HTTPError(404, f"no route for {method} {path}")
+        except HTTPError as e:
+            status = e.status
+            await _send(send, status, _json({"error": e.message}))
+        except Exception as e:
+            status = 500
+            print(f"[server] {method} {path} failed: {type(e).__name__}: {e}")
+            await _send(send, status, _json({"error": f"{type(e).__name__}: {e}"}))
+        finally:
+            service.metrics.in_flight -= 1
+            service.metrics.count_request(path if path in ROUTES else "other", status)
+
+    app.service = service
+    return app
+
+app = create_app()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Async HTTP service for EPLC Q&A.")
+    ap.add_argument("--host", default=os.getenv("QNA_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("QNA_PORT", "8000")))
+    args = ap.parse_args(argv)
+    import uvicorn
+    # One worker: the encoder and collection live in this process; concurrency comes from the event loop
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# answer_cache.py
+# Local cache of LLM answers (SQLite) for deterministic (temperature=0) calls.
+# Key = hash(system prompt, model, normalized question, ordered context ids, context text), so
+# a re-ingested section (same chunk id, new text) misses instead of serving the old answer;
+# entries expire after a TTL and the least recently used are evicted past a size cap.
+import os, json, time, sqlite3, hashlib, threading
+from typing import Any, Dict, Optional, Sequence
+
+from query_cache import normalize_query
+
+
+def answer_key(system_prompt: str, model: str, question: str, context_ids: Sequence[str],
+               context: str = "") -> str:
+    payload = json.dumps([system_prompt, model, normalize_query(question), list(context_ids),
+                          hashlib.sha256(context.encode("utf-8")).hexdigest()], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path: str, ttl_s: float = 86400.0, max_entries: int = 5000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, model TEXT, question TEXT, answer TEXT, usage TEXT,"
+            " created REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_lru ON answers(last_used)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT answer, usage, created FROM answers WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl_s and now - row[2] > self.ttl_s:
+                self._db.execute("DELETE FROM answers WHERE key=?", (key,))
+                self.expired += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE answers SET last_used=?, hits=hits+1 WHERE key=?", (now, key))
+        return {"answer": row[0], "usage": json.loads(row[1] or "{}")}
+
+    def put(self, key: str, answer: str, model: str = "", question: str = "",
+            usage: Optional[Dict[str, int]] = None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, model, question, answer, usage, created, last_used, hits)"
+                " VALUES (?,?,?,?,?,?,?,0)",
+                (key, model, question, answer, json.dumps(usage or {}), now, now),
+            )
+            (n,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+            if n > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+
+    def purge_expired(self) -> int:
+        if not self.ttl_s:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl_s,))
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired, "entries": entries,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def close(self):
+        self._db.close()
+
+
+def open_default(enabled_by_default: bool = True) -> Optional[AnswerCache]:
+    if os.getenv("ANSWER_CACHE", "1" if enabled_by_default else "0") == "0":
+        return None
+    cache = AnswerCache(
+        os.getenv("ANSWER_CACHE_PATH", "./answer_cache.sqlite3"),
+        ttl_s=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "5000")),
+    )
+    cache.purge_expired()
+    return cache
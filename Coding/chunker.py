@@ -0,0 +1,260 @@
+# chunker.py
+# Shared chunker for the cleaned template JSON (sections / subsections / children, with
+# content lists, `fields` maps and free-form heading trees). Each section's body is split
+# into units (a content item, a field, a paragraph), cleaned of Word field codes and
+# template boilerplate, and packed into small child chunks for embedding. Children of a
+# multi-chunk section point at their parent section, whose full text is kept aside so
+# retrieval can match on the small chunk and expand to the section when the budget allows.
+#
+#   for chunk in iter_chunks(json.load(f), "Lessons_Learned_Log.json"): ...
+#   chunks = chunk_file("Data/.../Training Plan.json")
+#   sections = SectionIndex.from_chunks(chunks)      # saved by ingest.py next to the manifest
+import os, re, json
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+CHILD_KEYS = ("sections", "subsections", "children")
+BODY_KEYS  = ("content", "description", "text", "questions", "fields", "responsibility")
+TITLE_KEYS = ("title", "section_title", "phase_title", "document_title")
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "700"))  # ~175 tokens per child chunk
+PARENTS_NAME = "parent_sections.json"
+
+# Word field codes left in by the .doc conversion ("DOCPROPERTY Title \* MERGEFORMAT")
+FIELD_CODE = re.compile(r"(?:\bDOCPROPERTY\s+\w+\s*|\bSUBJECT\s*)?\\\*\s*MERGEFORMAT\s*")
+# Table of contents entries ('HYPERLINK \l "_Toc211245993" 2.3 Environment PAGEREF _Toc211245993 \h 5')
+TOC_LINE = re.compile(r"^(?:TOC\s+\\o|HYPERLINK\s+\\l)|\bPAGEREF\s+_Toc|^TABLE OF CONTENTS$", re.I)
+# Form labels with nothing filled in ("Signature:", "Print Name:")
+EMPTY_LABEL = re.compile(r"^[\w #/&().-]{1,30}:$")
+# The CDC UP "Note to the Author" page: from its heading to the closing "]" of the instructions
+AUTHOR_NOTE = re.compile(r"^notes? to the author$", re.I)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class Section(NamedTuple):
+    number: str
+    title: str
+    path: List[str]
+    units: List[str]
+
+
+def _read_json(fp: str) -> Any:
+    for enc in ("utf-8", "utf-16", "latin-1"):
+        try:
+            with open(fp, "r", encoding=enc) as f:
+                return json.load(f)
+        except (UnicodeError, json.JSONDecodeError):
+            continue
+    raise ValueError(f"{fp}: not a readable JSON file")
+
+def to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (int, float, bool)):
+        return str(value)
+    if isinstance(value, list):
+        return "\n".join(t for t in (to_text(v) for v in value) if t)
+    if isinstance(value, dict):
+        lines = []
+        for k, v in value.items():
+            t = to_text(v)
+            if t:
+                lines.append(f"{k}: {t}" if "\n" not in t else f"{k}:\n{t}")
+        return "\n".join(lines)
+    return str(value)
+
+
+# Units: the natural split points of a section body
+def _units(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [u for v in value for u in (_units(v) if isinstance(v, list) else [to_text(v)])]
+    if isinstance(value, dict):
+        # A fields map ({"A": {"Field": ..., "Instruction": ...}}) is one unit per field
+        if value and all(isinstance(v, dict) for v in value.values()):
+            return [to_text(v) for v in value.values()]
+        return [to_text(value)]
+    return [p for p in re.split(r"\n\s*\n", to_text(value))]
+
+def clean_units(units: List[str]) -> List[str]:
+    out, seen, in_note = [], set(), False
+    for unit in units:
+        text = FIELD_CODE.sub(" ", unit or "")
+        text = " ".join(text.split()) if "\n" not in text else "\n".join(" ".join(l.split()) for l in text.splitlines())
+        text = text.strip()
+        if AUTHOR_NOTE.match(text):
+            in_note = True
+            continue
+        if in_note:
+            in_note = not text.endswith("]")
+            continue
+        if not text or EMPTY_LABEL.match(text) or TOC_LINE.search(text) or text in seen:
+            continue
+        seen.add(text)
+        out.append(text)
+    return out
+
+def _body_units(node: Dict[str, Any]) -> List[str]:
+    return [u for k in BODY_KEYS if k in node for u in _units(node[k])]
+
+
+def iter_sections(node: Any, path: Optional[List[str]] = None) -> Iterator[Section]:
+    # Depth-first, document order; a section is yielded before its subsections
+    path = path or []
+    if isinstance(node, list):
+        for item in node:
+            yield from iter_sections(item, path)
+        return
+    if not isinstance(node, dict):
+        return
+
+    known = any(k in node for k in CHILD_KEYS + BODY_KEYS + TITLE_KEYS)
+    if not known:
+        # Free-form hierarchy (e.g. development_phase_full_hierarchy.json): keys are headings
+        for key, value in node.items():
+            if isinstance(value, (dict, list)) and any(isinstance(v, (dict, list)) for v in
+                                                       (value.values() if isinstance(value, dict) else value)):
+                yield from iter_sections(value, path + [key])
+            else:
+                yield Section("", key, path + [key], _units(value))
+        return
+
+    title  = next((str(node[k]) for k in TITLE_KEYS if node.get(k)), "")
+    title  = " ".join(FIELD_CODE.sub(" ", title).split())
+    number = str(node.get("number") or node.get("phase_number") or "")
+    here   = path + [f"{number} {title}".strip()] if (title or number) else path
+    units  = _body_units(node)
+    if units:
+        yield Section(number, title, here, units)
+    if isinstance(node.get("overview"), dict):
+        yield Section(number, "Overview", here + ["Overview"], _units(node["overview"]))
+    for key in CHILD_KEYS:
+        if key in node:
+            yield from iter_sections(node[key], here)
+
+
+# Children
+def _split_long(text: str, max_chars: int) -> List[str]:
+    parts, cur = [], ""
+    for sentence in SENTENCE_END.split(text):
+        while len(sentence) > max_chars:  # one run-on "sentence" (tables flattened to text)
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            if cur:
+                parts.append(cur)
+                cur = ""
+            parts.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if cur and len(cur) + 1 + len(sentence) > max_chars:
+            parts.append(cur)
+            cur = sentence
+        else:
+            cur = f"{cur} {sentence}".strip()
+    if cur:
+        parts.append(cur)
+    return parts
+
+def pack_units(units: List[str], max_chars: int = CHUNK_CHARS) -> List[str]:
+    # Consecutive units joined up to max_chars; a unit longer than that is split by sentence
+    children, cur = [], ""
+    for unit in units:
+        pieces = _split_long(unit, max_chars) if len(unit) > max_chars else [unit]
+        for piece in pieces:
+            if cur and len(cur) + 1 + len(piece) > max_chars:
+                children.append(cur)
+                cur = piece
+            else:
+                cur = f"{cur}\n{piece}" if cur else piece
+    if cur:
+        children.append(cur)
+    return children
+
+def _chunk(text: str, source: str, document: str, section: Section) -> Dict[str, Any]:
+    return {
+        "text": text,
+        "metadata": {
+            "source": source,
+            "document": document,
+            "section_number": section.number,
+            "title": section.title,
+            "section_path": " > ".join(p for p in section.path if p),
+        },
+    }
+
+def iter_chunks(doc: Any, source: str, max_chars: int = CHUNK_CHARS) -> Iterator[Dict[str, Any]]:
+    # Child chunks with stable ids ("<source>:<section path>", "#n" for the n-th piece or a
+    # repeated path). Children of a split section carry metadata["parent_id"] (the first
+    # child's id) and chunk["parent"], the whole cleaned section text.
+    if isinstance(doc, list) and doc and isinstance(doc[0], dict) and "embedding" in doc[0]:
+        return  # an embedding dump, not a template
+    document = ""
+    if isinstance(doc, dict):
+        document = str(doc.get("document_title") or doc.get("phase_title") or doc.get("title") or "")
+    document = " ".join(FIELD_CODE.sub(" ", document).split()) or os.path.splitext(source)[0]
+    seen: Dict[str, int] = {}
+    for section in iter_sections(doc):
+        units = clean_units(section.units)
+        if not units:
+            continue
+        children = pack_units(units, max_chars)
+        base = f"{source}:{' > '.join(p for p in section.path if p) or section.title}"
+        parent_id = None
+        for n, text in enumerate(children):
+            seen[base] = seen.get(base, 0) + 1
+            chunk = _chunk(text, source, document, section)
+            chunk["id"] = base if seen[base] == 1 else f"{base}#{seen[base]}"
+            if len(children) > 1:
+                parent_id = parent_id or chunk["id"]
+                chunk["metadata"]["parent_id"] = parent_id
+                chunk["parent"] = "\n".join(units)
+            yield chunk
+
+def chunk_document(doc: Any, source: str, max_chars: int = CHUNK_CHARS) -> List[Dict[str, Any]]:
+    return list(iter_chunks(doc, source, max_chars))
+
+def chunk_file(fp: str, source: Optional[str] = None, max_chars: int = CHUNK_CHARS) -> List[Dict[str, Any]]:
+    return chunk_document(_read_json(fp), source or os.path.basename(fp), max_chars)
+
+
+class SectionIndex:
+    # Parent sections of split chunks: chunk id -> parent id -> full section text
+    def __init__(self, parents: Dict[str, str], children: Dict[str, str], version: Optional[str] = None):
+        self.parents = parents
+        self.children = children
+        self.version = version
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]], version: Optional[str] = None) -> "SectionIndex":
+        parents, children = {}, {}
+        for c in chunks:
+            pid = c["metadata"].get("parent_id")
+            if pid:
+                parents.setdefault(pid, c["parent"])
+                children[c["id"]] = pid
+        return cls(parents, children, version)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def parent(self, chunk_id: str) -> Optional[str]:
+        # -> parent id, or None for a chunk that is a whole section already
+        return self.children.get(chunk_id)
+
+    def text(self, parent_id: str) -> Optional[str]:
+        return self.parents.get(parent_id)
+
+    def save(self, path: str):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "parents": self.parents, "children": self.children},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "SectionIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            p = json.load(f)
+        return cls(p["parents"], p["children"], p.get("version"))
+
+
+def load_sections(db_path: str) -> Optional[SectionIndex]:
+    fp = os.path.join(db_path, PARENTS_NAME)
+    return SectionIndex.load(fp) if os.path.exists(fp) else None
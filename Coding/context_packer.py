@@ -0,0 +1,134 @@
+# context_packer.py
+# Packs retrieved chunks into a per-model token budget: counts tokens with the model's
+# tokenizer (tiktoken when installed), drops duplicate and near-duplicate chunks, trims the
+# last chunk at a sentence boundary, widens kept chunks to their parent section while room is
+# left, and orders the survivors canonically so the prompt prefix stays byte-identical
+# across questions for provider-side prompt caching.
+import os, re, json, hashlib
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from llm_scheduler import estimate_tokens
+
+# Context tokens per model; override with CONTEXT_BUDGETS='{"gpt-4o": 3000}'
+DEFAULT_BUDGET = int(os.getenv("CONTEXT_TOKENS", "1500"))
+CONTEXT_BUDGETS: Dict[str, int] = {"gpt-4o": 1500, "gpt-4o-mini": 1500, "gpt-5-nano": 1500}
+CONTEXT_BUDGETS.update(json.loads(os.getenv("CONTEXT_BUDGETS", "{}")))
+NEAR_DUP_JACCARD = 0.85
+MIN_TRIMMED_TOKENS = 48  # don't bother squeezing in a fragment smaller than this
+# Chunks that recur across questions (policy / framework text) go first, so they form the shared prefix
+STABLE_PREFIXES = ("hhs_eplc_policy/", "EPLC/", "HHS EPLC Website.py:")
+
+
+class Packed(NamedTuple):
+    indices: List[int]   # positions in the input, in prompt order
+    texts: List[str]     # possibly trimmed text per kept chunk
+    tokens: int
+
+
+def budget_for(model: str) -> int:
+    return CONTEXT_BUDGETS.get(model, DEFAULT_BUDGET)
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    enc = _encoding(model)
+    return len(enc.encode(text, disallowed_special=())) if enc is not None else estimate_tokens(text)
+
+def _shingles(text: str, n: int = 3) -> frozenset:
+    words = re.findall(r"\w+", text.lower())
+    return frozenset(tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1)))
+
+def dedupe(texts: Sequence[str], threshold: float = NEAR_DUP_JACCARD) -> List[int]:
+    # -> indices to keep; earlier (higher-ranked) chunks win
+    keep, seen_hashes, seen_shingles = [], set(), []
+    for i, text in enumerate(texts):
+        norm = " ".join((text or "").split()).lower()
+        if not norm:
+            continue
+        digest = hashlib.sha1(norm.encode("utf-8")).digest()
+        if digest in seen_hashes:
+            continue
+        sh = _shingles(norm)
+        if any(len(sh & other) / len(sh | other) >= threshold for other in seen_shingles):
+            continue
+        keep.append(i)
+        seen_hashes.add(digest)
+        seen_shingles.append(sh)
+    return keep
+
+def trim_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    # Longest prefix ending on a sentence or line boundary that fits in max_tokens
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    cuts = [m.end() for m in re.finditer(r"[.!?](?=\s)|\n", text)]
+    lo, hi, best = 0, len(cuts) - 1, ""
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = text[:cuts[mid]].rstrip()
+        if count_tokens(candidate, model) <= max_tokens:
+            best, lo = candidate, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+def pack_context(texts: Sequence[str], ids: Optional[Sequence[str]] = None, model: str = "gpt-4o-mini",
+                 budget: Optional[int] = None, separator: str = "\n\n---\n\n",
+                 is_stable: Optional[Callable[[str], bool]] = None,
+                 parents: Optional[Sequence[Optional[Tuple[str, str]]]] = None) -> Packed:
+    # texts are best-first; selection follows rank, the final order is canonical.
+    # parents[i] is (parent id, whole section text) for a chunk split out of a larger section.
+    ids = list(ids) if ids is not None else [str(i) for i in range(len(texts))]
+    budget = budget_for(model) if budget is None else budget
+    is_stable = is_stable or (lambda i: i.startswith(STABLE_PREFIXES))
+    sep_tokens = count_tokens(separator, model)
+
+    chosen: Dict[int, str] = {}
+    used = 0
+    for i in dedupe(texts):
+        sep = sep_tokens if chosen else 0
+        cost = count_tokens(texts[i], model) + sep
+        if used + cost <= budget:
+            chosen[i] = texts[i]
+            used += cost
+            continue
+        # Too big: trim it to the remaining room, or skip it and try the next (smaller) chunk
+        room = budget - used - sep
+        if room >= MIN_TRIMMED_TOKENS:
+            trimmed = trim_to_tokens(texts[i], room, model)
+            if trimmed:
+                chosen[i] = trimmed
+                used += count_tokens(trimmed, model) + sep
+
+    if parents:
+        used = _expand_parents(chosen, parents, used, budget, sep_tokens, model)
+
+    order = sorted(chosen, key=lambda i: (not is_stable(ids[i]), ids[i]))
+    return Packed(order, [chosen[i] for i in order], used)
+
+def _expand_parents(chosen: Dict[int, str], parents: Sequence[Optional[Tuple[str, str]]], used: int,
+                    budget: int, sep_tokens: int, model: str) -> int:
+    # Best-ranked chunk first: swap it for its whole section if that still fits; sibling
+    # chunks of the same section are folded in (their tokens count towards the swap)
+    for i in list(chosen):
+        if i not in chosen or not parents[i] or not parents[i][1]:
+            continue
+        pid, section = parents[i]
+        siblings = [j for j in chosen if j != i and parents[j] and parents[j][0] == pid]
+        freed = sum(count_tokens(chosen[j], model) + sep_tokens for j in siblings)
+        extra = count_tokens(section, model) - count_tokens(chosen[i], model) - freed
+        if used + extra <= budget:
+            chosen[i] = section
+            for j in siblings:
+                del chosen[j]
+            used += extra
+    return used
@@ -0,0 +1,462 @@
+# convert.py
+# Raw templates (.doc / .docx / .xls / .xlsx / .pdf) -> cleaned JSON in the sections /
+# subsections schema the chunker reads. Headings become (sub)sections; body paragraphs and
+# the bracketed author instructions become content; column-instruction rows of a workbook
+# become `fields`; other tables become "Header: value" lines. Files convert in parallel on
+# a process pool and results are cached by source-file hash, so a re-run only converts new
+# or changed files. Word / Excel lock and temp files are skipped, and a raw file that a
+# hand-cleaned JSON already covers (its source_filename, or the same name in the output
+# folder) is left alone unless --force.
+#
+#   python Coding/convert.py                                  # every raw template under Data/
+#   python Coding/convert.py "Data/Design Phase Templates" --ingest   # then re-ingest what changed
+#   python Coding/convert.py new_batch/ --out "Data/Design Phase Templates/Design Phase Cleaned"
+#   python Coding/convert.py --dry-run
+#
+# Readers are imported per format: python-docx (.docx), pandas with xlrd / openpyxl
+# (.xls / .xlsx), pdfplumber (.pdf); .doc goes through LibreOffice (soffice) or antiword.
+import os, re, sys, json, shutil, hashlib, argparse, tempfile, subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from chunker import _read_json, clean_units
+from embedding_store import DATA_DIR, STORE_DIR, is_lock_file
+
+RAW_EXTS          = (".doc", ".docx", ".xls", ".xlsx", ".pdf")
+CONVERTER_VERSION = "2"  # bump when the output changes, so cached conversions are redone
+CACHE_DIR         = os.getenv("CONVERT_CACHE", os.path.join(DATA_DIR, ".convert_cache"))
+WORKERS           = int(os.getenv("CONVERT_WORKERS", str(os.cpu_count() or 1)))
+SOFFICE           = os.getenv("SOFFICE", "soffice")
+OTHER_OUT_DIR     = "Converted"  # next to raw files outside a "* Phase Templates" folder (not ingested)
+
+# "3.5.1 Design Activities", "1.6. Key Definitions"; short, capitalized, no trailing period or page number
+HEADING_NUM = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+([A-Z][^.]{0,90}?)$")
+APPENDIX    = re.compile(r"^(APPENDIX\s+[A-Z0-9]+)\s*[:.\-–]?\s*(.*)$", re.I)
+DOT_LEADER  = re.compile(r"(?:\.\s*){4,}\d+$|\t\d+$")  # table of contents entries
+PAGE_NUMBER = re.compile(r"^(?:page\s+)?\d+(?:\s+of\s+\d+)?$", re.I)
+BULLET      = re.compile(r"^[•▪◦–*-]\s+")
+DATE        = re.compile(r"\b\d{1,2}/\d{1,2}/\d{2,4}\b")  # version-history rows ("1.0 Workgroup 05/07/2008 ...")
+SKIP_STYLES = ("toc", "title", "subtitle", "header", "footer", "caption")
+NAME_NOISE  = {"eplc", "cdc", "up", "template", "doc", "docx", "xls", "xlsx", "pdf", "json", "py"}
+
+
+class Block(NamedTuple):
+    kind: str  # heading | text | table | fields
+    text: str = ""
+    level: int = 0
+    number: str = ""
+    rows: Tuple[Tuple[str, ...], ...] = ()
+    fields: Optional[Dict[str, Dict[str, str]]] = None
+
+
+class Job(NamedTuple):
+    source: str
+    output: str
+    sha256: str
+    state: str  # convert | cached | up-to-date | claimed
+
+
+def _heading(text: str, level: int) -> Block:
+    m = APPENDIX.match(text) or HEADING_NUM.match(text)
+    if m:
+        return Block("heading", m.group(2).strip() or m.group(1), level, m.group(1).title() if m.re is APPENDIX else m.group(1))
+    return Block("heading", text, level)
+
+
+# Readers
+def _docx_style_level(style: str) -> int:
+    if style.startswith("heading "):
+        tail = style[len("heading "):]
+        return int(tail) if tail.isdigit() else 1
+    return 1 if style == "appendix" else 0
+
+def _docx_blocks(fp: str) -> Iterator[Block]:
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    doc = docx.Document(fp)
+    # Templates typed entirely in "Normal" get their numbered headings from the text, as in _text_blocks
+    styled = any(_docx_style_level((p.style.name if p.style is not None else "").lower()) for p in doc.paragraphs)
+    # Body order, paragraphs and tables interleaved
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            p = Paragraph(child, doc)
+            text = p.text.strip()
+            style = (p.style.name if p.style is not None else "").lower()
+            if not text or DOT_LEADER.search(text):
+                continue
+            level = _docx_style_level(style)
+            # A table of contents entry is a hyperlink with no runs of its own
+            if not level and not styled and p.runs:
+                level = _text_heading_level(text)
+            if level:
+                yield _heading(text, level)
+            elif not style.startswith(SKIP_STYLES):
+                yield Block("text", text)
+        elif tag == "tbl":
+            rows = []
+            for r in Table(child, doc).rows:
+                cells: List[str] = []
+                for c in r.cells:  # merged cells repeat their text in every column they span
+                    t = c.text.strip()
+                    if not cells or not t or t != cells[-1]:
+                        cells.append(t)
+                rows.append(tuple(cells))
+            yield Block("table", rows=tuple(rows))
+
+def _doc_blocks(fp: str) -> Iterator[Block]:
+    # Word 97-2003: LibreOffice converts to .docx (keeps styles and tables); antiword gives text only
+    if shutil.which(SOFFICE):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run([SOFFICE, "--headless", "--convert-to", "docx", "--outdir", tmp, fp],
+                           check=True, capture_output=True, timeout=300)
+            out = os.path.join(tmp, os.path.splitext(os.path.basename(fp))[0] + ".docx")
+            yield from _docx_blocks(out)
+        return
+    if shutil.which("antiword"):
+        text = subprocess.run(["antiword", "-w", "0", fp], check=True, capture_output=True, timeout=300).stdout
+        yield from _text_blocks(text.decode("utf-8", "replace").splitlines())
+        return
+    raise RuntimeError("converting .doc needs LibreOffice (soffice, or set SOFFICE) or antiword on PATH")
+
+def _is_text_heading(line: str) -> bool:
+    m = HEADING_NUM.match(line) or APPENDIX.match(line)
+    if not m or line[-1] in ".:;," or line[-1].isdigit() or DATE.search(line):
+        return False
+    return len(m.group(2).split()) <= (12 if m.re is HEADING_NUM else 8)
+
+def _text_heading_level(line: str) -> int:
+    # 0 for body text; "3. Purpose" -> 1, "8.1. IT Project Managers" -> 2, appendices 1
+    if not _is_text_heading(line):
+        return 0
+    m = HEADING_NUM.match(line)
+    return m.group(1).count(".") + 1 if m else 1
+
+def _text_blocks(lines: List[str]) -> Iterator[Block]:
+    # Plain text (PDF pages, antiword): numbered lines are headings, wrapped lines are joined
+    # into paragraphs that end at a sentence end, and every bullet starts a new one
+    para: List[str] = []
+    for raw in lines:
+        line = raw.strip()
+        if not line or DOT_LEADER.search(line) or PAGE_NUMBER.match(line):
+            if para:
+                yield Block("text", " ".join(para))
+                para = []
+            continue
+        level = _text_heading_level(line)
+        if level:
+            if para:
+                yield Block("text", " ".join(para))
+                para = []
+            yield _heading(line, level)
+            continue
+        if BULLET.match(line) and para:
+            yield Block("text", " ".join(para))
+            para = []
+        para.append(line)
+        if line[-1] in ".:?!":
+            yield Block("text", " ".join(para))
+            para = []
+    if para:
+        yield Block("text", " ".join(para))
+
+def _pdf_blocks(fp: str) -> Iterator[Block]:
+    import pdfplumber
+    with pdfplumber.open(fp) as pdf:
+        pages = [(page.extract_text() or "").splitlines() for page in pdf.pages]
+    # Running headers / footers: lines repeated on at least half of the pages
+    counts: Dict[str, int] = {}
+    for lines in pages:
+        for line in set(l.strip() for l in lines):
+            counts[line] = counts.get(line, 0) + 1
+    running = {l for l, n in counts.items() if len(pages) >= 4 and n >= len(pages) / 2}
+    yield from _text_blocks([l for lines in pages for l in lines if l.strip() not in running])
+
+def _xls_blocks(fp: str) -> Iterator[Block]:
+    import pandas as pd
+    sheets = pd.read_excel(fp, sheet_name=None, header=None, dtype=str)
+    for n, (name, df) in enumerate(sheets.items(), start=1):
+        yield Block("heading", name.replace("_", " ").strip(), 1, str(n))
+        rows = [tuple(c.strip() for c in r if isinstance(c, str) and c.strip()) for r in df.itertuples(index=False)]
+        # Blank rows separate the blocks of a sheet
+        runs, run = [], []
+        for cells in rows + [()]:
+            if cells:
+                run.append(cells)
+            elif run:
+                runs.append(run)
+                run = []
+        for run in runs:
+            first = run[0]
+            if len(run) > 1 and len(first) <= 2 and all(len(c) < 80 and not c.endswith(".") for c in first):
+                yield Block("heading", first[-1], 2)  # ("Column", "Instructions For Completing This Document")
+                run = run[1:]
+            fields: Dict[str, Dict[str, str]] = {}
+            table: List[Tuple[str, ...]] = []
+            for cells in run:
+                if len(cells) == 2 and len(cells[0]) <= 3:
+                    # Column reference -> "Field: instruction"
+                    label, sep, rest = cells[1].partition(":")
+                    fields[cells[0]] = ({"Field": label.strip(), "Instruction": " ".join(rest.split())}
+                                        if sep and len(label) <= 40 else {"Instruction": " ".join(cells[1].split())})
+                elif len(cells) >= 3:
+                    table.append(cells)
+                else:
+                    yield Block("text", " ".join(" ".join(c.split()) for c in cells))  # "Project Name: <required>"
+            if fields:
+                yield Block("fields", fields=fields)
+            if table:
+                yield Block("table", rows=tuple(table))
+
+READERS = {".docx": _docx_blocks, ".doc": _doc_blocks, ".pdf": _pdf_blocks, ".xls": _xls_blocks, ".xlsx": _xls_blocks}
+
+
+# Blocks -> sections / subsections
+def table_lines(rows: Tuple[Tuple[str, ...], ...]) -> List[str]:
+    header = [" ".join(h.split()) for h in rows[0]] if rows else []
+    body = [r for r in rows[1:] if any(r)]
+    if not body:
+        return [f"Columns: {', '.join(h for h in header if h)}"] if any(header) else []
+    lines = []
+    for r in body:
+        if len(r) == len(header):
+            lines.append("; ".join(f"{h}: {v}" if h else v for h, v in zip(header, r) if v))
+        else:
+            lines.append(" | ".join(v for v in r if v))
+    return lines
+
+def build_document(blocks: List[Block], title: str, source_filename: str, sha256: str) -> Dict[str, Any]:
+    # Text before the first heading (cover page, version history, author notes, TOC) is
+    # template front matter and is dropped, unless the document has no headings at all
+    root: Dict[str, Any] = {"sections": [], "_units": []}
+    stack: List[Tuple[int, Dict[str, Any]]] = [(0, root)]
+    has_headings = any(b.kind == "heading" for b in blocks)
+    for b in blocks:
+        if b.kind == "heading":
+            while stack[-1][0] >= b.level:
+                stack.pop()
+            parent = stack[-1][1]
+            siblings = parent.setdefault("sections" if parent is root else "subsections", [])
+            number = b.number or (f"{parent['number']}.{len(siblings) + 1}" if parent.get("number")
+                                  else str(len(siblings) + 1))
+            node = {"number": number, "title": b.text, "_units": []}
+            siblings.append(node)
+            stack.append((max(b.level, stack[-1][0] + 1), node))
+            continue
+        node = stack[-1][1]
+        if node is root and has_headings:
+            continue
+        if b.kind == "text":
+            node["_units"].append(b.text)
+        elif b.kind == "table":
+            node["_units"].extend(table_lines(b.rows))
+        elif b.kind == "fields":
+            node.setdefault("fields", {}).update(b.fields or {})
+
+    def finish(node: Dict[str, Any]) -> Dict[str, Any]:
+        units = clean_units(node.pop("_units"))
+        out = {k: node[k] for k in ("number", "title") if k in node}
+        if units:
+            out["content"] = units[0] if len(units) == 1 else units
+        if node.get("fields"):
+            out["fields"] = node["fields"]
+        kids = [finish(c) for c in node.get("subsections", [])]
+        kids = [c for c in kids if len(c) > 2 or c.get("subsections")]  # drop empty headings
+        if kids:
+            out["subsections"] = kids
+        return out
+
+    sections = [finish(s) for s in root["sections"]]
+    sections = [s for s in sections if len(s) > 2 or s.get("subsections")]
+    if not has_headings:
+        units = clean_units(root["_units"])
+        sections = [{"number": "1", "title": title, "content": units}] if units else []
+    return {
+        "document_title": title,
+        "source_filename": source_filename,
+        "converter": {"version": CONVERTER_VERSION, "sha256": sha256},
+        "sections": sections,
+    }
+
+def document_title(fp: str) -> str:
+    return os.path.splitext(os.path.basename(fp))[0].replace("_", " ").strip()
+
+def convert_file(fp: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+    ext = os.path.splitext(fp)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"{fp}: unsupported file type {ext!r}")
+    return build_document(list(READERS[ext](fp)), document_title(fp), os.path.basename(fp), sha256 or file_sha256(fp))
+
+def _convert_job(fp: str, sha256: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    # Process-pool entry point: errors come back as text so one bad file doesn't stop the batch
+    try:
+        return fp, convert_file(fp, sha256), None
+    except Exception as e:
+        return fp, None, f"{type(e).__name__}: {e}"
+
+
+# Discovery, hash cache and hand-cleaned files
+def file_sha256(fp: str) -> str:
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def is_temp_file(fp: str) -> bool:
+    name = os.path.basename(fp)
+    return is_lock_file(fp) or name.startswith(("~", ".")) or name.endswith((".tmp", ".bak"))
+
+def discover_raw(paths: List[str]) -> List[str]:
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if os.path.join(root, d) not in (STORE_DIR, CACHE_DIR)
+                             and not d.startswith("."))
+            found.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(RAW_EXTS))
+    return [fp for fp in found if not is_temp_file(fp) and os.path.getsize(fp) > 0]
+
+def cleaned_dir_for(fp: str) -> str:
+    # "<Phase> Phase Templates/x.doc" -> "<Phase> Phase Templates/<Phase> Phase Cleaned/"
+    parent = os.path.dirname(os.path.abspath(fp))
+    name = os.path.basename(parent)
+    if name.endswith(" Phase Cleaned"):
+        return parent
+    if name.endswith(" Phase Templates"):
+        return os.path.join(parent, name[: -len(" Templates")] + " Cleaned")
+    return os.path.join(parent, OTHER_OUT_DIR)
+
+def _name_tokens(name: str) -> frozenset:
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return frozenset(re.findall(r"[a-z0-9]+", stem.lower())) - NAME_NOISE
+
+def _cleaned_files(out_dirs: Set[str]) -> List[str]:
+    from ingest import discover_sources  # every JSON ingest already reads, wherever it lives
+    fps = {fp for fps in discover_sources().values() for fp in fps}
+    for d in out_dirs:
+        if os.path.isdir(d):
+            fps.update(os.path.join(d, f) for f in os.listdir(d) if f.endswith(".json"))
+    return sorted(fps)
+
+def hand_cleaned_claims(out_dirs: Set[str]) -> Dict[str, List[frozenset]]:
+    # -> folder -> names covered by the JSON in it that weren't written here (its file name and
+    # its source_filename, e.g. "HHS EPLC Website.py" covers "HHS EPLC Policy.docx")
+    claims: Dict[str, List[frozenset]] = {}
+    for fp in _cleaned_files(out_dirs):
+        try:
+            doc = _read_json(fp)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(doc, dict) or "converter" in doc:
+            continue
+        names = claims.setdefault(os.path.dirname(os.path.abspath(fp)), [])
+        names.append(_name_tokens(fp))
+        names.extend(_name_tokens(doc[k]) for k in ("source_filename", "source") if isinstance(doc.get(k), str))
+    return claims
+
+def _covers(a: frozenset, b: frozenset) -> bool:
+    return bool(a) and bool(b) and (a <= b or b <= a)
+
+def _cached(sha256: str) -> Optional[Dict[str, Any]]:
+    fp = os.path.join(CACHE_DIR, sha256 + ".json")
+    if not os.path.exists(fp):
+        return None
+    with open(fp, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    return doc if doc.get("converter", {}).get("version") == CONVERTER_VERSION else None
+
+def _write_json(fp: str, doc: Dict[str, Any]):
+    os.makedirs(os.path.dirname(fp), exist_ok=True)
+    with open(fp + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, ensure_ascii=False)
+    os.replace(fp + ".tmp", fp)
+
+def plan(paths: List[str], out: Optional[str] = None, force: bool = False) -> List[Job]:
+    raw = discover_raw(paths)
+    outputs = {fp: os.path.join(out or cleaned_dir_for(fp), os.path.splitext(os.path.basename(fp))[0] + ".json")
+               for fp in raw}
+    claims = hand_cleaned_claims({os.path.dirname(o) for o in outputs.values()})
+    jobs = []
+    for fp in raw:
+        output, sha = outputs[fp], file_sha256(fp)
+        name = _name_tokens(fp)
+        previous = _read_json(output) if os.path.exists(output) else None
+        ours = isinstance(previous, dict) and "converter" in previous
+        near = claims.get(os.path.dirname(output), []) + claims.get(os.path.dirname(os.path.abspath(fp)), [])
+        if not force and not ours and any(_covers(name, c) for c in near):
+            state = "claimed"
+        elif not force and ours and previous["converter"] == {"version": CONVERTER_VERSION, "sha256": sha}:
+            state = "up-to-date"
+        elif not force and _cached(sha) is not None:
+            state = "cached"
+        else:
+            state = "convert"
+        jobs.append(Job(fp, output, sha, state))
+    return jobs
+
+def run(jobs: List[Job], workers: int = WORKERS) -> Dict[str, List[str]]:
+    # -> {"written": [...], "failed": [...]} output / source paths
+    result: Dict[str, List[str]] = {"written": [], "failed": []}
+    todo = [j for j in jobs if j.state == "convert"]
+    docs: Dict[str, Dict[str, Any]] = {}
+    if todo:
+        workers = max(1, min(workers, len(todo)))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                done = list(pool.map(_convert_job, [j.source for j in todo], [j.sha256 for j in todo]))
+        else:
+            done = [_convert_job(j.source, j.sha256) for j in todo]
+        for fp, doc, error in done:
+            if error:
+                print(f"[convert] FAILED {fp}: {error}")
+                result["failed"].append(fp)
+                continue
+            docs[fp] = doc
+            _write_json(os.path.join(CACHE_DIR, doc["converter"]["sha256"] + ".json"), doc)
+    for j in jobs:
+        doc = docs.get(j.source) if j.state == "convert" else _cached(j.sha256) if j.state == "cached" else None
+        if doc is None:
+            continue
+        # The cached copy may come from an identical file under another name
+        doc = {**doc, "document_title": document_title(j.source), "source_filename": os.path.basename(j.source)}
+        _write_json(j.output, doc)
+        result["written"].append(j.output)
+    return result
+
+
+# CLI
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Convert raw templates to cleaned section JSON.")
+    ap.add_argument("paths", nargs="*", default=[DATA_DIR], help="files or folders (default: Data/)")
+    ap.add_argument("--out", help="write every JSON to this folder instead of the phase's Cleaned folder")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--force", action="store_true", help="reconvert everything, including hand-cleaned sources")
+    ap.add_argument("--dry-run", action="store_true", help="show what would be converted")
+    ap.add_argument("--ingest", action="store_true", help="re-ingest the collections whose sources changed")
+    args = ap.parse_args(argv)
+
+    jobs = plan(args.paths, args.out, args.force)
+    for j in jobs:
+        print(f"[convert] {j.state:<11}{os.path.relpath(j.source, DATA_DIR)} -> {os.path.relpath(j.output, DATA_DIR)}")
+    if args.dry_run:
+        return
+    result = run(jobs, args.workers)
+    print(f"[convert] {len(result['written'])} written, {len(result['failed'])} failed, "
+          f"{sum(j.state in ('up-to-date', 'claimed') for j in jobs)} unchanged")
+    if args.ingest and result["written"]:
+        from ingest import discover_sources, ingest
+        written = {os.path.abspath(fp) for fp in result["written"]}
+        collections = sorted(c for c, fps in discover_sources().items() if written & {os.path.abspath(fp) for fp in fps})
+        if collections:
+            ingest(collections)
+        else:
+            print("[convert] written files are outside the ingested folders; pass --out to place them")
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
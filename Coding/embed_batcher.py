@@ -0,0 +1,149 @@
+# embed_batcher.py
+# Micro-batching for query embeddings. Concurrent callers (server.py's encoder pool, several
+# questions in flight) each submit one text; a dispatcher thread per encoder takes whatever is
+# queued, waits up to EMBED_BATCH_WAIT_MS after the oldest arrival for more (or until
+# EMBED_BATCH_MAX texts), encodes the lot in one forward pass on EMBED_THREADS torch threads
+# and resolves every caller's future. Batches grow with load instead of each request running
+# its own single-query pass; a lone query waits at most the window. Queue wait and batch size
+# are kept as histograms for /metrics.
+#
+#   EMBED_BATCH_WAIT_MS=5 EMBED_BATCH_MAX=64 EMBED_THREADS=4 python "Coding/Q&A/server.py"
+#   EMBED_BATCH=0 python "Coding/Q&A/qna.py"           # encode inline, one call per query
+import os, time, queue, threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import model_registry
+
+EMBED_BATCH         = os.getenv("EMBED_BATCH", "1") == "1"
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "3"))
+EMBED_BATCH_MAX     = int(os.getenv("EMBED_BATCH_MAX", "32"))
+# Intra-op threads for the batched forward pass; qna.py pins OMP/MKL to 1 so concurrent
+# single-query encodes don't oversubscribe, but one dispatcher per model can use more
+EMBED_THREADS       = int(os.getenv("EMBED_THREADS", str(min(4, os.cpu_count() or 1))))
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class BatchMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wait: Dict[str, List[float]] = {}  # model -> [bucket counts..., +Inf count, sum]
+        self.size: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _add(h: Dict[str, List[float]], buckets, model: str, value: float):
+        counts = h.setdefault(model, [0] * (len(buckets) + 1) + [0.0])
+        for i, le in enumerate(buckets):
+            if value <= le:
+                counts[i] += 1
+        counts[len(buckets)] += 1
+        counts[-1] += value
+
+    def observe(self, model: str, waits: List[float]):
+        with self.lock:
+            self._add(self.size, SIZE_BUCKETS, model, len(waits))
+            for w in waits:
+                self._add(self.wait, WAIT_BUCKETS, model, w)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            out = {}
+            for model, s in sorted(self.size.items()):
+                w, n = self.wait[model], s[len(SIZE_BUCKETS)]
+                out[model] = {"batches": n, "texts": int(s[-1]), "mean_batch": round(s[-1] / n, 2) if n else 0.0,
+                              "mean_wait_ms": round(w[-1] * 1000 / w[len(WAIT_BUCKETS)], 3) if n else 0.0}
+            return out
+
+    def render(self, prefix: str = "qna") -> str:
+        lines = []
+        with self.lock:
+            for name, unit, buckets, h in (("embed_queue_wait", "_seconds", WAIT_BUCKETS, self.wait),
+                                            ("embed_batch_size", "", SIZE_BUCKETS, self.size)):
+                metric = f"{prefix}_{name}{unit}"
+                lines.append(f"# TYPE {metric} histogram")
+                for model, c in sorted(h.items()):
+                    for le, n in zip(buckets, c):
+                        lines.append(f'{metric}_bucket{{model="{model}",le="{le}"}} {n}')
+                    lines.append(f'{metric}_bucket{{model="{model}",le="+Inf"}} {c[len(buckets)]}')
+                    lines.append(f'{metric}_sum{{model="{model}"}} {c[-1]:.6f}')
+                    lines.append(f'{metric}_count{{model="{model}"}} {c[len(buckets)]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = BatchMetrics()
+
+
+class EmbedBatcher:
+    # encode_fn(texts) -> (n, dim) array; one dispatcher thread calls it, so it is never re-entered
+    def __init__(self, name: str, encode_fn: Callable, max_batch: int = EMBED_BATCH_MAX,
+                 wait_ms: float = EMBED_BATCH_WAIT_MS, threads: int = EMBED_THREADS):
+        self.name = name
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self.threads = threads
+        self.queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"embed-batch-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, text: str) -> Future:
+        # The future's result is the text's vector; .batch_size / .queue_wait are set before it resolves
+        future: Future = Future()
+        self.queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.wait  # from the oldest arrival: no extra wait after a busy pass
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.perf_counter())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        _set_threads(self.threads)
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            waits = [start - t for _, _, t in batch]
+            try:
+                vectors = self.encode_fn([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            metrics.observe(self.name, waits)
+            for (_, future, _), vec, w in zip(batch, vectors, waits):
+                future.batch_size, future.queue_wait = len(batch), w
+                future.set_result(vec)
+
+
+def _set_threads(n: int):
+    # torch's intra-op pool is process-wide; only the dispatchers run forward passes while batching is on
+    if n <= 0:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(n)
+
+
+_batchers: Dict[Tuple[str, str, Optional[str]], EmbedBatcher] = {}
+_lock = threading.Lock()
+
+def get_batcher(model: str, backend: str = "torch", path: Optional[str] = None) -> EmbedBatcher:
+    # One dispatcher per (model, backend, local path), like model_registry's shared encoders
+    key = (model_registry.canonical(model), backend, path)
+    with _lock:
+        if key not in _batchers:
+            encode = lambda texts: model_registry.encode(key[0], texts, batch_size=EMBED_BATCH_MAX,
+                                                         backend=backend, path=path)
+            _batchers[key] = EmbedBatcher(key[0], encode)
+        return _batchers[key]
+
+def submit(model: str, text: str, backend: str = "torch", path: Optional[str] = None) -> Future:
+    return get_batcher(model, backend, path).submit(text)
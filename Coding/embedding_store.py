@@ -0,0 +1,228 @@
+# embedding_store.py
+# Compact on-disk embedding store: one float32/float16 matrix saved as .npy
+# (memory-mappable) plus a JSON side table with ids, documents and metadata.
+#
+#   python Coding/embedding_store.py                  # convert every known dump
+#   python Coding/embedding_store.py --dtype float16  # half-size matrices
+#   python Coding/embedding_store.py path/to/dump.json --out ./stores --model all-MiniLM-L6-v2
+import os, sys, json, glob, argparse
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+REPO_ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR   = os.path.join(REPO_ROOT, "Data")
+STORE_DIR  = os.path.join(DATA_DIR, "Embedding Store")
+
+MATRIX_SUFFIX = ".npy"
+TABLE_SUFFIX  = ".meta.json"
+STORE_FORMAT  = 1
+DTYPES        = ("float32", "float16")
+
+# Pretty-printed JSON / .r dumps produced by the per-template notebooks
+DUMP_GLOBS = [
+    "Implementation Phase Embeddings/*.json",
+    "Design Phase Embeddings/*.r",
+    "Development Phase Embedding/*.r",
+    "Requirements Phase Embedding/*.json",
+    "EPLC Framework/Embeddings/*.json",
+    "Development Phase Templates/Development Phase Cleaned/TPembedded.json",
+]
+
+TEXT_KEYS  = ("text", "content")
+TITLE_KEYS = ("section_title", "title")
+META_KEYS  = ("document", "section_number", "section_path")
+
+
+# Loaded store
+@dataclass
+class EmbeddingStore:
+    vectors: np.ndarray
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict[str, Any]]
+    model: Optional[str] = None
+    normalized: bool = False
+    info: Dict[str, Any] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+
+def _prefix(path: str) -> str:
+    for suffix in (MATRIX_SUFFIX, TABLE_SUFFIX):
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+def is_lock_file(fp: str) -> bool:
+    # Word/Excel owner files ("~$foo.doc") and their renamed copies ("_$foo")
+    name = os.path.basename(fp)
+    return name.startswith("~$") or name.startswith("_$") or name.startswith(".~lock")
+
+
+# Writing
+def save_store(path: str, vectors, ids: List[str], documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict[str, Any]]] = None, model: Optional[str] = None,
+               dtype: str = "float32", source: Optional[str] = None) -> str:
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+    mat = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if mat.ndim != 2 or mat.shape[0] != len(ids):
+        raise ValueError(f"vectors shape {mat.shape} does not match {len(ids)} ids")
+    documents = list(documents) if documents is not None else [""] * len(ids)
+    metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+
+    norms = np.linalg.norm(mat, axis=1) if len(mat) else np.ones(0)
+    table = {
+        "format": STORE_FORMAT,
+        "dtype": dtype,
+        "count": int(mat.shape[0]),
+        "dim": int(mat.shape[1]),
+        "model": model,
+        "normalized": bool(np.allclose(norms, 1.0, atol=1e-3)),
+        "source": source,
+        "ids": list(ids),
+        "documents": documents,
+        "metadatas": metadatas,
+    }
+
+    prefix = _prefix(path)
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    # Write to temp names first so readers never see a half-written pair
+    tmp_mat, tmp_tab = prefix + ".tmp" + MATRIX_SUFFIX, prefix + ".tmp" + TABLE_SUFFIX
+    np.save(tmp_mat, mat.astype(dtype, copy=False))
+    with open(tmp_tab, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    os.replace(tmp_mat, prefix + MATRIX_SUFFIX)
+    os.replace(tmp_tab, prefix + TABLE_SUFFIX)
+    return prefix
+
+
+# Reading
+def load_store(path: str, mmap: bool = True) -> EmbeddingStore:
+    prefix = _prefix(path)
+    with open(prefix + TABLE_SUFFIX, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    vectors = np.load(prefix + MATRIX_SUFFIX, mmap_mode="r" if mmap else None)
+    if vectors.shape[0] != len(table["ids"]):
+        raise ValueError(f"{prefix}: matrix has {vectors.shape[0]} rows, table has {len(table['ids'])} ids")
+    info = {k: v for k, v in table.items() if k not in ("ids", "documents", "metadatas")}
+    info["path"] = prefix
+    info["mtime"] = os.path.getmtime(prefix + MATRIX_SUFFIX)
+    return EmbeddingStore(
+        vectors=vectors,
+        ids=table["ids"],
+        documents=table.get("documents") or [""] * len(table["ids"]),
+        metadatas=table.get("metadatas") or [{} for _ in table["ids"]],
+        model=table.get("model"),
+        normalized=bool(table.get("normalized")),
+        info=info,
+    )
+
+def iter_stores(root: str = STORE_DIR, mmap: bool = True) -> Iterator[EmbeddingStore]:
+    for fp in sorted(glob.glob(os.path.join(root, "**", "*" + TABLE_SUFFIX), recursive=True)):
+        yield load_store(fp, mmap=mmap)
+
+def load_corpus(root: str = STORE_DIR, dim: Optional[int] = None, mmap: bool = True) -> List[EmbeddingStore]:
+    stores = list(iter_stores(root, mmap=mmap))
+    if dim is not None:
+        stores = [s for s in stores if s.dim == dim]
+    return stores
+
+
+# Converting legacy JSON dumps
+def read_json_dump(fp: str) -> Dict[str, list]:
+    with open(fp, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    if not isinstance(records, list):
+        raise ValueError(f"{fp}: expected a list of records")
+
+    name = os.path.basename(fp)
+    ids, docs, metas, vecs = [], [], [], []
+    for i, rec in enumerate(records):
+        emb = rec.get("embedding")
+        if not emb:
+            continue
+        text  = next((rec[k] for k in TEXT_KEYS if rec.get(k)), "")
+        title = next((rec[k] for k in TITLE_KEYS if rec.get(k)), "")
+        meta  = {"source": name, "title": title}
+        for k in META_KEYS:
+            if rec.get(k) is not None:
+                meta[k] = rec[k] if isinstance(rec[k], (str, int, float, bool)) else json.dumps(rec[k])
+        # Same "<file>_<row>" ids the phase Chroma collections were built with
+        ids.append(f"{name}_{i}")
+        docs.append(text)
+        metas.append(meta)
+        vecs.append(emb)
+    return {"ids": ids, "documents": docs, "metadatas": metas, "embeddings": vecs}
+
+def store_path_for(fp: str, out_dir: str = STORE_DIR) -> str:
+    rel = os.path.relpath(os.path.dirname(os.path.abspath(fp)), DATA_DIR)
+    if rel.startswith(".."):
+        rel = ""
+    stem = os.path.splitext(os.path.basename(fp))[0]
+    return os.path.join(out_dir, rel, stem)
+
+def dump_model(dim: int, model: Optional[str] = None) -> Optional[str]:
+    # The encoder that built a dump: as given (checked against its dimension), else the one
+    # known model with that dimension. The notebooks' dumps don't record it themselves.
+    from model_registry import canonical, infer_model, spec_for
+    if model:
+        spec = spec_for(canonical(model), dim)
+        if spec.dim != dim:
+            raise ValueError(f"{spec.name} produces {spec.dim}-dim vectors, the dump holds {dim}-dim")
+        return spec.name
+    spec = infer_model(dim)
+    return spec.name if spec is not None else None
+
+def convert_dump(fp: str, out_dir: str = STORE_DIR, dtype: str = "float32",
+                 model: Optional[str] = None) -> Optional[str]:
+    dump = read_json_dump(fp)
+    if not dump["ids"]:
+        return None
+    return save_store(store_path_for(fp, out_dir), dump["embeddings"], dump["ids"],
+                      dump["documents"], dump["metadatas"],
+                      model=dump_model(len(dump["embeddings"][0]), model), dtype=dtype,
+                      source=os.path.relpath(fp, REPO_ROOT))
+
+def find_dumps(data_dir: str = DATA_DIR) -> List[str]:
+    files = []
+    for pattern in DUMP_GLOBS:
+        files.extend(sorted(glob.glob(os.path.join(data_dir, pattern))))
+    return files
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Convert JSON/.r embedding dumps to the binary store.")
+    ap.add_argument("files", nargs="*", help="dump files (default: every known dump under Data/)")
+    ap.add_argument("--out", default=STORE_DIR, help="output root directory")
+    ap.add_argument("--dtype", default="float32", choices=DTYPES)
+    ap.add_argument("--model", help="encoder that built the dumps (default: inferred from each dump's dimension)")
+    args = ap.parse_args(argv)
+
+    files = args.files or find_dumps()
+    for fp in files:
+        if is_lock_file(fp):
+            print(f"[skip] lock file: {fp}")
+            continue
+        try:
+            out = convert_dump(fp, args.out, args.dtype, args.model)
+        except (ValueError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"[skip] {fp}: {e}")
+            continue
+        if out is None:
+            print(f"[skip] no embeddings: {fp}")
+            continue
+        before = os.path.getsize(fp)
+        after = os.path.getsize(out + MATRIX_SUFFIX) + os.path.getsize(out + TABLE_SUFFIX)
+        print(f"[ok] {os.path.relpath(fp, REPO_ROOT)} -> {os.path.relpath(out, REPO_ROOT)} "
+              f"({before/1024:.0f} KB -> {after/1024:.0f} KB, {load_store(out).model or 'unknown model'})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+# federated.py
+# Cross-phase retrieval: the query embedded once per encoder in use (the model registry
+# says which collection was built with which) and fanned out to every per-phase collection in
+# parallel, each hit tagged with its phase, results merged by reciprocal-rank fusion or by
+# centroid-calibrated similarity. Within each collection, dense hits are fused with the
+# BM25 index when the question is given. An optional keyword router skips phases a
+# question can't be about. Hits on a chunk split out of a larger section can be widened to
+# the section with parent(). The "snapshot" backend opens each collection's published
+# read-only snapshot; reload_shard() moves a shard to a newer one.
+#
+#   fed = FederatedRetriever.open_default()          # every DB under Data/Vector DataBase
+#   fed = FederatedRetriever.open_default(backend="snapshot")
+#   qv = {m: encode(m, [question])[0] for m in fed.models}
+#   hits = fed.search(qv, k=6, question="What are the Design Phase exit criteria?")
+import os, json, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from chunker import load_sections
+from embedding_store import load_store
+from ingest import MANIFEST_NAME, VECTOR_DB_DIR, DB_DIRS, db_path_for, discover_sources, store_path_for_collection
+from lexical_index import LEXICAL_WEIGHT, BM25Index, load_index, rrf_merge
+from model_registry import chroma_catalog, resolve
+from quantized_index import open_index
+from search_engine import normalize_rows
+from tracing import bind, span
+import snapshots
+
+RRF_K = 60
+FUSION = os.getenv("FEDERATED_FUSION", "rrf")  # "rrf" or "calibrated"
+# One query vector, or {model name: query vector} when the shards use different encoders
+QueryVectors = Union[Sequence[float], Mapping[str, Sequence[float]]]
+
+# Display tag per collection; "<X>_Phase" collections are tagged "<X>"
+PHASE_TAGS = {"EPLC": "EPLC Framework", "hhs_eplc_policy": "HHS EPLC Policy"}
+# Keywords that route a question to a phase; framework and policy collections cover every phase
+ROUTE_KEYWORDS = {
+    "Requirements": ("requirement", "data model", "physical data"),
+    "Design": ("design",),
+    "Development": ("develop", "test case", "training", "build"),
+    "Implementation": ("implement", "deploy", "rollout", "acquisition", "lessons learned",
+                       "post-project", "business impact", "records notice"),
+}
+CROSS_PHASE = ("EPLC", "hhs_eplc_policy")
+
+
+def phases_of(question: str) -> set:
+    # Phases a question names, by ROUTE_KEYWORDS
+    q = question.lower()
+    return {p for p, words in ROUTE_KEYWORDS.items() if any(w in q for w in words)}
+
+def phase_of(collection: str) -> str:
+    if collection in PHASE_TAGS:
+        return PHASE_TAGS[collection]
+    return collection[: -len("_Phase")] if collection.endswith("_Phase") else collection
+
+def similarity(dist: float, space: str) -> float:
+    # Chroma distances -> cosine similarity for normalized embeddings
+    if space == "l2":
+        return 1.0 - dist / 2.0  # squared L2
+    return 1.0 - dist            # "cosine" and "ip"
+
+
+class FederatedHit(NamedTuple):
+    id: str
+    document: str
+    distance: float
+    metadata: Dict[str, Any]
+    collection: str
+    phase: str
+    score: float
+
+
+class ChromaShard:
+    _unset = object()
+
+    def __init__(self, name: str, path: str, client=None):
+        from chromadb import PersistentClient
+        self.name, self.phase, self.path = name, phase_of(name), path
+        self.coll = (client or PersistentClient(path=path)).get_collection(name=name)
+        self.space = (self.coll.metadata or {}).get("hnsw:space", "l2")
+        # The dimension comes from the sqlite catalog: opening a shard reads no vectors. The
+        # centroid (calibrated fusion only) and a BM25 index ingest didn't save load on first use.
+        self.dim = chroma_catalog(path).get(name, (0, None))[0] or self._probe_dim()
+        self.model = resolve(name, path, dim=self.dim or None,
+                             model=(self.coll.metadata or {}).get("embed_model")).name
+        manifest_version = self._manifest_version()
+        saved = load_index(path, manifest_version) if manifest_version else None
+        self._lexical = saved if saved is not None else self._unset
+        self._centroid = self._unset
+        self._lock = threading.Lock()
+        self.sections = load_sections(path)
+        self.kind = "chroma"
+
+    def _probe_dim(self) -> int:
+        emb = self.coll.get(limit=1, include=["embeddings"]).get("embeddings")
+        return len(emb[0]) if emb is not None and len(emb) else 0
+
+    @property
+    def centroid(self) -> Optional[np.ndarray]:
+        # Mean similarity of a query to this collection is q . mean(normalized rows)
+        if self._centroid is self._unset:
+            with self._lock:
+                if self._centroid is self._unset:
+                    emb = self.coll.get(include=["embeddings"]).get("embeddings")
+                    emb = np.asarray(emb if emb is not None else [], dtype=np.float32)
+                    self._centroid = normalize_rows(emb).mean(axis=0) if emb.ndim == 2 and len(emb) else None
+        return self._centroid
+
+    @property
+    def lexical(self) -> BM25Index:
+        if self._lexical is self._unset:
+            with self._lock:
+                if self._lexical is self._unset:
+                    res = self.coll.get(include=["documents", "metadatas"])
+                    self._lexical = BM25Index.build(res["ids"], res.get("documents") or [], res.get("metadatas"))
+        return self._lexical
+
+    def _manifest_version(self) -> Optional[str]:
+        fp = os.path.join(self.path, MANIFEST_NAME)
+        if os.path.exists(fp):
+            with open(fp, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("collection") == self.name:
+                return manifest.get("version")
+        return None
+
+    def count(self) -> int:
+        return self.coll.count()
+
+    def version(self) -> str:
+        return self._manifest_version() or f"count={self.count()}"
+
+    def dense(self, qv: Sequence[float], k: int) -> Tuple[list, list, list, list]:
+        res = self.coll.query(query_embeddings=[list(qv)], n_results=k,
+                              include=["documents", "metadatas", "distances"])
+        ids = res.get("ids", [[]])[0]
+        sims = [similarity(d, self.space) for d in res.get("distances", [[]])[0]]
+        return (ids, res.get("documents", [[]])[0], sims,
+                (res.get("metadatas") or [[]])[0] or [{} for _ in ids])
+
+    def fetch(self, ids: Sequence[str], qv: Sequence[float]) -> Dict[str, Tuple[str, float, Dict[str, Any]]]:
+        # id -> (document, similarity to qv, metadata) for lexical-only hits
+        res = self.coll.get(ids=list(ids), include=["documents", "metadatas", "embeddings"])
+        q = normalize_rows(np.asarray(qv, dtype=np.float32).ravel())
+        sims = normalize_rows(np.asarray(res["embeddings"], dtype=np.float32)) @ q if len(res["ids"]) else []
+        return {i: (d, float(s), m or {}) for i, d, s, m in zip(res["ids"], res["documents"], sims, res["metadatas"])}
+
+    def search(self, qv: QueryVectors, k: int, question: Optional[str] = None) -> Tuple[list, list, list, list]:
+        return _hybrid(self, query_vector(qv, self.model), k, question)
+
+    def parent(self, chunk_id: str) -> Optional[Tuple[str, str]]:
+        return _parent(self, chunk_id)
+
+
+class StoreShard:
+    def __init__(self, name: str, path: str, snapshot: Optional[str] = None):
+        self.name, self.phase, self.path = name, phase_of(name), path
+        self.snapshot = snapshot  # published snapshot directory, None for the live store files
+        self.store = load_store(path)
+        # int8 / PQ codes when ingest built them for this collection, else the float matrix
+        self.index = open_index(self.store)
+        self.dim = self.index.dim
+        self.model = resolve(name, dim=self.dim or None, model=self.store.model).name
+        self.centroid = self.index.centroid() if len(self.index) else None
+        self.rows = {i: n for n, i in enumerate(self.store.ids)}
+        # A snapshot carries the BM25 index and sections built with its vectors
+        version = snapshots.info(snapshot).get("version") if snapshot else None
+        self.lexical = (load_index(snapshot, version) if snapshot else None) or \
+            BM25Index.build(self.store.ids, self.store.documents, self.store.metadatas)
+        self.sections = load_sections(snapshot or db_path_for(name))
+        self.kind = getattr(self.index, "mode", "exact")  # exact float scan, int8 or pq
+
+    @classmethod
+    def from_snapshot(cls, name: str, snapshot: str) -> "StoreShard":
+        return cls(name, snapshots.store_prefix(snapshot), snapshot)
+
+    def count(self) -> int:
+        return len(self.store)
+
+    def version(self) -> str:
+        index = getattr(self.index, "mode", "float")
+        if self.snapshot:
+            return f"snapshot={os.path.basename(self.snapshot)};index={index}"
+        return f"mtime={self.store.info['mtime']};index={index}"
+
+    def dense(self, qv: Sequence[float], k: int) -> Tuple[list, list, list, list]:
+        hits = self.index.search_one(qv, k)
+        return ([h.id for h in hits], [self.store.documents[h.index] for h in hits],
+                [h.score for h in hits], [self.store.metadatas[h.index] for h in hits])
+
+    def fetch(self, ids: Sequence[str], qv: Sequence[float]) -> Dict[str, Tuple[str, float, Dict[str, Any]]]:
+        rows = [self.rows[i] for i in ids if i in self.rows]
+        sims = self.index.score_rows(qv, rows) if rows else []
+        return {self.store.ids[r]: (self.store.documents[r], float(s), self.store.metadatas[r])
+                for r, s in zip(rows, sims)}
+
+    def search(self, qv: QueryVectors, k: int, question: Optional[str] = None) -> Tuple[list, list, list, list]:
+        return _hybrid(self, query_vector(qv, self.model), k, question)
+
+    def parent(self, chunk_id: str) -> Optional[Tuple[str, str]]:
+        return _parent(self, chunk_id)
+
+
+def reload_shard(shard) -> Optional[StoreShard]:
+    # The shard reopened on its collection's newly published snapshot; None when it is current
+    # (or not a snapshot shard). Searches holding the old shard finish on the old snapshot.
+    snapshot = getattr(shard, "snapshot", None)
+    latest = snapshots.current(shard.name) if snapshot else None
+    if latest is None or latest == snapshot:
+        return None
+    return StoreShard.from_snapshot(shard.name, latest)
+
+def _parent(shard, chunk_id: str) -> Optional[Tuple[str, str]]:
+    # -> (parent id, whole section text) for a chunk split out of a larger section
+    pid = shard.sections.parent(chunk_id) if shard.sections is not None else None
+    text = shard.sections.text(pid) if pid else None
+    return (pid, text) if text else None
+
+def query_vector(qv: QueryVectors, model: str) -> Sequence[float]:
+    # The vector made with `model` when given one per model
+    if isinstance(qv, Mapping):
+        if model not in qv:
+            raise KeyError(f"no query vector for {model}; embed the query with every model in use")
+        return qv[model]
+    return qv
+
+def _hybrid(shard, qv: Sequence[float], k: int, question: Optional[str]) -> Tuple[list, list, list, list]:
+    # Dense top-k fused (RRF) with BM25 top-k over the same collection
+    with span("dense", collection=shard.name, index=shard.kind, k=k):
+        ids, docs, sims, metas = shard.dense(qv, k)
+    if not question or shard.lexical is None or not LEXICAL_WEIGHT:
+        return ids, docs, sims, metas
+    with span("lexical", collection=shard.name, k=k):
+        lexical = [i for i, _ in shard.lexical.search_ids(question, k)]
+    fused = [i for i, _ in rrf_merge([ids, lexical], [1.0, LEXICAL_WEIGHT], k)]
+    known = {i: (d, s, m) for i, d, s, m in zip(ids, docs, sims, metas)}
+    missing = [i for i in fused if i not in known]
+    if missing:
+        with span("fetch", collection=shard.name, rows=len(missing)):
+            known.update(shard.fetch(missing, qv))
+    fused = [i for i in fused if i in known]
+    return (fused, [known[i][0] for i in fused], [known[i][1] for i in fused], [known[i][2] for i in fused])
+
+
+class FederatedRetriever:
+    def __init__(self, shards: Sequence, fusion: str = FUSION, route: bool = False, max_workers: Optional[int] = None):
+        if fusion not in ("rrf", "calibrated"):
+            raise ValueError(f"unknown fusion {fusion!r}; expected 'rrf' or 'calibrated'")
+        self.shards = list(shards)
+        self.fusion = fusion
+        self.routing = route
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.shards)),
+                                       thread_name_prefix="federated")
+
+    @classmethod
+    def open_default(cls, names: Optional[Sequence[str]] = None, backend: str = "chroma", **kwargs) -> "FederatedRetriever":
+        # names default to every ingest collection plus the collections already on disk
+        on_disk = collections_on_disk()
+        if names is None:
+            names = sorted(set(discover_sources()) | set(DB_DIRS) | set(on_disk) | set(snapshots.collections()))
+        shards = []
+        for name in names:
+            if backend == "snapshot":
+                path = snapshots.current(name)
+                if path is None:
+                    continue
+            elif backend == "store":
+                path = store_path_for_collection(name)
+                if not os.path.exists(path + ".npy"):
+                    continue
+            else:
+                path = on_disk.get(name, db_path_for(name))
+                if not os.path.exists(os.path.join(path, "chroma.sqlite3")):
+                    continue
+            try:
+                if backend == "snapshot":
+                    shards.append(StoreShard.from_snapshot(name, path))
+                else:
+                    shards.append(StoreShard(name, path) if backend == "store" else ChromaShard(name, path))
+            except Exception as e:
+                print(f"[federated] skip {name}: {type(e).__name__}: {e}")
+        return cls(shards, **kwargs)
+
+    @property
+    def names(self) -> List[str]:
+        return [s.name for s in self.shards]
+
+    @property
+    def models(self) -> List[str]:
+        # Encoders a query has to be embedded with to search every shard
+        return sorted({s.model for s in self.shards})
+
+    def count(self) -> int:
+        return sum(s.count() for s in self.shards)
+
+    def parent(self, hit_id: str) -> Optional[Tuple[str, str]]:
+        # Hit ids are "<collection>/<chunk id>"
+        name, _, chunk_id = hit_id.partition("/")
+        shard = next((s for s in self.shards if s.name == name), None)
+        found = shard.parent(chunk_id) if shard is not None else None
+        return (f"{name}/{found[0]}", found[1]) if found else None
+
+    def version(self) -> str:
+        return ";".join(f"{s.name}:{s.version()}" for s in self.shards)
+
+    def route(self, question: Optional[str]) -> List:
+        if not self.routing or not question:
+            return self.shards
+        phases = phases_of(question)
+        if not phases:
+            return self.shards
+        picked = [s for s in self.shards if s.phase in phases or s.name in CROSS_PHASE]
+        return picked or self.shards
+
+    def search(self, qv: QueryVectors, k: int, question: Optional[str] = None,
+               fusion: Optional[str] = None) -> List[FederatedHit]:
+        shards = self.route(question)
+        results = list(self.pool.map(bind(lambda s: s.search(qv, k, question)), shards))
+        fusion = fusion or self.fusion
+        scored: Dict[Tuple[str, str], FederatedHit] = {}
+        for shard, (ids, docs, sims, metas) in zip(shards, results):
+            if fusion == "calibrated" and shard.centroid is not None:
+                q = normalize_rows(np.asarray(query_vector(qv, shard.model), dtype=np.float32).ravel())
+                baseline = float(q @ shard.centroid)
+            else:
+                baseline = 0.0
+            for rank, (i, doc, sim, meta) in enumerate(zip(ids, docs, sims, metas)):
+                score = 1.0 / (RRF_K + rank + 1) if fusion == "rrf" else sim - baseline
+                key = (shard.name, i)
+                if key not in scored or scored[key].score < score:
+                    meta = {**(meta or {}), "collection": shard.name, "phase": shard.phase}
+                    scored[key] = FederatedHit(f"{shard.name}/{i}", doc, 1.0 - sim, meta, shard.name, shard.phase, score)
+        # Ties (RRF at equal rank) fall back to raw similarity
+        return sorted(scored.values(), key=lambda h: (-h.score, h.distance))[:k]
+
+
+def collections_on_disk(root: str = VECTOR_DB_DIR) -> Dict[str, str]:
+    # -> {collection: DB folder}, read from each DB's sqlite catalog without opening a client
+    found: Dict[str, str] = {}
+    if not os.path.isdir(root):
+        return found
+    for d in sorted(os.listdir(root)):
+        fp = os.path.join(root, d, "chroma.sqlite3")
+        if not os.path.exists(fp):
+            continue
+        con = sqlite3.connect(f"file:{fp}?mode=ro", uri=True)
+        try:
+            for (name,) in con.execute("SELECT name FROM collections"):
+                found.setdefault(name, os.path.join(root, d))
+        except sqlite3.Error:
+            pass
+        finally:
+            con.close()
+    return found
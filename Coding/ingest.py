@@ -0,0 +1,341 @@
+# ingest.py
+# Incremental ingest of every cleaned template into the per-phase Chroma collections.
+# A manifest of per-chunk content hashes (and the model used) sits in each DB folder,
+# so re-runs only embed new or changed chunks and delete removed ones. A BM25 index over
+# the same chunks is saved next to it for hybrid retrieval, and the parent sections of
+# split chunks for expanding a hit to its whole section. Each collection keeps the
+# encoder recorded for it in the model registry, so only collections whose model changed
+# (e.g. --model on the command line) are re-embedded from scratch. What the store backend
+# serves is then published as an immutable snapshot (snapshots.py) that running workers
+# switch to without a restart.
+#
+#   python Coding/ingest.py                       # every collection, all cores
+#   python Coding/ingest.py Implementation_Phase  # just one collection
+#   python Coding/ingest.py --full                # ignore manifests, rebuild everything
+#   python Coding/ingest.py EPLC --model BAAI/bge-large-en-v1.5   # switch one collection's model
+#   python Coding/ingest.py EPLC --quantize pq    # int8 / PQ codes for the store backend ("none" drops them)
+#   python Coding/ingest.py --workers 4 --batch-size 128 --dry-run
+import os, sys, glob, json, time, hashlib, argparse
+from typing import Any, Dict, List, Optional
+
+from chunker import PARENTS_NAME, SectionIndex, chunk_file, load_sections
+from embedding_store import DATA_DIR, MATRIX_SUFFIX, STORE_DIR, TABLE_SUFFIX, is_lock_file, load_store, save_store
+from lexical_index import INDEX_NAME, BM25Index, load_index
+from model_registry import canonical, get_encoder, register, registered
+from quantized_index import MODES as QUANT_MODES, QUANT_SUFFIX, build_quantized
+from semantic_cache import invalidate_collection
+import snapshots
+
+VECTOR_DB_DIR = os.path.join(DATA_DIR, "Vector DataBase")
+EMBED_MODEL   = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")  # for new collections
+BATCH_SIZE    = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+WORKERS       = int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1)))
+CHROMA_BATCH  = 5000
+MANIFEST_NAME = "index_manifest.json"
+
+# Existing DB folders whose names don't follow "chroma_db_<Phase> Phase"
+DB_DIRS = {
+    "Implementation_Phase": "chroma_db_implementation Phase",
+    "EPLC": "chroma_db_EPLC Phase",
+    "hhs_eplc_policy": "chroma_eplc_policy",
+}
+# Sources outside the "* Phase Cleaned" folders
+EXTRA_SOURCES = {
+    "EPLC": ["EPLC Framework/Cleaned Phases/*.json"],
+    "hhs_eplc_policy": ["HHS EPLC Website/HHS EPLC Website.py"],
+}
+
+
+# Source discovery
+def discover_sources(data_dir: str = DATA_DIR) -> Dict[str, List[str]]:
+    sources: Dict[str, List[str]] = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != STORE_DIR)
+        name = os.path.basename(root)
+        if not name.endswith(" Phase Cleaned"):
+            continue
+        phase = name[: -len(" Phase Cleaned")]
+        fps = [os.path.join(root, f) for f in sorted(files)
+               if f.endswith(".json") and not f.endswith(TABLE_SUFFIX) and not is_lock_file(f)]
+        if fps:
+            sources.setdefault(f"{phase}_Phase", []).extend(fps)
+    for coll, patterns in EXTRA_SOURCES.items():
+        for pattern in patterns:
+            sources.setdefault(coll, []).extend(sorted(glob.glob(os.path.join(data_dir, pattern))))
+    return sources
+
+def db_path_for(collection: str) -> str:
+    default = "chroma_db_" + collection.replace("_Phase", " Phase")
+    return os.path.join(VECTOR_DB_DIR, DB_DIRS.get(collection, default))
+
+def store_path_for_collection(collection: str) -> str:
+    return os.path.join(STORE_DIR, "Collections", collection)
+
+def content_hash(chunk: Dict[str, Any]) -> str:
+    payload = json.dumps([chunk["text"], chunk["metadata"]], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def load_chunks(files: List[str]) -> List[Dict[str, Any]]:
+    chunks = []
+    for fp in files:
+        try:
+            file_chunks = chunk_file(fp)
+        except ValueError as e:
+            print(f"[skip] {e}")
+            continue
+        # Ids follow the section path (see chunker), so inserting a section doesn't renumber the rest
+        for ch in file_chunks:
+            ch["hash"] = content_hash(ch)
+        chunks.extend(file_chunks)
+    return chunks
+
+
+# Manifest of what each collection was built from
+def load_manifest(collection: str) -> Dict[str, Any]:
+    fp = os.path.join(db_path_for(collection), MANIFEST_NAME)
+    if not os.path.exists(fp):
+        return {}
+    with open(fp, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(collection: str, model_name: str, chunks: List[Dict[str, Any]], dim: int,
+                  quantize: Optional[str] = None) -> str:
+    fp = os.path.join(db_path_for(collection), MANIFEST_NAME)
+    hashes = {c["id"]: c["hash"] for c in chunks}
+    version = hashlib.sha1(json.dumps([model_name, sorted(hashes.items())]).encode("utf-8")).hexdigest()[:16]
+    manifest = {
+        "collection": collection,
+        "model": model_name,
+        "dim": dim,
+        "quantize": quantize,
+        "version": version,
+        "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "chunks": hashes,
+    }
+    with open(fp + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(fp + ".tmp", fp)
+    return version
+
+def save_lexical_index(collection: str, chunks: List[Dict[str, Any]], version: Optional[str]):
+    index = BM25Index.build([c["id"] for c in chunks], [c["text"] for c in chunks],
+                            [c["metadata"] for c in chunks], version)
+    index.save(os.path.join(db_path_for(collection), INDEX_NAME))
+    return index
+
+def model_for(collection: str) -> str:
+    # The encoder the collection was built with, or the default for a new one
+    spec = registered(collection)
+    return spec.name if spec is not None else canonical(EMBED_MODEL)
+
+def save_sections(collection: str, chunks: List[Dict[str, Any]], version: Optional[str]):
+    sections = SectionIndex.from_chunks(chunks, version)
+    sections.save(os.path.join(db_path_for(collection), PARENTS_NAME))
+    return sections
+
+def publish_snapshot(collection: str) -> Optional[str]:
+    # Read-only copy of what the store backend serves (vectors, codes, BM25, sections), swapped
+    # in atomically for the workers; None when the collection has no binary store yet
+    store_path = store_path_for_collection(collection)
+    if not os.path.exists(store_path + MATRIX_SUFFIX):
+        return None
+    db_path, manifest = db_path_for(collection), load_manifest(collection)
+    prefix = snapshots.STORE_NAME
+    files = {prefix + MATRIX_SUFFIX: store_path + MATRIX_SUFFIX, prefix + TABLE_SUFFIX: store_path + TABLE_SUFFIX,
+             prefix + QUANT_SUFFIX: store_path + QUANT_SUFFIX, INDEX_NAME: os.path.join(db_path, INDEX_NAME),
+             PARENTS_NAME: os.path.join(db_path, PARENTS_NAME)}
+    return snapshots.publish(collection, files, manifest.get("version"),
+                             {"model": manifest.get("model"), "dim": manifest.get("dim"),
+                              "quantize": manifest.get("quantize"), "count": len(manifest.get("chunks", {}))})
+
+def diff_manifest(manifest: Dict[str, Any], chunks: List[Dict[str, Any]], model_name: str):
+    # -> (chunks to embed, ids to delete, full rebuild?)
+    if not manifest or canonical(manifest.get("model") or "") != canonical(model_name):
+        return list(chunks), [], True
+    old = manifest.get("chunks", {})
+    current = {c["id"] for c in chunks}
+    changed = [c for c in chunks if old.get(c["id"]) != c["hash"]]
+    removed = [i for i in old if i not in current]
+    return changed, removed, False
+
+
+# Embedding
+def encode_texts(texts: List[str], model_name: str = EMBED_MODEL, workers: int = WORKERS,
+                 batch_size: int = BATCH_SIZE):
+    import numpy as np
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    # Longest first so each batch pads to similar lengths; restored afterwards
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    ordered = [texts[i] for i in order]
+
+    workers = max(1, min(workers, len(texts) // batch_size + 1))
+    if workers > 1:
+        # Split cores between worker processes instead of oversubscribing
+        os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    model = get_encoder(model_name)
+
+    if workers > 1:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        try:
+            vecs = model.encode_multi_process(ordered, pool, batch_size=batch_size,
+                                              chunk_size=max(batch_size, len(ordered) // (workers * 4)),
+                                              normalize_embeddings=True)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        vecs = model.encode(ordered, batch_size=batch_size, normalize_embeddings=True,
+                            convert_to_numpy=True, show_progress_bar=False)
+
+    out = np.empty_like(vecs, dtype=np.float32)
+    out[np.asarray(order)] = vecs
+    return out
+
+
+# Writing
+def _previous_vectors(coll, store_path: str, ids: List[str]) -> Dict[str, Any]:
+    # Unchanged chunks keep their vectors: read them from the binary store, else from Chroma
+    found: Dict[str, Any] = {}
+    if os.path.exists(store_path + TABLE_SUFFIX):
+        store = load_store(store_path)
+        row = {i: n for n, i in enumerate(store.ids)}
+        found = {i: store.vectors[row[i]] for i in ids if i in row}
+    missing = [i for i in ids if i not in found]
+    if missing:
+        res = coll.get(ids=missing, include=["embeddings"])
+        found.update(zip(res["ids"], res["embeddings"]))
+    return found
+
+def write_collection(collection: str, chunks: List[Dict[str, Any]], changed: List[Dict[str, Any]],
+                     changed_vectors, removed: List[str], full: bool, model_name: str,
+                     quantize: Optional[str] = None):
+    import numpy as np
+    from chromadb import PersistentClient
+    db = PersistentClient(path=db_path_for(collection))
+    if full and collection in [c.name for c in db.list_collections()]:
+        db.delete_collection(collection)
+    coll = db.get_or_create_collection(name=collection,
+                                       metadata={"hnsw:space": "cosine", "embed_model": canonical(model_name)})
+
+    # Rows the manifest never knew about (older scripts' positional "section_<n>" ids) go too
+    current, gone = {c["id"] for c in chunks}, set(removed)
+    removed = list(removed) + [i for i in coll.get(include=[])["ids"] if i not in current and i not in gone]
+
+    ids   = [c["id"] for c in changed]
+    docs  = [c["text"] for c in changed]
+    metas = [c["metadata"] for c in changed]
+    for start in range(0, len(ids), CHROMA_BATCH):
+        end = start + CHROMA_BATCH
+        coll.upsert(ids=ids[start:end], documents=docs[start:end],
+                    embeddings=changed_vectors[start:end].tolist(), metadatas=metas[start:end])
+    for start in range(0, len(removed), CHROMA_BATCH):
+        coll.delete(ids=removed[start:start + CHROMA_BATCH])
+
+    # Same vectors in the binary store, for in-process search
+    store_path = store_path_for_collection(collection)
+    fresh = dict(zip(ids, changed_vectors))
+    kept = [c["id"] for c in chunks if c["id"] not in fresh]
+    prev = _previous_vectors(coll, store_path, kept) if kept else {}
+    vectors = np.asarray([fresh[c["id"]] if c["id"] in fresh else prev[c["id"]] for c in chunks], dtype=np.float32)
+    if len(chunks):
+        save_store(store_path, vectors, [c["id"] for c in chunks], [c["text"] for c in chunks],
+                   [c["metadata"] for c in chunks], model=model_name)
+    dim = int(vectors.shape[1]) if len(chunks) else 0
+    if len(chunks):
+        build_quantized(store_path, quantize)
+    version = save_manifest(collection, model_name, chunks, dim, quantize)
+    save_lexical_index(collection, chunks, version)
+    save_sections(collection, chunks, version)
+    if dim:
+        register(collection, model_name, dim, normalize=True)
+    # Cached answers to paraphrased questions drew on the old chunks
+    invalidate_collection(collection)
+    return coll.count()
+
+def ingest(collections: Optional[List[str]] = None, model_name: Optional[str] = None, workers: int = WORKERS,
+           batch_size: int = BATCH_SIZE, dry_run: bool = False, full: bool = False,
+           quantize: Optional[str] = None):
+    # model_name / quantize switch the given collections to that encoder / index mode ("none"
+    # for the float index); by default each keeps what its manifest says
+    sources = discover_sources()
+    names = collections or sorted(sources)
+    plan = {}
+    for name in names:
+        if name not in sources:
+            print(f"[skip] unknown collection: {name} (known: {sorted(sources)})")
+            continue
+        chunks = load_chunks(sources[name])
+        model = canonical(model_name) if model_name else model_for(name)
+        manifest = load_manifest(name)
+        quant = (None if quantize == "none" else quantize) if quantize else manifest.get("quantize")
+        changed, removed, rebuild = diff_manifest({} if full else manifest, chunks, model)
+        plan[name] = (chunks, changed, removed, rebuild, model, quant)
+        print(f"[plan] {name}: {len(sources[name])} files, {len(chunks)} chunks, {model}, index={quant or 'float'}, "
+              f"{len(changed)} to embed, {len(removed)} to delete{' (full rebuild)' if rebuild else ''}")
+    todo = {name: p for name, p in plan.items() if p[1] or p[2] or p[3]}
+    if not dry_run:
+        # Collections indexed before the lexical / section index existed only need them built, not re-embedded
+        for name, (chunks, _, _, _, model, quant) in plan.items():
+            manifest = load_manifest(name)
+            version = manifest.get("version")
+            touched = False
+            if name not in todo and version and load_index(db_path_for(name), version) is None:
+                save_lexical_index(name, chunks, version)
+                print(f"[ok] {name}: lexical index built ({len(chunks)} chunks)")
+                touched = True
+            sections = load_sections(db_path_for(name)) if name not in todo and version else None
+            if name not in todo and version and (sections is None or sections.version != version):
+                print(f"[ok] {name}: {len(save_sections(name, chunks, version))} parent sections saved")
+                touched = True
+            # A new index mode only needs the codes rebuilt from the stored vectors
+            if name not in todo and version and manifest.get("quantize") != quant:
+                build_quantized(store_path_for_collection(name), quant)
+                save_manifest(name, model, chunks, manifest.get("dim", 0), quant)
+                print(f"[ok] {name}: index={quant or 'float'}")
+                touched = True
+            # Also the first run after snapshots were introduced
+            if name not in todo and (touched or snapshots.current(name) is None) and publish_snapshot(name):
+                print(f"[ok] {name}: snapshot {os.path.basename(snapshots.current(name))} published")
+    if dry_run or not todo:
+        if not dry_run:
+            print("[ok] all collections up to date")
+        return
+
+    # One encode pass per model over all its collections, so batches are full and each model loads once
+    by_model: Dict[str, List[str]] = {}
+    for name, p in todo.items():
+        by_model.setdefault(p[4], []).append(name)
+    for model, names in by_model.items():
+        to_embed = [c for name in names for c in todo[name][1]]
+        t0 = time.time()
+        vectors = encode_texts([c["text"] for c in to_embed], model, workers, batch_size)
+        print(f"[embed] {len(to_embed)} chunks with {model} in {time.time() - t0:.2f}s, {workers} worker(s)")
+
+        start = 0
+        for name in names:
+            chunks, changed, removed, rebuild, _, quant = todo[name]
+            count = write_collection(name, chunks, changed, vectors[start:start + len(changed)],
+                                     removed, rebuild, model, quant)
+            start += len(changed)
+            snap = publish_snapshot(name)
+            print(f"[ok] {name}: {count} records" + (f", snapshot {os.path.basename(snap)}" if snap else ""))
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Embed every cleaned template into the phase Chroma DBs.")
+    ap.add_argument("collections", nargs="*", help="collection names (default: all discovered)")
+    ap.add_argument("--model", help="re-embed the collections with this model "
+                    "(default: each collection's registered model, else EMBED_MODEL)")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="encoder processes (default: all cores)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--dry-run", action="store_true", help="only list files and pending changes")
+    ap.add_argument("--full", action="store_true", help="ignore manifests and re-embed everything")
+    ap.add_argument("--quantize", choices=QUANT_MODES + ("none",),
+                    help="compressed index for the store backend (default: keep each collection's setting)")
+    args = ap.parse_args(argv)
+    ingest(args.collections or None, args.model, args.workers, args.batch_size, args.dry_run, args.full,
+           args.quantize)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# lexical_index.py
+# BM25 inverted index over the same chunks as the vector collections. Built and saved by
+# ingest.py next to the manifest; a query only walks the postings of its own terms, so
+# template names ("SLA/MOU") and section numbers ("3.6.5") are O(postings) lookups.
+import os, re, json, math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+INDEX_NAME = "lexical_index.json"
+K1 = 1.2
+B = 0.75
+TITLE_BOOST = 2  # title / section number tokens are counted this many extra times
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))  # BM25 weight in hybrid fusion; 0 = dense only
+
+# Words plus dotted section numbers ("3.6.5") as single tokens
+TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it of on or should the this to what when "
+    "where which who whom why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+def index_text(document: str, metadata: Optional[Dict[str, Any]] = None) -> List[str]:
+    meta = metadata or {}
+    tokens = tokenize(document)
+    heading = tokenize(" ".join(str(meta.get(f) or "") for f in ("title", "section_number")))
+    return tokens + heading * TITLE_BOOST
+
+
+class BM25Index:
+    def __init__(self, ids: List[str], doc_len: List[int], postings: Dict[str, List[List[int]]],
+                 version: Optional[str] = None, k1: float = K1, b: float = B):
+        self.ids = ids
+        self.doc_len = doc_len
+        self.postings = postings  # term -> [[row, term frequency], ...]
+        self.version = version
+        self.k1, self.b = k1, b
+        self.avgdl = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+        n = len(ids)
+        self.idf = {t: math.log(1.0 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+
+    @classmethod
+    def build(cls, ids: Sequence[str], documents: Sequence[str],
+              metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+              version: Optional[str] = None) -> "BM25Index":
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        postings: Dict[str, List[List[int]]] = {}
+        doc_len = []
+        for row, (doc, meta) in enumerate(zip(documents, metadatas)):
+            tf = Counter(index_text(doc, meta))
+            doc_len.append(sum(tf.values()))
+            for term, n in tf.items():
+                postings.setdefault(term, []).append([row, n])
+        return cls(list(ids), doc_len, postings, version)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        # -> [(row, score)] best first
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for row, tf in plist:
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[row] / (self.avgdl or 1.0))
+                scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return sorted(scores.items(), key=lambda rs: (-rs[1], rs[0]))[:k]
+
+    def search_ids(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        return [(self.ids[row], score) for row, score in self.search(query, k)]
+
+    def lookup(self, term: str) -> List[str]:
+        # Exact-term lookup, e.g. a section number
+        return [self.ids[row] for row, _ in self.postings.get(term.lower(), [])]
+
+    def save(self, path: str):
+        payload = {"version": self.version, "k1": self.k1, "b": self.b, "ids": self.ids,
+                   "doc_len": self.doc_len, "postings": self.postings}
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            p = json.load(f)
+        return cls(p["ids"], p["doc_len"], p["postings"], p.get("version"), p.get("k1", K1), p.get("b", B))
+
+
+def load_index(db_path: str, version: Optional[str] = None) -> Optional[BM25Index]:
+    # The saved index for a collection, or None when missing or built for another version
+    fp = os.path.join(db_path, INDEX_NAME)
+    if not os.path.exists(fp):
+        return None
+    index = BM25Index.load(fp)
+    if version is not None and index.version != version:
+        return None
+    return index
+
+def rrf_merge(rankings: Sequence[Sequence[str]], weights: Optional[Sequence[float]] = None,
+              k: int = 10, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    # Weighted reciprocal-rank fusion of several best-first id lists
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    for ranking, w in zip(rankings, weights):
+        for rank, i in enumerate(ranking):
+            scores[i] = scores.get(i, 0.0) + w / (rrf_k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: -kv[1])[:k]
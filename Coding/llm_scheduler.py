@@ -0,0 +1,111 @@
+# llm_scheduler.py
+# Rate-limit-aware scheduling for async LLM calls: per-model concurrency caps,
+# token buckets for requests/min and tokens/min, and retry with exponential
+# backoff (honouring Retry-After) on 429 / 5xx / connection errors.
+import os, json, time, random, asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Defaults per model; override with MODEL_LIMITS='{"gpt-4o": {"concurrency": 4, "rpm": 500, "tpm": 30000}}'
+DEFAULT_LIMITS = {"concurrency": 8, "rpm": 500, "tpm": 200000}
+MODEL_LIMITS: Dict[str, Dict[str, int]] = {
+    "gpt-4o": {"concurrency": 8, "rpm": 500, "tpm": 30000},
+    "gpt-4o-mini": {"concurrency": 16, "rpm": 500, "tpm": 200000},
+    "gpt-5-nano": {"concurrency": 16, "rpm": 500, "tpm": 200000},
+}
+MODEL_LIMITS.update(json.loads(os.getenv("MODEL_LIMITS", "{}")))
+
+MAX_RETRIES  = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX  = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token is close enough for budgeting against TPM
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float = 1.0):
+        n = min(n, self.capacity)  # a single oversized request must still be able to run
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class ModelLimiter:
+    def __init__(self, model: str, concurrency: Optional[int] = None, rpm: Optional[int] = None,
+                 tpm: Optional[int] = None):
+        limits = {**DEFAULT_LIMITS, **MODEL_LIMITS.get(model, {})}
+        self.model = model
+        self.semaphore = asyncio.Semaphore(concurrency or limits["concurrency"])
+        self.requests = TokenBucket(rpm or limits["rpm"])
+        self.tokens = TokenBucket(tpm or limits["tpm"])
+
+    async def run(self, call: Callable[[], Awaitable[Any]], est_tokens: int = 1) -> Any:
+        async with self.semaphore:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(est_tokens)
+            return await with_retries(call)
+
+
+class Scheduler:
+    def __init__(self, concurrency: Optional[int] = None, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.overrides = {"concurrency": concurrency, "rpm": rpm, "tpm": tpm}
+        self.limiters: Dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self.limiters:
+            self.limiters[model] = ModelLimiter(model, **self.overrides)
+        return self.limiters[model]
+
+    async def run(self, model: str, call: Callable[[], Awaitable[Any]], est_tokens: int = 1) -> Any:
+        return await self.limiter(model).run(call, est_tokens)
+
+
+# Retries
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def is_retryable(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+async def with_retries(call: Callable[[], Awaitable[Any]], max_retries: int = MAX_RETRIES) -> Any:
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+            attempt += 1
+            print(f"[retry] {type(e).__name__} (attempt {attempt}/{max_retries}), sleeping {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,303 @@
+# mock_llm_server.py
+# Offline OpenAI-compatible stand-in for chat.completions and responses, so the
+# retrieval / orchestration path can be benchmarked and tested without network.
+#
+#   python Coding/mock_llm_server.py --port 8808 --latency lognormal:0.8,0.4 --error-rate 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=mock python benchmark.py
+#
+# Latency specs: "0" (none), "fixed:S", "uniform:LO,HI", "normal:MU,SIGMA", "lognormal:MEDIAN,SIGMA"
+# With stream=true the latency is the time to first token and --token-latency the gap between tokens.
+import os, re, sys, json, math, time, random, hashlib, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+DEFAULT_ANSWERS = [
+    "Not specified in the provided context.",
+    "Based on the context, the Project Manager coordinates the phase activities and ensures "
+    "deliverables are completed, reviewed and approved before the Stage Gate Review.",
+    "The context lists the key deliverables for this phase, each of which must be reviewed "
+    "by the Integrated Project Team and approved by the Business Owner.",
+    "According to the context, exit criteria are met once all required deliverables are "
+    "baselined and the governance board approves moving to the next phase.",
+]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def parse_latency(spec: str):
+    kind, _, params = spec.partition(":")
+    args = [float(p) for p in params.split(",") if p] if params else []
+    if kind in ("", "0", "none"):
+        return lambda rng: 0.0
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1])
+    raise ValueError(f"unknown latency spec: {spec!r}")
+
+
+class MockConfig:
+    def __init__(self, latency: str = "0", error_rate: float = 0.0, error_codes: str = "429,500,503",
+                 completion_tokens: int = 0, answers: Optional[Dict[str, str]] = None, seed: int = 0,
+                 token_latency: str = "0"):
+        self.sample_latency = parse_latency(latency)
+        self.sample_token_latency = parse_latency(token_latency)
+        self.error_rate = error_rate
+        self.error_codes = [int(c) for c in error_codes.split(",") if c]
+        self.completion_tokens = completion_tokens
+        self.answers = answers or {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "chat.completions": 0, "responses": 0, "streams": 0}
+
+    def draw(self):
+        # -> (latency seconds, error status or None); one shared seeded RNG keeps runs reproducible
+        with self.lock:
+            latency = self.sample_latency(self.rng)
+            error = self.rng.choice(self.error_codes) if self.error_codes and self.rng.random() < self.error_rate else None
+        return latency, error
+
+    def token_gap(self) -> float:
+        with self.lock:
+            return self.sample_token_latency(self.rng)
+
+    def answer_for(self, question: str) -> str:
+        q = question.lower()
+        for needle, answer in self.answers.items():
+            if needle.lower() in q:
+                text = answer
+                break
+        else:
+            digest = int(hashlib.sha1(question.encode("utf-8")).hexdigest(), 16)
+            text = DEFAULT_ANSWERS[digest % len(DEFAULT_ANSWERS)]
+        if self.completion_tokens:
+            # Pad / trim to roughly the requested number of output tokens
+            words = text.split()
+            filler = (words * (self.completion_tokens // max(1, len(words)) + 1))
+            text = " ".join(filler[: max(1, int(self.completion_tokens * 0.75))])
+        return text
+
+
+def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            content = m.get("content")
+            if isinstance(content, list):
+                return " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+            return str(content or "")
+    return ""
+
+def _question_of(prompt: str) -> str:
+    # qna.py / benchmark.py put the question after the context; answer on the question only
+    for marker in ("QUESTION:\n", "Question:\n"):
+        if marker in prompt:
+            return prompt.rsplit(marker, 1)[1].strip()
+    return prompt
+
+def _all_text(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(str(m.get("content") or "") for m in messages)
+
+
+def chat_completion(body: Dict[str, Any], answer: str, n: int) -> Dict[str, Any]:
+    messages = body.get("messages") or []
+    pt, ct = estimate_tokens(_all_text(messages)), estimate_tokens(answer)
+    return {
+        "id": f"chatcmpl-mock-{n}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": pt + ct},
+    }
+
+def response_object(body: Dict[str, Any], answer: str, n: int) -> Dict[str, Any]:
+    inp = body.get("input")
+    messages = inp if isinstance(inp, list) else [{"role": "user", "content": str(inp or "")}]
+    it, ot = estimate_tokens(_all_text(messages)), estimate_tokens(answer)
+    return {
+        "id": f"resp_mock_{n}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "mock"),
+        "status": "completed",
+        "output": [{
+            "type": "message", "id": f"msg_mock_{n}", "status": "completed", "role": "assistant",
+            "content": [{"type": "output_text", "text": answer, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {"input_tokens": it, "output_tokens": ot, "total_tokens": it + ot,
+                  "input_tokens_details": {"cached_tokens": 0},
+                  "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+# Streaming payloads: each generator yields (event dict, is_token)
+def split_tokens(answer: str) -> List[str]:
+    return re.findall(r"\S+\s*", answer) or [answer]
+
+def chat_completion_chunks(body: Dict[str, Any], answer: str, n: int):
+    base = {"id": f"chatcmpl-mock-{n}", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", "mock")}
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}, False
+    for piece in split_tokens(answer):
+        yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}, True
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}, False
+    if (body.get("stream_options") or {}).get("include_usage"):
+        usage = chat_completion(body, answer, n)["usage"]
+        yield {**base, "choices": [], "usage": usage}, False
+
+def response_events(body: Dict[str, Any], answer: str, n: int):
+    final = response_object(body, answer, n)
+    pending = {**final, "status": "in_progress", "output": [], "usage": None}
+    item_id = f"msg_mock_{n}"
+    seq = iter(range(1 << 30))
+    yield {"type": "response.created", "response": pending, "sequence_number": next(seq)}, False
+    for piece in split_tokens(answer):
+        yield {"type": "response.output_text.delta", "item_id": item_id, "output_index": 0, "content_index": 0,
+               "delta": piece, "logprobs": [], "sequence_number": next(seq)}, True
+    yield {"type": "response.output_text.done", "item_id": item_id, "output_index": 0, "content_index": 0,
+           "text": answer, "logprobs": [], "sequence_number": next(seq)}, False
+    yield {"type": "response.completed", "response": final, "sequence_number": next(seq)}, False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config: MockConfig = MockConfig()
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # streamed tokens go out as soon as they are written
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, events):
+        # Server-sent events; the connection closes at the end instead of a Content-Length
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        first = True
+        for event, is_token in events:
+            if is_token and not first:
+                time.sleep(self.config.token_gap())
+            first = first and not is_token
+            name = f"event: {event['type']}\n" if "type" in event else ""
+            self.wfile.write(f"{name}data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        if "messages" in self._body:
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip("/") in ("/stats", "/v1/stats"):
+            with self.config.lock:
+                stats = dict(self.config.stats)
+            self._send_json(200, stats)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            kind = "chat.completions"
+        elif path.endswith("/responses"):
+            kind = "responses"
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self._body = json.loads(self.rfile.read(length) or b"{}")
+
+        cfg = self.config
+        with cfg.lock:
+            cfg.stats["requests"] += 1
+            cfg.stats[kind] += 1
+            cfg.stats["streams"] += bool(body.get("stream"))
+            n = cfg.stats["requests"]
+        latency, error = cfg.draw()
+        time.sleep(latency)
+        if error is not None:
+            with cfg.lock:
+                cfg.stats["errors"] += 1
+            etype = "rate_limit_error" if error == 429 else "server_error"
+            self._send_json(error, {"error": {"message": f"mock injected {error}", "type": etype, "code": str(error)}},
+                            {"Retry-After": "0.1"} if error == 429 else None)
+            return
+
+        if kind == "chat.completions":
+            messages = body.get("messages") or []
+        else:
+            inp = body.get("input")
+            messages = inp if isinstance(inp, list) else [{"role": "user", "content": str(inp or "")}]
+        answer = cfg.answer_for(_question_of(_last_user_text(messages)))
+        if body.get("stream"):
+            self._send_stream(chat_completion_chunks(body, answer, n) if kind == "chat.completions"
+                              else response_events(body, answer, n))
+            return
+        payload = chat_completion(body, answer, n) if kind == "chat.completions" else response_object(body, answer, n)
+        self._send_json(200, payload)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(host: str = "127.0.0.1", port: int = 8808, config: Optional[MockConfig] = None) -> MockServer:
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    return MockServer((host, port), handler)
+
+def start_in_thread(port: int = 0, config: Optional[MockConfig] = None):
+    # -> (server, base_url); port=0 picks a free port
+    server = serve("127.0.0.1", port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Offline OpenAI-compatible mock server.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=int(os.getenv("MOCK_LLM_PORT", "8808")))
+    ap.add_argument("--latency", default="0", help='e.g. "fixed:0.5", "uniform:0.2,1.5", "lognormal:0.8,0.4"')
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    ap.add_argument("--error-codes", default="429,500,503")
+    ap.add_argument("--completion-tokens", type=int, default=0, help="pad answers to ~N output tokens")
+    ap.add_argument("--token-latency", default="0", help='gap between streamed tokens, e.g. "fixed:0.02"')
+    ap.add_argument("--answers", help="JSON file mapping question substrings to canned answers")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    answers = None
+    if args.answers:
+        with open(args.answers, "r", encoding="utf-8") as f:
+            answers = json.load(f)
+    config = MockConfig(args.latency, args.error_rate, args.error_codes, args.completion_tokens, answers, args.seed,
+                        args.token_latency)
+    server = serve(args.host, args.port, config)
+    print(f"[mock] OpenAI-compatible server on http://{args.host}:{args.port}/v1 "
+          f"(latency={args.latency}, token_latency={args.token_latency}, error_rate={args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[mock] bye.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
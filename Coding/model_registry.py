@@ -0,0 +1,192 @@
+# model_registry.py
+# Which encoder built each collection: model name, dimension and normalization, kept in
+# one JSON file next to the vector DBs as a fallback for collections that don't declare
+# their model themselves (Chroma "embed_model" metadata, a store's "model" field). Queries are embedded with the collection's own
+# model, and every encoder is loaded once per process and shared by whoever asks for it.
+#
+#   python Coding/model_registry.py           # show the model per collection
+#   python Coding/model_registry.py --scan    # record collections that aren't registered yet
+import os, sys, json, time, sqlite3, argparse, threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from embedding_store import DATA_DIR
+
+REGISTRY_PATH = os.getenv("MODEL_REGISTRY", os.path.join(DATA_DIR, "Vector DataBase", "model_registry.json"))
+
+
+class ModelSpec(NamedTuple):
+    name: str
+    dim: int
+    normalize: bool = True
+
+
+# Encoders used across the repo; the dimension also identifies the model of an unregistered collection
+KNOWN_MODELS = {s.name: s for s in (
+    ModelSpec("sentence-transformers/all-MiniLM-L6-v2", 384),
+    ModelSpec("sentence-transformers/all-mpnet-base-v2", 768),
+    ModelSpec("BAAI/bge-large-en-v1.5", 1024),
+)}
+# Short names as passed to SentenceTransformer(...) in the notebooks
+ALIASES = {name.split("/", 1)[1]: name for name in KNOWN_MODELS if name.startswith("sentence-transformers/")}
+
+
+def canonical(model: str) -> str:
+    return ALIASES.get(model, model)
+
+def spec_for(model: str, dim: Optional[int] = None, normalize: bool = True) -> ModelSpec:
+    model = canonical(model)
+    known = KNOWN_MODELS.get(model)
+    if known is not None:
+        return known
+    if dim is None:
+        raise LookupError(f"unknown embedding model {model!r}; its dimension is needed to register it")
+    return ModelSpec(model, int(dim), normalize)
+
+def infer_model(dim: int) -> Optional[ModelSpec]:
+    # The known model with this dimension, when exactly one has it
+    matches = [s for s in KNOWN_MODELS.values() if s.dim == dim]
+    return matches[0] if len(matches) == 1 else None
+
+
+# Registry file
+_file_lock = threading.Lock()
+
+def load_registry(path: str = REGISTRY_PATH) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("collections", {})
+    except (OSError, ValueError):
+        return {}
+
+def register(collection: str, model: str, dim: int, normalize: bool = True,
+             path: str = REGISTRY_PATH) -> ModelSpec:
+    spec = ModelSpec(canonical(model), int(dim), bool(normalize))
+    known = KNOWN_MODELS.get(spec.name)
+    if known is not None and known.dim != spec.dim:
+        raise ValueError(f"{collection}: {spec.name} produces {known.dim}-dim vectors, got {spec.dim}")
+    with _file_lock:
+        entries = load_registry(path)
+        entries[collection] = {"model": spec.name, "dim": spec.dim, "normalize": spec.normalize,
+                               "updated": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"collections": dict(sorted(entries.items()))}, f, indent=1)
+        os.replace(path + ".tmp", path)
+    return spec
+
+def registered(collection: str, path: str = REGISTRY_PATH) -> Optional[ModelSpec]:
+    entry = load_registry(path).get(collection)
+    if not entry:
+        return None
+    return ModelSpec(entry["model"], int(entry["dim"]), bool(entry.get("normalize", True)))
+
+
+def chroma_catalog(db_path: str) -> Dict[str, Tuple[int, Optional[str]]]:
+    # -> {collection: (dim, "embed_model" metadata)} read from the sqlite catalog without a client
+    fp = os.path.join(db_path, "chroma.sqlite3")
+    found: Dict[str, Tuple[int, Optional[str]]] = {}
+    if not os.path.exists(fp):
+        return found
+    con = sqlite3.connect(f"file:{fp}?mode=ro", uri=True)
+    try:
+        rows = con.execute(
+            "SELECT c.name, c.dimension, m.str_value FROM collections c LEFT JOIN collection_metadata m"
+            " ON m.collection_id = c.id AND m.key = 'embed_model'").fetchall()
+        found = {name: (int(dim or 0), model) for name, dim, model in rows}
+    except sqlite3.Error:
+        pass
+    finally:
+        con.close()
+    return found
+
+def resolve(collection: str, db_path: Optional[str] = None, dim: Optional[int] = None,
+            model: Optional[str] = None) -> ModelSpec:
+    # What the collection says about itself (Chroma metadata or the store's model field) first:
+    # the registry is keyed by name only, so a same-named collection in another DB may differ.
+    # Then the registry, when its dimension fits, then the one known model with that dimension.
+    if db_path and dim is None and model is None:
+        dim, model = chroma_catalog(db_path).get(collection, (None, None))
+    spec = registered(collection)
+    if model:
+        declared = spec_for(model, dim)
+        if spec is not None and spec.name != declared.name:
+            print(f"[models] {collection}: built with {declared.name}; the registry's {spec.name} "
+                  f"entry is for another collection of that name")
+        spec = declared
+    elif spec is not None and dim and spec.dim != dim:
+        print(f"[models] {collection}: registry says {spec.name} ({spec.dim}-dim) but the collection "
+              f"holds {dim}-dim vectors; ignoring the registry entry")
+        spec = infer_model(dim)
+    elif spec is None and dim:
+        spec = infer_model(dim)
+    if spec is None:
+        raise LookupError(f"no embedding model registered for {collection!r} (dim={dim}); "
+                          f"run ingest.py or `model_registry.py --scan`")
+    if dim and spec.dim != dim:
+        raise RuntimeError(f"{collection}: declared model {spec.name} ({spec.dim}-dim) "
+                           f"but the collection holds {dim}-dim vectors; re-embed it with ingest.py")
+    return spec
+
+
+# Shared encoders
+_encoders: Dict[Tuple[str, str, Optional[str]], Any] = {}
+_encoder_locks: Dict[Tuple[str, str, Optional[str]], threading.Lock] = {}
+
+def get_encoder(model: str, backend: str = "torch", path: Optional[str] = None):
+    # One SentenceTransformer per (model, backend, local path) per process, built by the first caller
+    key = (canonical(model), backend, path)
+    enc = _encoders.get(key)
+    if enc is not None:
+        return enc
+    with _file_lock:
+        lock = _encoder_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _encoders:
+            from sentence_transformers import SentenceTransformer
+            t0 = time.perf_counter()
+            kwargs = {"backend": backend} if backend != "torch" else {}
+            _encoders[key] = SentenceTransformer(path or key[0], device="cpu", **kwargs)
+            print(f"[models] {path or key[0]} ({backend}) loaded in {time.perf_counter() - t0:.2f}s")
+    return _encoders[key]
+
+def is_loaded(model: str, backend: str = "torch", path: Optional[str] = None) -> bool:
+    return (canonical(model), backend, path) in _encoders
+
+def encode(model: str, texts: List[str], normalize: bool = True, batch_size: int = 64,
+           backend: str = "torch", path: Optional[str] = None):
+    # -> float32 (n, dim) array
+    return get_encoder(model, backend, path).encode(texts, batch_size=batch_size, normalize_embeddings=normalize,
+                                                    convert_to_numpy=True, show_progress_bar=False)
+
+
+# CLI
+def scan(root: str = os.path.dirname(REGISTRY_PATH)) -> Dict[str, Optional[ModelSpec]]:
+    # Every Chroma collection under root -> its model (registry, metadata or inferred from the dim)
+    found: Dict[str, Optional[ModelSpec]] = {}
+    for d in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        for name, (dim, model) in chroma_catalog(os.path.join(root, d)).items():
+            try:
+                found[name] = resolve(name, dim=dim, model=model)
+            except (LookupError, RuntimeError) as e:
+                print(f"[models] {name}: {e}")
+                found[name] = None
+    return found
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Show or record the embedding model of each collection.")
+    ap.add_argument("--scan", action="store_true", help="register collections that aren't in the registry yet")
+    args = ap.parse_args(argv)
+    entries = load_registry()
+    for name, spec in scan().items():
+        state = "registered" if name in entries else "inferred"
+        if spec is None:
+            print(f"{name:<24}unknown")
+            continue
+        if args.scan and name not in entries:
+            register(name, spec.name, spec.dim, spec.normalize)
+            state = "registered now"
+        print(f"{name:<24}{spec.name:<42}{spec.dim:>6}  {state}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
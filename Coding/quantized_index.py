@@ -0,0 +1,303 @@
+# quantized_index.py
+# Compressed in-memory vectors for the store backend: int8 scalar quantization (4x smaller)
+# or product quantization (16x smaller by default). Candidates are scored on the codes, and
+# the top RERANK_FACTOR * k are re-scored exactly against the float rows, which stay
+# memory-mapped in the binary store, so only those rows are paged in.
+#
+#   python Coding/ingest.py EPLC --quantize pq     # codes saved next to the collection's store
+#   python Coding/quantized_index.py               # memory and recall@k vs the float index
+#   python Coding/quantized_index.py --mode int8 --k 5 path/to/store
+import os, sys, glob, json, time, argparse
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_store import STORE_DIR, TABLE_SUFFIX, load_store
+from search_engine import Hit, VectorIndex, normalize_rows, top_k_indices
+
+QUANT_SUFFIX  = ".quant.npz"
+MODES         = ("int8", "pq")
+RERANK_FACTOR = int(os.getenv("QUANT_RERANK", "4"))  # float rerank over this many x k candidates
+PQ_DSUB       = int(os.getenv("PQ_DSUB", "4"))       # dims per PQ sub-vector; 1 byte each -> 4*dsub x smaller
+PQ_CENTROIDS  = 256
+PQ_TRAIN_ROWS = 20000
+PQ_ITERS      = 15
+BLOCK_ROWS    = 8192  # rows decoded per step, bounds the scratch memory of a query
+
+
+class Int8Codec:
+    # Per-dimension min/max scalar quantization to uint8
+    mode = "int8"
+
+    def __init__(self, lo: np.ndarray, scale: np.ndarray):
+        self.lo, self.scale = lo.astype(np.float32), scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, mat: np.ndarray) -> "Int8Codec":
+        lo, hi = mat.min(axis=0), mat.max(axis=0)
+        return cls(lo, np.maximum(hi - lo, 1e-12) / 255.0)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((mat - self.lo) / self.scale), 0, 255).astype(np.uint8)
+
+    def scores(self, q: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # q . (lo + scale * code) without decoding the whole matrix
+        qs, bias = q * self.scale, q @ self.lo
+        out = np.empty((q.shape[0], len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            block = codes[start:start + BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = qs @ block.T
+        return out + bias[:, None]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"lo": self.lo, "scale": self.scale}
+
+    @property
+    def nbytes(self) -> int:
+        return self.lo.nbytes + self.scale.nbytes
+
+
+class PQCodec:
+    # Product quantization: dim split into sub-vectors of PQ_DSUB dims, each replaced by the
+    # id of its nearest of up to 256 k-means centroids; scored with per-query lookup tables.
+    # Codes are stored one row per sub-vector, (m, n), so each table lookup reads contiguously.
+    mode = "pq"
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids.astype(np.float32)  # (m, ks, dsub)
+
+    @classmethod
+    def train(cls, mat: np.ndarray, dsub: int = PQ_DSUB, ks: int = PQ_CENTROIDS,
+              iters: int = PQ_ITERS, seed: int = 0) -> "PQCodec":
+        n, dim = mat.shape
+        if dim % dsub:
+            raise ValueError(f"PQ needs dim ({dim}) divisible by the sub-vector size ({dsub})")
+        rng = np.random.default_rng(seed)
+        sample = mat[rng.choice(n, PQ_TRAIN_ROWS, replace=False)] if n > PQ_TRAIN_ROWS else mat
+        ks = min(ks, len(sample))
+        m = dim // dsub
+        subs = sample.reshape(len(sample), m, dsub)
+        centroids = np.empty((m, ks, dsub), dtype=np.float32)
+        for j in range(m):
+            x = subs[:, j, :]
+            c = x[rng.choice(len(x), ks, replace=False)].copy()
+            for _ in range(iters):
+                assign = _nearest(x, c)
+                sums = np.zeros_like(c)
+                np.add.at(sums, assign, x)
+                counts = np.bincount(assign, minlength=ks)
+                filled = counts > 0
+                c[filled] = sums[filled] / counts[filled, None]
+            centroids[j] = c
+        return cls(centroids)
+
+    def encode(self, mat: np.ndarray) -> np.ndarray:
+        m, _, dsub = self.centroids.shape
+        subs = mat.reshape(len(mat), m, dsub)
+        return np.stack([_nearest(subs[:, j, :], self.centroids[j]) for j in range(m)]).astype(np.uint8)
+
+    def scores(self, q: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        m, _, dsub = self.centroids.shape
+        tables = np.einsum("bmd,mkd->bmk", q.reshape(len(q), m, dsub), self.centroids)
+        out = np.zeros((q.shape[0], codes.shape[1]), dtype=np.float32)
+        for b in range(len(q)):
+            for j in range(m):
+                out[b] += tables[b, j].take(codes[j])
+        return out
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes
+
+
+def _nearest(x: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 over the rows of c
+    return np.argmin((c * c).sum(axis=1)[None, :] - 2.0 * x @ c.T, axis=1)
+
+def _codec(mode: str, arrays) -> Any:
+    if mode == "int8":
+        return Int8Codec(arrays["lo"], arrays["scale"])
+    if mode == "pq":
+        return PQCodec(arrays["centroids"])
+    raise ValueError(f"unknown quantization {mode!r}; expected one of {MODES}")
+
+def _normalized_rows(vectors, rows=None) -> np.ndarray:
+    return normalize_rows(np.asarray(vectors if rows is None else vectors[rows], dtype=np.float32))
+
+
+class QuantizedIndex:
+    # Same search interface as search_engine.VectorIndex
+    def __init__(self, codec, codes: np.ndarray, vectors, ids: Sequence[str],
+                 titles: Optional[Sequence[str]] = None, rerank: int = RERANK_FACTOR):
+        self.codec = codec
+        self.codes = codes
+        self.vectors = vectors  # float rows, normally a memory map; only read for the rerank
+        self.ids = list(ids)
+        self.titles = list(titles) if titles is not None else [""] * len(self.ids)
+        self.rerank = rerank
+
+    @property
+    def mode(self) -> str:
+        return self.codec.mode
+
+    @classmethod
+    def build(cls, store, mode: str) -> "QuantizedIndex":
+        mat = np.concatenate([_normalized_rows(store.vectors[s:s + BLOCK_ROWS])
+                              for s in range(0, len(store), BLOCK_ROWS)]) if len(store) else \
+            np.zeros((0, store.dim), dtype=np.float32)
+        if mode not in MODES:
+            raise ValueError(f"unknown quantization {mode!r}; expected one of {MODES}")
+        codec = Int8Codec.train(mat) if mode == "int8" else PQCodec.train(mat)
+        return cls(codec, codec.encode(mat), store.vectors, store.ids,
+                   [m.get("title", "") for m in store.metadatas])
+
+    @classmethod
+    def from_store(cls, store) -> Optional["QuantizedIndex"]:
+        # The codes saved by ingest for this store, or None when missing or older than the store
+        fp = store.info["path"] + QUANT_SUFFIX
+        if not os.path.exists(fp):
+            return None
+        with np.load(fp) as z:
+            if int(z["count"]) != len(store) or float(z["mtime"]) < store.info["mtime"]:
+                print(f"[quantized] {fp} is stale; using the float index")
+                return None
+            arrays = {k: z[k] for k in z.files}
+        return cls(_codec(str(arrays["mode"]), arrays), arrays["codes"], store.vectors, store.ids,
+                   [m.get("title", "") for m in store.metadatas])
+
+    def save(self, store_path: str) -> str:
+        fp = store_path + QUANT_SUFFIX
+        with open(fp + ".tmp", "wb") as f:
+            np.savez(f, mode=np.array(self.mode), codes=self.codes, count=np.array(len(self)),
+                     mtime=np.array(time.time()), **self.codec.arrays())
+        os.replace(fp + ".tmp", fp)
+        return fp
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1])
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.codes.nbytes // max(1, len(self))
+
+    @property
+    def nbytes(self) -> int:
+        # Resident size: codes plus codebooks (the float rows stay on disk)
+        return self.codes.nbytes + self.codec.nbytes
+
+    def centroid(self) -> np.ndarray:
+        return sum(_normalized_rows(self.vectors[s:s + BLOCK_ROWS]).sum(axis=0)
+                   for s in range(0, len(self), BLOCK_ROWS)) / max(1, len(self))
+
+    def approx_scores(self, queries) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        return self.codec.scores(normalize_rows(q[None, :] if q.ndim == 1 else q), self.codes)
+
+    def score_rows(self, query, rows: Sequence[int]) -> np.ndarray:
+        q = normalize_rows(np.asarray(query, dtype=np.float32).ravel())
+        return _normalized_rows(self.vectors, np.asarray(rows, dtype=np.int64)) @ q
+
+    def search(self, queries, k: int = 5, rerank: Optional[int] = None) -> List[List[Hit]]:
+        q = np.asarray(queries, dtype=np.float32)
+        q = q[None, :] if q.ndim == 1 else q
+        rerank = self.rerank if rerank is None else rerank
+        approx = self.approx_scores(q)
+        candidates = top_k_indices(approx, max(k, k * rerank))
+        out = []
+        for qi, rows, row_scores in zip(q, candidates, approx):
+            if rerank:
+                # Exact float scores for the candidates; rows read in file order
+                rows = np.sort(rows)
+                exact = self.score_rows(qi, rows)
+                order = np.argsort(-exact, kind="stable")[:k]
+                out.append([Hit(self.ids[rows[i]], self.titles[rows[i]], float(exact[i]), int(rows[i])) for i in order])
+            else:
+                out.append([Hit(self.ids[i], self.titles[i], float(row_scores[i]), int(i)) for i in rows[:k]])
+        return out
+
+    def search_one(self, query, k: int = 5) -> List[Hit]:
+        return self.search(query, k)[0]
+
+
+def build_quantized(store_path: str, mode: Optional[str]) -> Optional[str]:
+    # Build (or with mode None, remove) the codes for a binary store; -> codes path
+    fp = store_path + QUANT_SUFFIX
+    if not mode or mode == "none":
+        if os.path.exists(fp):
+            os.remove(fp)
+        return None
+    return QuantizedIndex.build(load_store(store_path), mode).save(store_path)
+
+def open_index(store):
+    # Quantized index when ingest built one for this store, else the float index
+    return QuantizedIndex.from_store(store) or VectorIndex.from_store(store)
+
+
+# Report: memory and recall@k against the exact float index
+def evaluate(store, mode: str, k: int = 10, queries: int = 200, seed: int = 0) -> Dict[str, Any]:
+    # Leave-one-out: sampled rows are the queries and each one's own row is excluded from both
+    # result lists, so recall@k is the overlap with the float top-k of a near-duplicate query
+    exact_index = VectorIndex.from_store(store)
+    t0 = time.perf_counter()
+    quant = QuantizedIndex.build(store, mode)
+    build_s = time.perf_counter() - t0
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(store), min(queries, len(store)), replace=False)
+    q = exact_index.matrix[rows]
+    exact = [[h.index for h in hits if h.index != r][:k] for r, hits in zip(rows, exact_index.search(q, k + 1))]
+    # Per-vector ratio is what scales with the corpus; the codebook is a fixed cost per collection
+    result = {"mode": mode, "count": len(store), "dim": store.dim, "build_s": round(build_s, 3),
+              "float_bytes": int(len(store) * store.dim * 4), "quant_bytes": int(quant.nbytes),
+              "bytes_per_vector": quant.bytes_per_vector, "float_bytes_per_vector": int(store.dim * 4)}
+    result["ratio"] = round(result["float_bytes_per_vector"] / result["bytes_per_vector"], 2)
+    for label, rerank in (("recall_no_rerank", 0), ("recall", quant.rerank)):
+        t0 = time.perf_counter()
+        found = quant.search(q, k + 1, rerank=rerank)
+        result[f"{label}_ms"] = round((time.perf_counter() - t0) * 1000 / len(rows), 3)
+        got = [[h.index for h in hits if h.index != r][:k] for r, hits in zip(rows, found)]
+        result[label] = round(float(np.mean([len(set(g) & set(e)) / max(1, len(e)) for g, e in zip(got, exact)])), 4)
+    return result
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Memory and recall@k of the quantized index vs the float index.")
+    ap.add_argument("stores", nargs="*", help="binary store paths (default: every store under Data/Embedding Store)")
+    ap.add_argument("--mode", choices=MODES, nargs="*", default=list(MODES))
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--out", help="also write the report as JSON")
+    args = ap.parse_args(argv)
+
+    paths = args.stores or sorted(fp[: -len(TABLE_SUFFIX)] for fp in
+                                  glob.glob(os.path.join(STORE_DIR, "**", "*" + TABLE_SUFFIX), recursive=True))
+    report = {}
+    print(f"{'store':<36}{'mode':<6}{'n':>6}{'dim':>6}{'float KB':>10}{'quant KB':>10}{'B/vec':>7}{'x':>6}"
+          f"{'recall@' + str(args.k):>11}{'no rerank':>11}{'ms/q':>8}")
+    for path in paths:
+        store = load_store(path)
+        if len(store) <= args.k:
+            continue
+        name = os.path.relpath(path, STORE_DIR) if path.startswith(STORE_DIR) else path
+        for mode in args.mode:
+            try:
+                r = evaluate(store, mode, args.k, args.queries)
+            except ValueError as e:
+                print(f"{name[-35:]:<36}{mode:<6}skipped: {e}")
+                continue
+            report.setdefault(name, []).append(r)
+            print(f"{name[-35:]:<36}{mode:<6}{r['count']:>6}{r['dim']:>6}{r['float_bytes'] / 1024:>10.1f}"
+                  f"{r['quant_bytes'] / 1024:>10.1f}{r['bytes_per_vector']:>7}{r['ratio']:>6.1f}{r['recall']:>11.3f}"
+                  f"{r['recall_no_rerank']:>11.3f}{r['recall_ms']:>8.2f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
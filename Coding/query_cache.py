@@ -0,0 +1,108 @@
+# query_cache.py
+# Size-bounded LRU cache (SQLite) for query embeddings and top-k retrieval results.
+# Embeddings are keyed by (model, normalized query); results additionally by the
+# collection version and k, so a re-index makes old results unreachable.
+import os, re, json, time, sqlite3, hashlib, threading
+from array import array
+from typing import List, Optional, Tuple
+
+_SPACE = re.compile(r"\s+")
+_TRAIL = re.compile(r"[\s?.!]+$")
+
+
+def normalize_query(query: str) -> str:
+    return _TRAIL.sub("", _SPACE.sub(" ", query.strip().lower()))
+
+def _key(*parts) -> str:
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    def __init__(self, path: str, model: str, version: str = "", max_entries: int = 10000):
+        self.path = path
+        self.model = model
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT, query TEXT, vec BLOB, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, model TEXT, version TEXT, k INTEGER, query TEXT,"
+            " ids TEXT, docs TEXT, dists TEXT, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_lru ON results(last_used)")
+
+    # Embeddings; `model` overrides the cache's model when a query is embedded with several
+    def get_embedding(self, query: str, model: Optional[str] = None) -> Optional[List[float]]:
+        key = _key(model or self.model, normalize_query(query))
+        with self._lock:
+            row = self._db.execute("SELECT vec FROM embeddings WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE embeddings SET last_used=? WHERE key=?", (time.time(), key))
+        return array("f", row[0]).tolist()
+
+    def put_embedding(self, query: str, vec: List[float], model: Optional[str] = None):
+        q, model = normalize_query(query), model or self.model
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?,?,?,?,?)",
+                (_key(model, q), model, q, array("f", vec).tobytes(), time.time()),
+            )
+            self._evict("embeddings")
+
+    # Retrieval results
+    def get_results(self, query: str, k: int) -> Optional[Tuple[list, list, list]]:
+        key = _key(self.model, self.version, k, normalize_query(query))
+        with self._lock:
+            row = self._db.execute("SELECT ids, docs, dists FROM results WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE results SET last_used=? WHERE key=?", (time.time(), key))
+        return json.loads(row[0]), json.loads(row[1]), json.loads(row[2])
+
+    def put_results(self, query: str, k: int, ids: list, docs: list, dists: list):
+        q = normalize_query(query)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?,?)",
+                (_key(self.model, self.version, k, q), self.model, self.version, k, q,
+                 json.dumps(ids), json.dumps(docs, ensure_ascii=False), json.dumps(dists), time.time()),
+            )
+            self._evict("results")
+
+    # Housekeeping
+    def _evict(self, table: str):
+        (n,) = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        if n > self.max_entries:
+            self._db.execute(
+                f"DELETE FROM {table} WHERE key IN "
+                f"(SELECT key FROM {table} ORDER BY last_used ASC LIMIT ?)",
+                (n - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def close(self):
+        self._db.close()
+
+
+def open_default(model: str, version: str) -> Optional[QueryCache]:
+    if os.getenv("QUERY_CACHE", "1") == "0":
+        return None
+    path = os.getenv("QUERY_CACHE_PATH", "./query_cache.sqlite3")
+    return QueryCache(path, model, version, int(os.getenv("QUERY_CACHE_SIZE", "10000")))
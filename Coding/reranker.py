@@ -0,0 +1,129 @@
+# reranker.py
+# Optional second stage after vector / hybrid retrieval: over-fetch candidates, score every
+# (question, chunk) pair with a small CPU cross-encoder in one batch, keep the best k.
+# Scores are cached per (query, chunk text). A per-request latency budget falls back to the
+# retrieval order when the model is still loading or scoring runs over; the late scores
+# still land in the cache for the next time the question comes in.
+#
+#   RERANK=1 python "Coding/Q&A/qna.py"
+#   RERANK=1 RERANK_FETCH=30 RERANK_BUDGET_MS=150 RERANK_MIN_SCORE=0 python rag_benchmark.py --no-llm
+import os, time, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from query_cache import normalize_query
+
+RERANK            = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL      = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH      = int(os.getenv("RERANK_FETCH", "20"))  # candidates retrieved for the cross-encoder
+RERANK_BUDGET_MS  = float(os.getenv("RERANK_BUDGET_MS", "250"))
+RERANK_BATCH      = int(os.getenv("RERANK_BATCH", "32"))
+RERANK_THREADS    = int(os.getenv("RERANK_THREADS", "2"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# Chunks scoring below this are dropped, so weak matches stop filling the prompt (unset = keep k)
+RERANK_MIN_SCORE  = float(os.environ["RERANK_MIN_SCORE"]) if os.getenv("RERANK_MIN_SCORE") else None
+MAX_CHARS         = 2000  # the cross-encoder truncates at 512 tokens anyway
+
+
+class Reranked(NamedTuple):
+    order: List[int]               # candidate positions, best first
+    scores: List[Optional[float]]  # cross-encoder score per position in `order` (None on fallback)
+    reranked: bool                 # False: budget ran out or the model wasn't loaded; order is the retrieval order
+
+
+class Reranker:
+    def __init__(self, model: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS,
+                 batch_size: int = RERANK_BATCH, threads: int = RERANK_THREADS,
+                 cache_size: int = RERANK_CACHE_SIZE, min_score: Optional[float] = RERANK_MIN_SCORE):
+        self.model_name = model
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.min_score = min_score
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rerank")
+        self.lock = threading.Lock()
+        self.cache: "OrderedDict[str, float]" = OrderedDict()
+        self.model = None
+        self.loading: Optional[Future] = None
+        self.counts = {"reranked": 0, "fallbacks": 0, "pair_hits": 0, "pair_misses": 0}
+
+    # Model
+    def _load(self):
+        from sentence_transformers import CrossEncoder
+        t0 = time.perf_counter()
+        model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+        print(f"[rerank] {self.model_name} loaded in {time.perf_counter() - t0:.2f}s")
+        self.model = model
+        return model
+
+    def warm_up(self) -> Future:
+        # Starts loading the cross-encoder in the background (once)
+        with self.lock:
+            if self.loading is None:
+                self.loading = self.pool.submit(self._load)
+            return self.loading
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    # Score cache
+    @staticmethod
+    def _key(query: str, text: str) -> str:
+        return hashlib.sha1(f"{normalize_query(query)}\x1f{text}".encode("utf-8")).hexdigest()
+
+    def _cached(self, keys: Sequence[str]) -> Dict[str, float]:
+        with self.lock:
+            found = {}
+            for key in keys:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    found[key] = self.cache[key]
+            self.counts["pair_hits"] += len(found)
+            self.counts["pair_misses"] += len(keys) - len(found)
+            return found
+
+    def _predict(self, query: str, texts: Sequence[str], keys: Sequence[str]) -> Dict[str, float]:
+        pairs = [(query, (t or "")[:MAX_CHARS]) for t in texts]
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        out = {key: float(s) for key, s in zip(keys, scores)}
+        with self.lock:
+            self.cache.update(out)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return out
+
+    # Reranking
+    def rerank(self, query: str, texts: Sequence[str], k: int, budget_ms: Optional[float] = None) -> Reranked:
+        t0 = time.perf_counter()
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000.0
+        keys = [self._key(query, t or "") for t in texts]
+        scores = self._cached(keys)
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+        if missing:
+            if not self.ready:
+                self.warm_up()
+                return self._fallback(len(texts), k)
+            future = self.pool.submit(self._predict, query, [texts[i] for i in missing], [keys[i] for i in missing])
+            try:
+                scores.update(future.result(timeout=max(0.0, budget - (time.perf_counter() - t0))))
+            except FutureTimeout:
+                return self._fallback(len(texts), k)
+        order = sorted(range(len(texts)), key=lambda i: (-scores[keys[i]], i))
+        if self.min_score is not None:
+            order = [i for i in order if scores[keys[i]] >= self.min_score]
+        order = order[:k]
+        with self.lock:
+            self.counts["reranked"] += 1
+        return Reranked(order, [scores[keys[i]] for i in order], True)
+
+    def _fallback(self, n: int, k: int) -> Reranked:
+        with self.lock:
+            self.counts["fallbacks"] += 1
+        order = list(range(min(n, k)))
+        return Reranked(order, [None] * len(order), False)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {**self.counts, "cached_pairs": len(self.cache), "loaded": int(self.ready)}
@@ -0,0 +1,67 @@
+# retrieval_metrics.py
+# Gold question sets and the latency / relevance statistics (recall@k, MRR, nDCG) shared by
+# the benchmarks.
+import os, json, math
+from typing import Any, Dict, List, Optional, Sequence
+
+from embedding_store import DATA_DIR
+
+GOLD_PATH = os.path.join(DATA_DIR, "Evaluation", "gold_questions.json")
+
+
+def load_gold(path: str = GOLD_PATH) -> Dict[str, List[Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["collections"]
+
+def is_relevant(meta: Optional[Dict[str, Any]], gold: Sequence[Dict[str, str]]) -> bool:
+    meta = meta or {}
+    for g in gold:
+        if g.get("source") and meta.get("source") != g["source"]:
+            continue
+        title = g.get("title", "")
+        if meta.get("title") == title or (title and title in (meta.get("section_path") or "")):
+            return True
+    return False
+
+def recall_at_k(metas: Sequence[Optional[Dict[str, Any]]], gold: Sequence[Dict[str, str]], k: int) -> float:
+    # Fraction of gold sections found in the top k
+    if not gold:
+        return 0.0
+    found = sum(1 for g in gold if any(is_relevant(m, [g]) for m in metas[:k]))
+    return found / len(gold)
+
+def _first_ranks(metas: Sequence[Optional[Dict[str, Any]]], gold: Sequence[Dict[str, str]], k: int) -> List[int]:
+    # 1-based rank at which each gold section is first hit in the top k (sections not found are left out)
+    ranks = []
+    for g in gold:
+        rank = next((r for r, m in enumerate(metas[:k], 1) if is_relevant(m, [g])), None)
+        if rank is not None:
+            ranks.append(rank)
+    return ranks
+
+def reciprocal_rank(metas: Sequence[Optional[Dict[str, Any]]], gold: Sequence[Dict[str, str]], k: int) -> float:
+    # 1 / rank of the first relevant hit in the top k (MRR is its mean over questions)
+    ranks = _first_ranks(metas, gold, k)
+    return 1.0 / min(ranks) if ranks else 0.0
+
+def ndcg_at_k(metas: Sequence[Optional[Dict[str, Any]]], gold: Sequence[Dict[str, str]], k: int) -> float:
+    # Binary gain, each gold section credited once at the rank it is first hit; the ideal list
+    # has every gold section at the top
+    if not gold:
+        return 0.0
+    dcg = sum(1.0 / math.log2(r + 1) for r in _first_ranks(metas, gold, k))
+    ideal = sum(1.0 / math.log2(r + 1) for r in range(1, min(len(gold), k) + 1))
+    return dcg / ideal
+
+def percentiles(values: Sequence[float], ps=(50, 95, 99)) -> Dict[str, float]:
+    if not values:
+        return {f"p{p}": 0.0 for p in ps} | {"mean": 0.0, "n": 0}
+    xs = sorted(values)
+    out = {}
+    for p in ps:
+        # Nearest-rank percentile
+        idx = max(0, min(len(xs) - 1, math.ceil(p / 100 * len(xs)) - 1))
+        out[f"p{p}"] = round(xs[idx], 6)
+    out["mean"] = round(sum(xs) / len(xs), 6)
+    out["n"] = len(xs)
+    return out
@@ -0,0 +1,104 @@
+# search_engine.py
+# In-process top-k search: normalized embeddings in one contiguous float32 matrix,
+# a batch of queries scored with a single matrix multiply, top-k via argpartition.
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class Hit(NamedTuple):
+    id: str
+    title: str
+    score: float
+    index: int
+
+
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    # scores: (batch, n) -> (batch, k) row indices, best first; ties keep index order,
+    # the same as np.argsort(-scores, kind="stable")[:, :k]
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        # argpartition picks an arbitrary subset of the ties at the k-th score; take the lowest indices
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+        above, tied = scores > kth, scores == kth
+        room = k - above.sum(axis=1, keepdims=True)
+        keep = above | (tied & (np.cumsum(tied, axis=1) <= room))
+        part = np.nonzero(keep)[1].reshape(scores.shape[0], k)
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex:
+    def __init__(self, vectors, ids: Sequence[str], titles: Optional[Sequence[str]] = None,
+                 documents: Optional[Sequence[str]] = None,
+                 metadatas: Optional[Sequence[Dict[str, Any]]] = None, normalized: bool = False):
+        mat = np.asarray(vectors, dtype=np.float32)
+        if mat.ndim != 2 or mat.shape[0] != len(ids):
+            raise ValueError(f"vectors shape {mat.shape} does not match {len(ids)} ids")
+        self.matrix = np.ascontiguousarray(mat if normalized else normalize_rows(mat))
+        self.ids = list(ids)
+        self.titles = list(titles) if titles is not None else [""] * len(self.ids)
+        self.documents = list(documents) if documents is not None else [""] * len(self.ids)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+
+    @classmethod
+    def from_stores(cls, stores) -> "VectorIndex":
+        stores = list(stores)
+        dims = {s.dim for s in stores}
+        if len(dims) > 1:
+            raise ValueError(f"cannot mix embedding dims in one index: {sorted(dims)}")
+        ids, docs, metas = [], [], []
+        for s in stores:
+            ids += s.ids
+            docs += s.documents
+            metas += s.metadatas
+        vectors = np.concatenate([np.asarray(s.vectors, dtype=np.float32) for s in stores]) if stores \
+            else np.zeros((0, 0), dtype=np.float32)
+        titles = [m.get("title", "") for m in metas]
+        return cls(vectors, ids, titles, docs, metas,
+                   normalized=all(s.normalized and s.vectors.dtype == np.float32 for s in stores))
+
+    @classmethod
+    def from_store(cls, store) -> "VectorIndex":
+        return cls.from_stores([store])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+
+    def scores(self, queries) -> np.ndarray:
+        q = np.asarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        return normalize_rows(q) @ self.matrix.T
+
+    def score_rows(self, query, rows: Sequence[int]) -> np.ndarray:
+        q = normalize_rows(np.asarray(query, dtype=np.float32).ravel())
+        return self.matrix[np.asarray(rows, dtype=np.int64)] @ q
+
+    def centroid(self) -> np.ndarray:
+        return self.matrix.mean(axis=0)
+
+    def search(self, queries, k: int = 5) -> List[List[Hit]]:
+        scores = self.scores(queries)
+        top = top_k_indices(scores, k)
+        return [
+            [Hit(self.ids[i], self.titles[i], float(row_scores[i]), int(i)) for i in row]
+            for row, row_scores in zip(top, scores)
+        ]
+
+    def search_one(self, query, k: int = 5) -> List[Hit]:
+        return self.search(query, k)[0]
@@ -0,0 +1,255 @@
+# semantic_cache.py
+# Near-duplicate question cache. Past questions' embeddings (SQLite, plus an in-memory
+# matrix for lookup) map to the chunks they retrieved and the answer given; a new question
+# within SEMANTIC_CACHE_THRESHOLD cosine of a past one reuses its results, and its answer
+# when the packed context is the same, so a paraphrase costs one encode and one
+# matrix-vector product. Entries record the version of every collection they drew from:
+# a re-index (ingest.py calls invalidate()) or a version change drops them. A sampled share
+# of hits is re-retrieved in the background and counted as a false hit (and dropped) when
+# the top ids disagree.
+#
+#   SEMANTIC_CACHE_THRESHOLD=0.9 python "Coding/Q&A/qna.py"
+#   SEMANTIC_CACHE=0 python "Coding/Q&A/qna.py"        # off
+import os, json, time, random, sqlite3, threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from query_cache import normalize_query
+
+SEMANTIC_CACHE_PATH      = os.getenv("SEMANTIC_CACHE_PATH", "./semantic_cache.sqlite3")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # cosine of the two questions
+SEMANTIC_CACHE_SIZE      = int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_VERIFY    = float(os.getenv("SEMANTIC_CACHE_VERIFY", "0.05"))  # share of hits re-retrieved
+MIN_OVERLAP = 0.5   # a verified hit whose top-k shares less than this with a fresh retrieval is false
+NEAR_MARGIN = 0.05  # misses this close under the threshold are counted, for tuning it
+SYNC_S      = 5.0   # how often a lookup checks for other processes' writes / invalidations
+
+
+class Entry(NamedTuple):
+    id: int
+    query: str
+    k: int
+    ids: list
+    docs: list
+    dists: list
+    answer: Optional[str]
+    answer_ids: Optional[list]
+
+
+class Hit(NamedTuple):
+    entry: Entry
+    similarity: float
+
+
+class SemanticCache:
+    def __init__(self, path: str = SEMANTIC_CACHE_PATH, model: str = "", versions: Optional[Dict[str, str]] = None,
+                 config: str = "", threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_SIZE,
+                 verify_rate: float = SEMANTIC_CACHE_VERIFY, guard: Optional[Callable[[str, str], bool]] = None):
+        # versions: collection -> index version this process searches; config: the rest of the
+        # retrieval setup (fusion, lexical weight, reranker) that changes results.
+        # guard(new question, cached question) can veto a hit (e.g. the two name different phases).
+        self.path = path
+        self.model = model
+        self.versions = dict(versions or {})
+        self.config = config
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.verify_rate = verify_rate
+        self.guard = guard
+        self.counts = {"hits": 0, "misses": 0, "near_misses": 0, "guarded": 0, "answer_hits": 0,
+                       "verified": 0, "false_hits": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT, config TEXT, versions TEXT, query TEXT, vec BLOB,"
+            " k INTEGER, ids TEXT, docs TEXT, dists TEXT, answer TEXT, answer_ids TEXT, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_scope ON entries(model, config)")
+        self._verifier: Optional[ThreadPoolExecutor] = None
+        self._recent: "OrderedDict[str, int]" = OrderedDict()  # normalized question -> entry id it used
+        self._load()
+
+    # In-memory index of the entries this process can use
+    def _load(self):
+        versions = json.dumps(self.versions, sort_keys=True)
+        rows = self._db.execute(
+            "SELECT id, query, vec, k, ids, docs, dists, answer, answer_ids, versions FROM entries"
+            " WHERE model=? AND config=?", (self.model, self.config)).fetchall()
+        stale = [r[0] for r in rows if self._stale(json.loads(r[9]))]
+        if stale:
+            self._db.executemany("DELETE FROM entries WHERE id=?", [(i,) for i in stale])
+        rows = [r for r in rows if r[9] == versions]
+        self.entries: List[Entry] = [
+            Entry(r[0], r[1], r[3], json.loads(r[4]), json.loads(r[5]), json.loads(r[6]), r[7],
+                  json.loads(r[8]) if r[8] else None) for r in rows]
+        vecs = [np.frombuffer(r[2], dtype=np.float32) for r in rows]
+        self.matrix = np.vstack(vecs) if vecs else np.zeros((0, 0), dtype=np.float32)
+        self._synced = (time.time(), self._data_version())
+
+    def _data_version(self) -> int:
+        # Changes whenever another connection (ingest.py, another worker) commits
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _stale(self, versions: Dict[str, str]) -> bool:
+        # Built from a collection this process has at a different version
+        return any(name in self.versions and self.versions[name] != v for name, v in versions.items())
+
+    def _sync(self):
+        now, state = self._synced
+        if time.time() - now < SYNC_S:
+            return
+        if self._data_version() != state:
+            self._load()
+        else:
+            self._synced = (time.time(), state)
+
+    # Lookup
+    def lookup(self, query: str, vec: Sequence[float], k: int) -> Optional[Hit]:
+        q = np.asarray(vec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            self._sync()
+            if not len(self.entries) or self.matrix.shape[1] != q.shape[0]:
+                self.counts["misses"] += 1
+                return None
+            sims = self.matrix @ q
+            order = np.argsort(-sims)
+            for i in order[: 8]:
+                sim = float(sims[i])
+                if sim < self.threshold:
+                    break
+                entry = self.entries[i]
+                if entry.k < k:
+                    continue
+                if self.guard is not None and not self.guard(query, entry.query):
+                    self.counts["guarded"] += 1
+                    continue
+                self.counts["hits"] += 1
+                self._remember(query, entry.id)
+                self._db.execute("UPDATE entries SET last_used=? WHERE id=?", (time.time(), entry.id))
+                return Hit(entry, sim)
+            self.counts["misses"] += 1
+            if self.threshold - NEAR_MARGIN <= float(sims[order[0]]) < self.threshold:
+                self.counts["near_misses"] += 1
+            return None
+
+    def put(self, query: str, vec: Sequence[float], k: int, ids: list, docs: list, dists: list) -> int:
+        q = np.asarray(vec, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO entries (model, config, versions, query, vec, k, ids, docs, dists, last_used)"
+                " VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (self.model, self.config, json.dumps(self.versions, sort_keys=True), normalize_query(query),
+                 array("f", q.tolist()).tobytes(), k, json.dumps(ids), json.dumps(docs, ensure_ascii=False),
+                 json.dumps([float(d) for d in dists]), time.time()))
+            entry = Entry(cur.lastrowid, normalize_query(query), k, list(ids), list(docs), list(dists), None, None)
+            self.entries.append(entry)
+            self.matrix = np.vstack([self.matrix, q[None, :]]) if self.matrix.size else q[None, :].copy()
+            self._remember(query, entry.id)
+            self._evict()
+            return entry.id
+
+    # Answers, for the question that last looked up / stored an entry
+    def _remember(self, query: str, entry_id: int):
+        self._recent[normalize_query(query)] = entry_id
+        self._recent.move_to_end(normalize_query(query))
+        while len(self._recent) > 1000:
+            self._recent.popitem(last=False)
+
+    def _entry_for(self, query: str) -> Optional[int]:
+        entry_id = self._recent.get(normalize_query(query))
+        return next((n for n, e in enumerate(self.entries) if e.id == entry_id), None) if entry_id else None
+
+    def answer_for(self, query: str, context_ids: Sequence[str]) -> Optional[str]:
+        with self._lock:
+            n = self._entry_for(query)
+            entry = self.entries[n] if n is not None else None
+            if entry is None or entry.answer is None or entry.answer_ids != list(context_ids):
+                return None
+            self.counts["answer_hits"] += 1
+            return entry.answer
+
+    def put_answer(self, query: str, context_ids: Sequence[str], answer: str):
+        with self._lock:
+            n = self._entry_for(query)
+            if n is None:
+                return
+            self.entries[n] = self.entries[n]._replace(answer=answer, answer_ids=list(context_ids))
+            self._db.execute("UPDATE entries SET answer=?, answer_ids=? WHERE id=?",
+                             (answer, json.dumps(list(context_ids)), self.entries[n].id))
+
+    # False hits: a sampled share of hits is retrieved again off the request path
+    def check(self, hit: Hit, k: int, fresh_ids: Callable[[], list]):
+        if random.random() >= self.verify_rate:
+            return
+        if self._verifier is None:
+            self._verifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-verify")
+
+        def verify():
+            fresh = set(fresh_ids()[:k])
+            overlap = len(fresh & set(hit.entry.ids[:k])) / max(1, min(k, len(fresh)))
+            with self._lock:
+                self.counts["verified"] += 1
+                if overlap < MIN_OVERLAP:
+                    self.counts["false_hits"] += 1
+                    self._drop([hit.entry.id])
+        self._verifier.submit(verify)
+
+    # Housekeeping
+    def _drop(self, entry_ids: List[int]):
+        gone = set(entry_ids)
+        self._db.executemany("DELETE FROM entries WHERE id=?", [(i,) for i in gone])
+        keep = [n for n, e in enumerate(self.entries) if e.id not in gone]
+        self.entries = [self.entries[n] for n in keep]
+        self.matrix = self.matrix[keep] if len(keep) else np.zeros((0, 0), dtype=np.float32)
+
+    def _evict(self):
+        (n,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if n > self.max_entries:
+            old = [r[0] for r in self._db.execute("SELECT id FROM entries ORDER BY last_used ASC LIMIT ?",
+                                                  (n - self.max_entries,))]
+            self._drop(old)
+
+    def invalidate(self, collection: str) -> int:
+        # Drops every entry that drew on `collection` (any process, any version)
+        with self._lock:
+            ids = [r[0] for r in self._db.execute("SELECT id, versions FROM entries").fetchall()
+                   if collection in json.loads(r[1])]
+            self._drop(ids)
+            return len(ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.counts["hits"] + self.counts["misses"]
+            return {**self.counts, "entries": len(self.entries),
+                    "hit_rate": round(self.counts["hits"] / total, 3) if total else 0.0}
+
+    def close(self):
+        if self._verifier is not None:
+            self._verifier.shutdown(wait=False)
+        self._db.close()
+
+
+def open_default(model: str, versions: Dict[str, str], config: str,
+                 guard: Optional[Callable[[str, str], bool]] = None) -> Optional[SemanticCache]:
+    if os.getenv("SEMANTIC_CACHE", "1") == "0":
+        return None
+    return SemanticCache(SEMANTIC_CACHE_PATH, model, versions, config, guard=guard)
+
+def invalidate_collection(collection: str, path: str = SEMANTIC_CACHE_PATH) -> int:
+    # For ingest.py after a collection is rewritten; no-op when no cache file exists
+    if not os.path.exists(path):
+        return 0
+    cache = SemanticCache(path)
+    try:
+        return cache.invalidate(collection)
+    finally:
+        cache.close()
@@ -0,0 +1,143 @@
+# snapshots.py
+# Immutable, versioned index snapshots for the store backend. ingest.py publishes each
+# collection's binary store, quantized codes, BM25 index and parent sections into a fresh
+# directory, then swaps the collection's CURRENT pointer (one os.replace), so readers see
+# either the old snapshot or the new one, never a half-written mix. Workers open the current
+# snapshot read-only with the vectors memory-mapped, so every worker on a host shares one
+# page-cache copy; a watcher moves them to a newly published snapshot without a restart, and
+# in-flight searches finish on the snapshot they started with.
+#
+#   <SNAPSHOT_DIR>/<collection>/CURRENT                 -> "20260418T101500.042-3f9c2a1b04d7e6aa"
+#   <SNAPSHOT_DIR>/<collection>/20260418T101500.042-3f9c.../store.npy, store.meta.json, ...
+#
+#   python Coding/snapshots.py                  # current snapshot per collection
+#   python Coding/snapshots.py --prune 2        # keep the 2 newest per collection
+#   FEDERATED=1 FEDERATED_BACKEND=snapshot python "Coding/Q&A/qna.py"
+import os, sys, json, time, shutil, argparse
+from typing import Dict, List, Optional
+
+from embedding_store import STORE_DIR
+
+SNAPSHOT_DIR    = os.getenv("SNAPSHOT_DIR", os.path.join(STORE_DIR, "Snapshots"))
+SNAPSHOT_KEEP   = int(os.getenv("SNAPSHOT_KEEP", "3"))      # published snapshots kept per collection
+SNAPSHOT_POLL_S = float(os.getenv("SNAPSHOT_POLL_S", "10"))  # how often workers look for a new one
+CURRENT    = "CURRENT"
+INFO_NAME  = "snapshot.json"
+STORE_NAME = "store"  # store prefix inside a snapshot: store.npy, store.meta.json, store.quant.npz
+
+
+def collection_dir(collection: str, root: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(root, collection)
+
+def current(collection: str, root: str = SNAPSHOT_DIR) -> Optional[str]:
+    # -> directory of the collection's published snapshot, or None
+    try:
+        with open(os.path.join(collection_dir(collection, root), CURRENT), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(collection_dir(collection, root), name)
+    return path if name and os.path.isdir(path) else None
+
+def store_prefix(snapshot: str) -> str:
+    return os.path.join(snapshot, STORE_NAME)
+
+def info(snapshot: str) -> Dict:
+    with open(os.path.join(snapshot, INFO_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def collections(root: str = SNAPSHOT_DIR) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if current(d, root))
+
+
+# Publishing
+def _place(src: str, dst: str):
+    # Hard link when possible: every writer in the repo replaces files rather than rewriting
+    # them, so the linked inode never changes under the snapshot
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _fsync_dir(path: str):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+def publish(collection: str, files: Dict[str, str], version: Optional[str] = None,
+            meta: Optional[Dict] = None, root: str = SNAPSHOT_DIR, keep: int = SNAPSHOT_KEEP) -> str:
+    # files: name inside the snapshot -> source path (missing sources are skipped). -> snapshot dir
+    cdir = collection_dir(collection, root)
+    os.makedirs(cdir, exist_ok=True)
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+    name = f"{stamp}-{version or 'unversioned'}"
+    while os.path.exists(os.path.join(cdir, name)):
+        name += "+"
+    staging = os.path.join(cdir, f".staging-{name}-{os.getpid()}")
+    os.makedirs(staging)
+    try:
+        for dst, src in files.items():
+            if src and os.path.exists(src):
+                _place(src, os.path.join(staging, dst))
+        with open(os.path.join(staging, INFO_NAME), "w", encoding="utf-8") as f:
+            json.dump({"collection": collection, "version": version, "name": name,
+                       "published": time.strftime("%Y-%m-%dT%H:%M:%S"), **(meta or {})}, f, indent=1)
+        _fsync_dir(staging)
+        os.rename(staging, os.path.join(cdir, name))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    # The swap: readers open whichever name CURRENT holds when they look
+    with open(os.path.join(cdir, CURRENT + ".tmp"), "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(os.path.join(cdir, CURRENT + ".tmp"), os.path.join(cdir, CURRENT))
+    _fsync_dir(cdir)
+    prune(collection, keep, root)
+    return os.path.join(cdir, name)
+
+def prune(collection: str, keep: int = SNAPSHOT_KEEP, root: str = SNAPSHOT_DIR) -> List[str]:
+    # Drops all but the `keep` newest snapshots (never the current one). Workers still on an old
+    # one keep their memory maps on POSIX; where the files are still open (Windows) it stays for
+    # the next prune.
+    cdir = collection_dir(collection, root)
+    live = current(collection, root)
+    names = sorted((d for d in os.listdir(cdir) if os.path.isdir(os.path.join(cdir, d))
+                    and not d.startswith(".")), reverse=True) if os.path.isdir(cdir) else []
+    removed = []
+    for name in names[max(1, keep):]:
+        path = os.path.join(cdir, name)
+        if path == live:
+            continue
+        try:
+            shutil.rmtree(path)
+            removed.append(name)
+        except OSError as e:
+            print(f"[snapshots] keep {path}: {e}")
+    return removed
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Show or prune the published index snapshots.")
+    ap.add_argument("--root", default=SNAPSHOT_DIR)
+    ap.add_argument("--prune", type=int, metavar="KEEP", help="keep only the KEEP newest snapshots per collection")
+    args = ap.parse_args(argv)
+    for name in collections(args.root):
+        if args.prune is not None:
+            for old in prune(name, args.prune, args.root):
+                print(f"[prune] {name}/{old}")
+        snap = current(name, args.root)
+        meta = info(snap)
+        print(f"{name:<24}{os.path.basename(snap):<36}{meta.get('count', '?'):>8} chunks  "
+              f"{meta.get('model') or '?'}  index={meta.get('quantize') or 'float'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
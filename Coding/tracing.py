@@ -0,0 +1,296 @@
+# tracing.py
+# Request tracing and stage metrics for the Q&A pipeline. Stages are marked with span();
+# every span feeds in-process latency histograms plus cache / token counters (Prometheus
+# text format: server.py /metrics, or serve_metrics() for the CLI), and a sampled share of
+# whole request traces is appended as OTLP/JSON lines, the format an OpenTelemetry
+# collector's file receiver reads. TRACE_PROFILE writes per-stage self time as folded
+# stacks for flamegraph.pl / speedscope.
+#
+#   TRACE_FILE=traces.jsonl TRACE_SAMPLE=0.1 python "Coding/Q&A/qna.py"
+#   TRACE_METRICS_PORT=9464 python "Coding/Q&A/qna.py"      # curl :9464/metrics
+#   TRACE_PROFILE=stages.folded python "Coding/Q&A/qna.py"  # flamegraph.pl stages.folded > stages.svg
+#   python Coding/tracing.py traces.jsonl                    # per-stage latency summary of a trace file
+#
+#   with trace("ask", question_chars=len(q)):
+#       with span("encode", model=m) as s:
+#           s.set(cache="miss")
+import os, sys, json, time, random, argparse, threading, contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE              = os.getenv("TRACE", "1") == "1"  # 0: span() and trace() do nothing
+TRACE_FILE         = os.getenv("TRACE_FILE")  # OTLP/JSON lines, one sampled trace per line
+TRACE_SAMPLE       = float(os.getenv("TRACE_SAMPLE", "1.0"))  # share of traces exported / profiled
+TRACE_PROFILE      = os.getenv("TRACE_PROFILE")  # folded-stack file of per-stage self time (microseconds)
+TRACE_METRICS_PORT = int(os.getenv("TRACE_METRICS_PORT", "0"))
+SERVICE_NAME       = os.getenv("TRACE_SERVICE", "eplc-qna")
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.lock = threading.Lock()  # shard searches finish on pool threads
+
+    def add(self, s: "Span"):
+        with self.lock:
+            self.spans.append(s)
+
+
+class Span:
+    __slots__ = ("name", "trace", "parent", "attrs", "span_id", "start_ns", "t0", "seconds")
+
+    def __init__(self, name: str, trace: Optional[Trace], parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name, self.trace, self.parent, self.attrs = name, trace, parent, attrs
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.t0 = time.perf_counter()
+        self.seconds = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def path(self) -> List[str]:
+        names, s = [], self
+        while s is not None:
+            names.append(s.name)
+            s = s.parent
+        return names[::-1]
+
+
+class _NoSpan:
+    def set(self, **attrs):
+        pass
+
+_NO_SPAN = _NoSpan()
+_current: contextvars.ContextVar = contextvars.ContextVar("qna_span", default=None)
+
+
+# Metrics: every span, sampled or not
+class StageMetrics:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.stages: Dict[str, List[float]] = {}  # stage -> [bucket counts..., +Inf count, sum]
+        self.cache: Dict[Tuple[str, str], int] = {}  # (stage, hit|miss) -> count
+        self.tokens: Dict[Tuple[str, str], int] = {}  # (stage, attr) -> total
+        self.errors: Dict[Tuple[str, str], int] = {}  # (stage, exception type) -> count
+
+    def observe(self, s: Span):
+        with self.lock:
+            h = self.stages.setdefault(s.name, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, le in enumerate(self.buckets):
+                if s.seconds <= le:
+                    h[i] += 1
+            h[len(self.buckets)] += 1
+            h[-1] += s.seconds
+            for key, value in s.attrs.items():
+                if key == "cache" and value in ("hit", "miss"):
+                    self.cache[(s.name, value)] = self.cache.get((s.name, value), 0) + 1
+                elif key == "error":
+                    self.errors[(s.name, value)] = self.errors.get((s.name, value), 0) + 1
+                elif (key == "tokens" or key.endswith("_tokens")) and isinstance(value, int):
+                    self.tokens[(s.name, key)] = self.tokens.get((s.name, key), 0) + value
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            n = len(self.buckets)
+            return {stage: {"count": h[n], "mean_ms": round(h[-1] * 1000 / h[n], 3) if h[n] else 0.0}
+                    for stage, h in sorted(self.stages.items())}
+
+    def render(self, prefix: str = "qna") -> str:
+        with self.lock:
+            n = len(self.buckets)
+            lines = [f"# TYPE {prefix}_span_seconds histogram"]
+            for stage, h in sorted(self.stages.items()):
+                for le, c in zip(self.buckets, h):
+                    lines.append(f'{prefix}_span_seconds_bucket{{stage="{stage}",le="{le}"}} {c}')
+                lines.append(f'{prefix}_span_seconds_bucket{{stage="{stage}",le="+Inf"}} {h[n]}')
+                lines.append(f'{prefix}_span_seconds_sum{{stage="{stage}"}} {h[-1]:.6f}')
+                lines.append(f'{prefix}_span_seconds_count{{stage="{stage}"}} {h[n]}')
+            lines.append(f"# TYPE {prefix}_span_cache_total counter")
+            for (stage, result), c in sorted(self.cache.items()):
+                lines.append(f'{prefix}_span_cache_total{{stage="{stage}",result="{result}"}} {c}')
+            lines.append(f"# TYPE {prefix}_span_tokens_total counter")
+            for (stage, kind), c in sorted(self.tokens.items()):
+                lines.append(f'{prefix}_span_tokens_total{{stage="{stage}",kind="{kind}"}} {c}')
+            lines.append(f"# TYPE {prefix}_span_errors_total counter")
+            for (stage, error), c in sorted(self.errors.items()):
+                lines.append(f'{prefix}_span_errors_total{{stage="{stage}",error="{error}"}} {c}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = StageMetrics()
+
+
+# Exporters: sampled traces only
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+def to_otlp(t: Trace) -> Dict[str, Any]:
+    spans = []
+    for s in t.spans:
+        span = {
+            "traceId": t.trace_id, "spanId": s.span_id, "name": s.name, "kind": 1,
+            "startTimeUnixNano": str(s.start_ns), "endTimeUnixNano": str(s.start_ns + int(s.seconds * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attrs.items()],
+            "status": {"code": 2, "message": s.attrs["error"]} if "error" in s.attrs else {},
+        }
+        if s.parent is not None:
+            span["parentSpanId"] = s.parent.span_id
+        spans.append(span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}
+
+def folded(t: Trace) -> List[str]:
+    # "ask;retrieve;encode 1234": self time in microseconds (children run on pool threads can
+    # overlap, so self time is clamped at zero)
+    child_time: Dict[str, float] = {}
+    for s in t.spans:
+        if s.parent is not None:
+            child_time[s.parent.span_id] = child_time.get(s.parent.span_id, 0.0) + s.seconds
+    return [f"{';'.join(s.path)} {max(0, int((s.seconds - child_time.get(s.span_id, 0.0)) * 1e6))}"
+            for s in t.spans]
+
+class FileExporter:
+    def __init__(self, trace_file: Optional[str] = TRACE_FILE, profile_file: Optional[str] = TRACE_PROFILE):
+        self.trace_file = trace_file
+        self.profile_file = profile_file
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.trace_file or self.profile_file)
+
+    def export(self, t: Trace):
+        with self.lock:
+            if self.trace_file:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(to_otlp(t), separators=(",", ":")) + "\n")
+            if self.profile_file:
+                with open(self.profile_file, "a", encoding="utf-8") as f:
+                    f.write("\n".join(folded(t)) + "\n")
+
+
+exporter = FileExporter()
+
+
+# Spans
+@contextmanager
+def _open(name: str, attrs: Dict[str, Any], trace: Optional[Trace]) -> Iterator[Span]:
+    parent = _current.get()
+    s = Span(name, trace or (parent.trace if parent is not None else None), parent, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.seconds = time.perf_counter() - s.t0
+        try:
+            _current.reset(token)
+        except ValueError:  # a generator closed from another context
+            _current.set(parent)
+        metrics.observe(s)
+        if s.trace is not None and s.trace.sampled:
+            s.trace.add(s)
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Any]:
+    # One pipeline stage; nests under the innermost open span of this thread / task
+    if not TRACE:
+        yield _NO_SPAN
+        return
+    with _open(name, attrs, None) as s:
+        yield s
+
+@contextmanager
+def trace(name: str, sample: Optional[float] = None, **attrs) -> Iterator[Any]:
+    # A request: the root span, sampled for export as a whole (a nested call is a plain span)
+    if not TRACE:
+        yield _NO_SPAN
+        return
+    if _current.get() is not None:
+        with _open(name, attrs, None) as s:
+            yield s
+        return
+    rate = TRACE_SAMPLE if sample is None else sample
+    t = Trace(exporter.enabled and random.random() < rate)
+    try:
+        with _open(name, attrs, t) as s:
+            yield s
+    finally:
+        if t.sampled:
+            exporter.export(t)
+
+def current() -> Any:
+    # The innermost open span (to attach attributes from deeper code), or a no-op stand-in
+    return _current.get() or _NO_SPAN
+
+def bind(fn: Callable) -> Callable:
+    # fn run under the caller's open span, for thread pools (which don't carry contextvars over)
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+# Prometheus endpoint for processes without server.py
+def serve_metrics(port: int = TRACE_METRICS_PORT, host: str = "127.0.0.1",
+                  render: Callable[[], str] = metrics.render) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode("utf-8") if self.path == "/metrics" else b"not found\n"
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    print(f"[trace] metrics on http://{host}:{httpd.server_port}/metrics")
+    return httpd
+
+
+# CLI: per-stage latency summary of an OTLP/JSON trace file
+def summarize(path: str) -> Dict[str, List[float]]:
+    stages: Dict[str, List[float]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for rs in json.loads(line)["resourceSpans"]:
+                for ss in rs["scopeSpans"]:
+                    for s in ss["spans"]:
+                        ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+                        stages.setdefault(s["name"], []).append(ms)
+    return stages
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Per-stage latency summary of a TRACE_FILE.")
+    ap.add_argument("trace_file")
+    args = ap.parse_args(argv)
+    from retrieval_metrics import percentiles
+    print(f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, ms in sorted(summarize(args.trace_file).items(), key=lambda kv: -sum(kv[1])):
+        p = percentiles(ms, (50, 95))
+        print(f"{name:<16}{len(ms):>7}{p['p50']:>10.2f}{p['p95']:>10.2f}{max(ms):>10.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,32 +7,67 @@ Created on Thu Oct 30 00:11:02 2025
 """
 
 import json
+import hashlib
+import os, sys
 import chromadb
 
-# Load the embedded file you created earlier
-with open("TPembedded.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Coding"))
+from embedding_store import load_store, store_path_for, TABLE_SUFFIX
+from model_registry import get_encoder, infer_model, register
 
-# Extract content and embeddings
-documents = [item["content"] for item in data]
-embeddings = [item["embedding"] for item in data]
+# Load the embedded file you created earlier (binary store if present, else the JSON dump)
+store_path = store_path_for("TPembedded.json")
+if os.path.exists(store_path + TABLE_SUFFIX):
+    store = load_store(store_path)
+    documents = store.documents
+    embeddings = store.vectors.tolist()
+    ids = store.ids
+    model_name = store.model
+else:
+    with open("TPembedded.json", "r", encoding="utf-8") as f:
+        data = json.load(f)
+    documents = [item["content"] for item in data]
+    embeddings = [item["embedding"] for item in data]
+    ids = [item.get("id") or f"section_{item.get('section_number')}" for item in data]
+    model_name = None
+
+# Queries must go through the model that built the vectors (TPembedded.json is written by
+# untitled0.py with MiniLM or by Training Plan Embedded.py with mpnet), not Chroma's default embedder
+model_name = model_name or infer_model(len(embeddings[0])).name
 
 
 chroma_client = chromadb.PersistentClient(path="./chroma_trainingplan")
-collection = chroma_client.get_or_create_collection("training_plan")
+# Vectors from another model can't be mixed in: rebuild only when the model changed
+if "training_plan" in [c.name for c in chroma_client.list_collections()] and \
+        (chroma_client.get_collection("training_plan").metadata or {}).get("embed_model") != model_name:
+    chroma_client.delete_collection("training_plan")
+collection = chroma_client.get_or_create_collection("training_plan", metadata={"embed_model": model_name})
 
-ids = [f"section_{i}" for i in range(len(documents))]
-collection.add(
-    ids=ids,
-    documents=documents,
-    embeddings=embeddings
-)
+# Re-runs touch only what changed: each row keeps a hash of its text, rows whose hash
+# differs are upserted and ids no longer produced (e.g. old "section_<n>" rows) are deleted
+hashes = [hashlib.sha1((doc or "").encode("utf-8")).hexdigest() for doc in documents]
+existing = collection.get(include=["metadatas"])
+old = {i: (m or {}).get("hash") for i, m in zip(existing["ids"], existing["metadatas"])}
+changed = [n for n, (i, h) in enumerate(zip(ids, hashes)) if old.get(i) != h]
+stale = sorted(set(old) - set(ids))
+if changed:
+    collection.upsert(
+        ids=[ids[n] for n in changed],
+        documents=[documents[n] for n in changed],
+        embeddings=[embeddings[n] for n in changed],
+        metadatas=[{"hash": hashes[n]} for n in changed]
+    )
+if stale:
+    collection.delete(ids=stale)
+print(f"{len(changed)} rows upserted, {len(stale)} deleted, {len(ids) - len(changed)} unchanged")
+register("training_plan", model_name, len(embeddings[0]))
 
 # Example query
 query = "Who approves the training plan?"
 
+query_vec = get_encoder(model_name).encode(query, normalize_embeddings=True).tolist()
 results = collection.query(
-    query_texts=[query],
+    query_embeddings=[query_vec],
     n_results=3
 )
 
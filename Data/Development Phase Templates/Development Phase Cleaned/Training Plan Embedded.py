@@ -1,50 +1,54 @@
-import json
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity #for testing purpose
 import numpy as np
+import os, sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Coding"))
+from embedding_store import save_store, store_path_for
+from search_engine import VectorIndex
+from model_registry import get_encoder
+from chunker import chunk_file
 
-with open("Training Plan.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
 
-rows = []
-
-for section in data["sections"]:
-    if section.get("content"):
-        rows.append({
-            "document": data["document_title"],
-            "section_number": section["number"],
-            "title": section["title"],
-            "content": section["content"]
-        })
-
-
-    for sub in section.get("subsections", []):
-        rows.append({
-            "document": data["document_title"],
-            "section_number": sub["number"],
-            "title": sub["title"],
-            "content": sub["content"]
-        })
+# Small section chunks, cleaned of field codes and template boilerplate (shared with ingest.py)
+rows = [{
+    "id": c["id"],
+    "document": c["metadata"]["document"],
+    "section_number": c["metadata"]["section_number"],
+    "title": c["metadata"]["title"],
+    "content": c["text"],
+} for c in chunk_file("Training Plan.json")]
 
 df = pd.DataFrame(rows)
 
 
 
-model = SentenceTransformer("all-mpnet-base-v2")
-df["embedding"] = df["content"].apply(lambda x: model.encode(x).tolist())
+MODEL = "sentence-transformers/all-mpnet-base-v2"
+model = get_encoder(MODEL)  # shared, loaded once per process
+df["embedding"] = model.encode(df["content"].tolist(), batch_size=64, normalize_embeddings=True).tolist()
 print(df[["section_number", "title", "embedding"]].head(10))
 df.to_json("TPembedded.json", orient="records", indent=2, force_ascii=False)
+save_store(
+    store_path_for("TPembedded.json"),
+    df["embedding"].tolist(),
+    ids=df["id"].tolist(),
+    documents=df["content"].tolist(),
+    metadatas=df[["document", "section_number", "title"]].to_dict("records"),
+    model=MODEL,
+)
+
+
+index = VectorIndex(df["embedding"].tolist(), ids=df["section_number"].tolist(), titles=df["title"].tolist())
 
 
-def semantic_search(query, df, top_k=5):
-    query_vec = model.encode(query)
-    df["similarity"] = df["embedding"].apply(lambda x: cosine_similarity([x], [query_vec])[0][0])
-    return df.sort_values(by="similarity", ascending=False).head(top_k)[["section_number", "title", "similarity"]]
+def semantic_search(query, index, top_k=5):
+    # Encode the query
+    hits = index.search(model.encode(query, normalize_embeddings=True), k=top_k)[0]
+    return pd.DataFrame(
+        [{"section_number": h.id, "title": h.title, "similarity": h.score} for h in hits]
+    )
 
 # Example test
-results = semantic_search("Who approves the training plan?", df)
+results = semantic_search("Who approves the training plan?", index)
 print(results)
 
 #Some potential questions to test the similarity
@@ -1,55 +1,22 @@
-import json
-import chromadb
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import os, sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Coding"))
+from search_engine import VectorIndex
+from model_registry import get_encoder
+from embedding_store import load_store
+from ingest import ingest, store_path_for_collection
 
 
-with open("HHS EPLC Website.py", "r", encoding="utf-8") as f:
-    data = json.load(f)
 
-rows = []
+# The policy page is saved as JSON in "HHS EPLC Website.py". ingest.py owns the
+# hhs_eplc_policy collection: same chunk ids, content-hash manifest (only new or changed
+# chunks are embedded, removed ones deleted) and model registry entry as every other phase
+MODEL = "BAAI/bge-large-en-v1.5"
+ingest(["hhs_eplc_policy"], model_name=MODEL)
 
-
-for section in data["sections"]:
-    # Main section
-    rows.append({
-        "document": data["document_title"],
-        "section_number": section["number"],
-        "title": section["title"],
-        "content": section["content"]
-    })
-
-    for sub in section.get("subsections", []):
-        rows.append({
-            "document": data["document_title"],
-            "section_number": sub["number"],
-            "title": sub["title"],
-            "content": sub["content"]
-        })
-
-df = pd.DataFrame(rows)
-print(f"{len(df)} text chunks for embedding.")
-
-model = SentenceTransformer("BAAI/bge-large-en-v1.5")  
-df["embedding"] = df["content"].apply(lambda x: model.encode(x).tolist())
-
-
-chroma_client = chromadb.PersistentClient(path="./chroma_eplc_policy")
-collection = chroma_client.get_or_create_collection("hhs_eplc_policy")
-
-ids = [f"section_{i}" for i in range(len(df))]
-
-collection.add(
-    ids=ids,
-    documents=df["content"].tolist(),
-    embeddings=df["embedding"].tolist(),
-    metadatas=[
-        {"document": row["document"], "section_number": row["section_number"], "title": row["title"]}
-        for _, row in df.iterrows()
-    ]
-)
+store = load_store(store_path_for_collection("hhs_eplc_policy"))
+print(f"{len(store)} text chunks embedded.")
+model = get_encoder(store.model or MODEL)  # shared, loaded once per process
 
 # query = "What is the purpose of the EPLC policy?"
 # query_vec = model.encode(query).tolist()
@@ -71,10 +38,12 @@ queries = [
     "When was this policy last updated?"
 ]
 
-for q in queries:
-    q_vec = model.encode(q)
-    df["similarity"] = df["embedding"].apply(lambda x: cosine_similarity([x], [q_vec])[0][0])
-    top = df.sort_values(by="similarity", ascending=False).head(1)
+index = VectorIndex(store.vectors, ids=[m.get("section_number", "") for m in store.metadatas],
+                    titles=[m.get("title", "") for m in store.metadatas])
+q_vecs = model.encode(queries, normalize_embeddings=True)
+
+for q, hits in zip(queries, index.search(q_vecs, k=1)):
+    top = hits[0]
     print(f"\n Query: {q}")
-    print(f"Top Match: {top.iloc[0]['title']} (Section {top.iloc[0]['section_number']})")
-    print(f"Similarity Rate: {top.iloc[0]['similarity']:.3f}")
+    print(f"Top Match: {top.title} (Section {top.id})")
+    print(f"Similarity Rate: {top.score:.3f}")
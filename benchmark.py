@@ -1,13 +1,22 @@
-import os, json, glob, re, csv, time
-from openai import OpenAI
+import os, sys, glob, csv, time, hashlib, asyncio, argparse
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Coding"))
+from answer_cache import answer_key, open_default as open_answer_cache
+from llm_scheduler import Scheduler
+from context_packer import count_tokens, pack_context
+from chunker import chunk_file
+from tracing import span, trace
+import tracing
+
 load_dotenv()
 API_KEY = os.getenv("OPENAI_API_KEY")
+BASE_URL = os.getenv("OPENAI_BASE_URL")  # point at Coding/mock_llm_server.py to run offline
 
 DATA_DIR = "data"
 OUT_FILE = "result.csv"
-MAX_CONTEXT_CHARS = 12000
+EST_OUTPUT_TOKENS = 600
 MODELS = ["gpt-5-nano", "gpt-4o-mini", "gpt-4o"]
 QUESTIONS = [
     "List key deliverables in the Development Phase and briefly describe each.",
@@ -29,81 +38,114 @@ def _read_text_any_encoding(fp):
             continue
     return ""
 
-def extract_text_from_json(obj, buf):
-    KEYS = {"title","section","section_title","content","summary","description",
-            "responsibilities","deliverables","exit","criteria","activities",
-            "objective","scope","review","artifact","output","role"}
-    NOISE = re.compile(r"(DOCPROPERTY|MERGEFORMAT)", re.I)
-    def _push(t):
-        t = t.strip()
-        if len(t) > 20 and not NOISE.search(t): buf.append(t)
-    if isinstance(obj, dict):
-        for k,v in obj.items():
-            if isinstance(v,str) and any(h in k.lower() for h in KEYS): _push(v)
-        for k,v in obj.items():
-            if isinstance(v,str) and not any(h in k.lower() for h in KEYS): _push(v)
-        for v in obj.values():
-            if isinstance(v,(dict,list)): extract_text_from_json(v,buf)
-    elif isinstance(obj,list):
-        for it in obj: extract_text_from_json(it,buf)
-
-def load_context(data_dir, max_chars):
-    files = glob.glob(os.path.join(data_dir,"*.json"))
+def load_context(data_dir):
+    # -> one text block per file, in a fixed order so every request shares the same prefix
+    files = sorted(glob.glob(os.path.join(data_dir,"*.json")))
     print(f"[DEBUG] JSON files found: {len(files)}")
     texts=[]
     for fp in files:
-        raw=_read_text_any_encoding(fp)
         try:
-            j=json.loads(raw); buf=[]; extract_text_from_json(j,buf)
-            text="\n".join(buf).strip()
-        except Exception:
-            text=raw.strip()
+            # Section by section, cleaned of field codes and template boilerplate (same chunker as ingest.py)
+            text="\n".join(f"[{c['metadata']['section_path']}]\n{c['text']}" for c in chunk_file(fp)).strip()
+        except ValueError:
+            text=_read_text_any_encoding(fp).strip()
         if text:
             block=f"\n### FILE: {os.path.basename(fp)}\n{text}\n"
             texts.append(block)
             print(f"[DEBUG] {os.path.basename(fp)} -> added {len(block)} chars")
-    full="\n".join(texts).strip()
-    if len(full)>max_chars: full=full[:max_chars]
-    print(f"[DEBUG] Context length: {len(full)}")
-    print("[DEBUG] Context preview:\n",full[:800],"\n--- END PREVIEW ---")
+    return texts
+
+def build_context(blocks, model):
+    # Whole files up to the model's token budget; the file that overflows is cut at a sentence boundary
+    with span("context",model=model) as s:
+        packed=pack_context(blocks,[f"{i:05d}" for i in range(len(blocks))],model,separator="\n")
+        s.set(files=len(packed.indices),context_tokens=packed.tokens)
+    full="\n".join(packed.texts).strip()
+    print(f"[DEBUG] {model}: {len(packed.indices)}/{len(blocks)} files, {packed.tokens} context tokens, {len(full)} chars")
     return full
 
-def ask(client, model, context, question):
-    t0=time.time()
-    resp=client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role":"system","content":SYSTEM_PROMPT},
-            {"role":"user","content":f"Context:\n{context}\n\nQuestion:\n{question}"}
-        ]
-    )
-    latency=round(time.time()-t0,3)
-    msg=resp.choices[0].message.content or ""
-    usage=resp.usage
-    return latency, usage.prompt_tokens, usage.completion_tokens, usage.total_tokens, msg
+async def ask(client, scheduler, model, context, question, cache=None):
+    # -> (latency_s, ttft_s, mean inter-token ms, input, output, total tokens, answer)
+    key=answer_key(SYSTEM_PROMPT,model,question,[hashlib.sha1(context.encode("utf-8")).hexdigest()]) if cache else None
+    hit=cache.get(key) if key else None
+    tracing.current().set(cache="hit" if hit is not None else "miss")
+    if hit is not None:
+        u=hit["usage"]
+        return 0.0, 0.0, 0.0, u.get("prompt_tokens",0), u.get("completion_tokens",0), u.get("total_tokens",0), hit["answer"]
+    async def call():
+        # Timed per attempt, so only the attempt that succeeded counts (no queueing or backoff)
+        with span("generate",model=model):
+            t0=time.perf_counter(); stamps=[]; parts=[]; usage=None
+            stream=await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role":"system","content":SYSTEM_PROMPT},
+                    {"role":"user","content":f"Context:\n{context}\n\nQuestion:\n{question}"}
+                ],
+                stream=True,
+                stream_options={"include_usage":True}
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    stamps.append(time.perf_counter()); parts.append(chunk.choices[0].delta.content)
+                if chunk.usage: usage=chunk.usage
+            return t0, time.perf_counter(), stamps, "".join(parts), usage
+    t0,t1,stamps,msg,usage=await scheduler.run(model,call,est_tokens=count_tokens(SYSTEM_PROMPT+context+question,model)+EST_OUTPUT_TOKENS)
+    ttft=round(stamps[0]-t0,3) if stamps else round(t1-t0,3)
+    itl=round(1000*(stamps[-1]-stamps[0])/(len(stamps)-1),2) if len(stamps)>1 else 0.0
+    ti,to=(usage.prompt_tokens,usage.completion_tokens) if usage else (count_tokens(SYSTEM_PROMPT+context+question,model),count_tokens(msg,model))
+    if key and msg:
+        cache.put(key,msg,model,question,{"prompt_tokens":ti,"completion_tokens":to,"total_tokens":ti+to})
+    return round(t1-t0,3), ttft, itl, ti, to, ti+to, msg
 
-def main():
-    print("[DEBUG] CWD:", os.getcwd())
-    if not API_KEY: raise ValueError("❌ OPENAI_API_KEY not found in .env")
-    client=OpenAI(api_key=API_KEY)
-    context=load_context(DATA_DIR,MAX_CONTEXT_CHARS)
-    assert len(context)>200, "Context too short. Check your JSON files."
+async def run_one(client, scheduler, model, context, question, cache):
+    try:
+        # One trace per call (TRACE_FILE / TRACE_PROFILE); scheduler queueing shows as the gap before "generate"
+        with trace("call",model=model) as s:
+            latency,ttft,itl,ti,to,tt,text=await ask(client,scheduler,model,context,question,cache)
+            s.set(input_tokens=ti,output_tokens=to)
+        print(f"[OK] {model} | {question[:40]}... | {latency}s (ttft {ttft}s, itl {itl}ms) | tokens={tt}")
+        return [model,question,latency,ttft,itl,ti,to,tt,text[:200].replace("\n"," ")]
+    except Exception as e:
+        print(f"[ERROR] {model} | {question[:40]}... | {e}")
+        return [model,question,0,0,0,0,0,0,f"ERROR: {e}"]
+
+async def run_sweep(args):
+    # Retries are handled by the scheduler, not the client
+    client=AsyncOpenAI(api_key=API_KEY,base_url=BASE_URL,max_retries=0)
+    scheduler=Scheduler(args.concurrency,args.rpm,args.tpm)
+    # Off by default so latencies stay real; ANSWER_CACHE=1 replays identical calls
+    cache=open_answer_cache(enabled_by_default=False)
+    blocks=load_context(DATA_DIR)
+    contexts={m:build_context(blocks,m) for m in MODELS}
+    assert all(len(c)>200 for c in contexts.values()), "Context too short. Check your JSON files."
+    print("[DEBUG] Context preview:\n",contexts[MODELS[0]][:800],"\n--- END PREVIEW ---")
 
-    with open(OUT_FILE,"w",newline="",encoding="utf-8") as f:
+    t0=time.perf_counter()
+    with open(args.out,"w",newline="",encoding="utf-8") as f:
         writer=csv.writer(f)
-        writer.writerow(["model","question","latency_s","input_tokens","output_tokens","total_tokens","answer_preview"])
+        writer.writerow(["model","question","latency_s","ttft_s","itl_ms","input_tokens","output_tokens","total_tokens","answer_preview"])
+        tasks=[asyncio.create_task(run_one(client,scheduler,m,contexts[m],q,cache)) for q in QUESTIONS for m in MODELS]
+        # Rows are written in completion order, as soon as each call finishes
+        for done in asyncio.as_completed(tasks):
+            writer.writerow(await done)
+            f.flush()
+    await client.close()
 
-        for q in QUESTIONS:
-            for m in MODELS:
-                try:
-                    latency,ti,to,tt,text=ask(client,m,context,q)
-                    writer.writerow([m,q,latency,ti,to,tt,text[:200].replace("\n"," ")])
-                    print(f"[OK] {m} | {q[:40]}... | {latency}s | tokens={tt}")
-                except Exception as e:
-                    print(f"[ERROR] {m} | {q[:40]}... | {e}")
-                    writer.writerow([m,q,0,0,0,0,f"ERROR: {e}"])
+    print(f"[DONE] {len(tasks)} calls in {time.perf_counter()-t0:.2f}s wall time")
+    if cache: print("[CACHE]", cache.stats())
+    print("[TRACE]", tracing.metrics.summary())
+    print(f"\n✅ Saved: {args.out}")
 
-    print(f"\n✅ Saved: {OUT_FILE}")
+def main(argv=None):
+    print("[DEBUG] CWD:", os.getcwd())
+    if not API_KEY: raise ValueError("❌ OPENAI_API_KEY not found in .env")
+    ap=argparse.ArgumentParser(description="Concurrent QUESTIONS x MODELS latency/token sweep.")
+    ap.add_argument("--out",default=OUT_FILE)
+    ap.add_argument("--concurrency",type=int,help="max in-flight calls per model (default: per-model limits)")
+    ap.add_argument("--rpm",type=int,help="requests/minute per model")
+    ap.add_argument("--tpm",type=int,help="tokens/minute per model")
+    asyncio.run(run_sweep(ap.parse_args(argv)))
 
 if __name__=="__main__":
     main()
\ No newline at end of file
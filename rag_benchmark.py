@@ -0,0 +1,163 @@
+# End-to-end RAG latency breakdown over the gold question set.
+# Runs the real qna.py pipeline (embed -> hybrid search -> pack -> make_prompt -> LLM) per collection,
+# one subprocess per collection because qna.py binds its collection at import time.
+#
+#   python rag_benchmark.py                                   # every collection in the gold set
+#   python rag_benchmark.py --collections EPLC --repeat 5 --no-llm
+#   OPENAI_BASE_URL=http://127.0.0.1:8808/v1 python rag_benchmark.py   # against the mock server
+
+import os, sys, json, time, argparse, subprocess, tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "Coding"))
+from retrieval_metrics import GOLD_PATH, load_gold, percentiles, recall_at_k
+from ingest import db_path_for
+from context_packer import count_tokens
+
+OUT_FILE = "rag_benchmark.json"
+STAGES = ["embed", "search", "rerank", "pack", "prompt", "ttft", "itl", "generate", "total"]
+
+def run_collection(collection, args):
+    os.environ.update({
+        "CHROMA_COLLECTION": collection,
+        "CHROMA_PATH": args.db or db_path_for(collection),
+        "TOP_K": str(args.k),
+        # Measure the pipeline itself, not the caches in front of it
+        "QUERY_CACHE": "0",
+        "ANSWER_CACHE": "0",
+    })
+    if args.no_llm:
+        os.environ.setdefault("OPENAI_API_KEY", "unused")
+    sys.path.insert(0, os.path.join(ROOT, "Coding", "Q&A"))
+    import qna
+
+    questions = load_gold(args.gold)[collection]
+    for item in questions[:args.warmup]:
+        q = item["question"]
+        ids, docs, dists, _ = qna.search(qna.embed_query(q), qna.candidates(args.k), q)
+        if qna.reranker:
+            qna.reranker.warm_up().result()
+            qna.rerank(q, ids, docs, dists, args.k)
+
+    timings = {s: [] for s in STAGES}
+    prompt_tokens, recalls, rows = [], [], []
+    for _ in range(args.repeat):
+        for item in questions:
+            q, t = item["question"], {}
+            t0 = time.perf_counter()
+            qv = qna.embed_query(q)
+            t["embed"] = time.perf_counter() - t0
+            t1 = time.perf_counter()
+            ids, docs, dists, metas = qna.search(qv, qna.candidates(args.k), q)
+            t["search"] = time.perf_counter() - t1
+            if qna.reranker:
+                t1 = time.perf_counter()
+                result = qna.reranker.rerank(q, docs, args.k)
+                ids, docs, dists, metas = ([xs[i] for i in result.order] for xs in (ids, docs, dists, metas))
+                t["rerank"] = time.perf_counter() - t1
+            # The context production sends: budgeted, deduped, widened to parent sections
+            t1 = time.perf_counter()
+            ids, docs, dists = qna.pack(ids, docs, dists)
+            t["pack"] = time.perf_counter() - t1
+            t1 = time.perf_counter()
+            prompt = qna.make_prompt(q, docs)
+            t["prompt"] = time.perf_counter() - t1
+            answer = ""
+            if not args.no_llm:
+                t1, stamps, parts = time.perf_counter(), [], []
+                for delta in qna.stream_openai(prompt):
+                    stamps.append(time.perf_counter())
+                    parts.append(delta)
+                answer = "".join(parts).strip()
+                t["generate"] = time.perf_counter() - t1
+                if stamps:
+                    # Time to first token is measured from the start of the question, as a user sees it
+                    t["ttft"] = stamps[0] - t0
+                if len(stamps) > 1:
+                    t["itl"] = (stamps[-1] - stamps[0]) / (len(stamps) - 1)
+            t["total"] = time.perf_counter() - t0
+
+            for stage, value in t.items():
+                timings[stage].append(value)
+            ptoks = count_tokens(qna.SYSTEM_PROMPT + prompt, qna.CHAT_MODEL)
+            recall = recall_at_k(metas, item["gold"], args.k)
+            prompt_tokens.append(ptoks)
+            recalls.append(recall)
+            rows.append({"question": q, "ids": ids, "recall": recall, "prompt_tokens": ptoks,
+                         "timings_ms": {s: round(v * 1000, 3) for s, v in t.items()},
+                         "answer_preview": answer[:200]})
+
+    return {
+        "db": os.environ["CHROMA_PATH"],
+        "chat_model": None if args.no_llm else qna.CHAT_MODEL,
+        "embed_model": qna.EMBED_MODEL,
+        "rerank_model": qna.RERANK_MODEL if qna.reranker else None,
+        "stages_ms": {s: percentiles([v * 1000 for v in timings[s]]) for s in STAGES if timings[s]},
+        "prompt_tokens": percentiles(prompt_tokens),
+        f"recall@{args.k}": round(sum(recalls) / len(recalls), 4) if recalls else 0.0,
+        "questions": rows,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def print_summary(results, k):
+    print(f"\n{'collection':<22}{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for coll, r in results.items():
+        for stage, p in r["stages_ms"].items():
+            print(f"{coll:<22}{stage:<10}{p['p50']:>10.2f}{p['p95']:>10.2f}{p['p99']:>10.2f}")
+        print(f"{coll:<22}recall@{k}={r[f'recall@{k}']:.3f}  prompt_tokens p50={r['prompt_tokens']['p50']:.0f}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-stage latency and recall benchmark of the qna.py pipeline.")
+    ap.add_argument("--collections", nargs="*", help="collections from the gold set (default: all)")
+    ap.add_argument("--collection", help=argparse.SUPPRESS)  # worker mode: one collection per process
+    ap.add_argument("--db", help="Chroma path (default: the collection's folder under Data/Vector DataBase)")
+    ap.add_argument("--gold", default=GOLD_PATH)
+    ap.add_argument("--k", type=int, default=int(os.getenv("TOP_K", "6")))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--no-llm", action="store_true", help="skip generation (retrieval only)")
+    ap.add_argument("--out", default=OUT_FILE)
+    args = ap.parse_args(argv)
+
+    if args.collection:
+        result = run_collection(args.collection, args)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        return
+
+    names = args.collections or list(load_gold(args.gold))
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            part = os.path.join(tmp, "part.json")
+            cmd = [sys.executable, os.path.abspath(__file__), "--collection", name, "--gold", args.gold,
+                   "--k", str(args.k), "--repeat", str(args.repeat), "--warmup", str(args.warmup), "--out", part]
+            if args.db:
+                cmd += ["--db", args.db]
+            if args.no_llm:
+                cmd.append("--no-llm")
+            proc = subprocess.run(cmd)
+            if proc.returncode != 0 or not os.path.exists(part):
+                print(f"[ERROR] {name}: benchmark worker failed (exit {proc.returncode})")
+                continue
+            with open(part, "r", encoding="utf-8") as f:
+                results[name] = json.load(f)
+
+    report = {
+        "run": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+                "k": args.k, "repeat": args.repeat, "llm": not args.no_llm},
+        "collections": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_summary(results, args.k)
+    print(f"\n✅ Saved: {args.out}")
+
+if __name__ == "__main__":
+    main()
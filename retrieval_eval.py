@@ -0,0 +1,238 @@
+# Offline retrieval quality / cost comparison over the gold question set.
+# Chunks the local Data/ corpus, encodes it once per (encoder, chunk size) into a cached binary
+# store, and serves every configuration through the store-backend path qna.py uses (float,
+# int8 or PQ index, fused with BM25, optional cross-encoder rerank). Per configuration it
+# records recall@k, MRR and nDCG@k against the gold sections, query latency (encode + search
+# + rerank), index size on disk and in memory, and prompt tokens after context packing.
+# Nothing leaves the machine: encoders must already be in the local Hugging Face cache, and
+# no LLM is called.
+#
+#   python retrieval_eval.py                                          # default grid, every gold collection
+#   python retrieval_eval.py --models sentence-transformers/all-MiniLM-L6-v2 BAAI/bge-large-en-v1.5 \
+#       --chunk-chars 400 700 1200 --k 3 6 10 --index float int8 pq --rerank off on
+#   python retrieval_eval.py --collections EPLC Development_Phase --lexical on off --out eval.json
+
+import os, sys, json, time, hashlib, argparse, itertools, subprocess
+from typing import Any, Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "Coding"))
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("TRACE", "0")
+from chunker import CHUNK_CHARS, SectionIndex, chunk_file
+from context_packer import count_tokens, pack_context
+from embedding_store import DATA_DIR, MATRIX_SUFFIX, load_store, save_store
+from federated import StoreShard
+from ingest import EMBED_MODEL, discover_sources
+from model_registry import canonical, encode
+from quantized_index import QUANT_SUFFIX, build_quantized
+from reranker import RERANK_FETCH, Reranker
+from retrieval_metrics import GOLD_PATH, is_relevant, load_gold, ndcg_at_k, percentiles, recall_at_k, reciprocal_rank
+
+CACHE_DIR  = os.getenv("EVAL_CACHE_DIR", os.path.join(DATA_DIR, "Evaluation", ".cache"))  # encoded corpora
+OUT_FILE   = "retrieval_eval.json"
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")  # context budget and tokenizer for prompt tokens
+
+
+class Config(NamedTuple):
+    model: str
+    chunk_chars: int
+    index: str     # "float", "int8" or "pq"
+    lexical: bool  # BM25 fused with the dense hits
+    rerank: bool
+    k: int
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# Corpus: the same chunks ingest.py would index, at a given chunk size
+def load_corpus(collections: List[str], chunk_chars: int) -> Dict[str, List[Dict[str, Any]]]:
+    sources, out = discover_sources(), {}
+    for name in collections:
+        chunks = []
+        for fp in sources.get(name, []):
+            try:
+                chunks.extend(chunk_file(fp, max_chars=chunk_chars))
+            except ValueError as e:
+                print(f"[skip] {e}")
+        out[name] = chunks
+    return out
+
+def gold_coverage(chunks: List[Dict[str, Any]], questions: List[Dict[str, Any]]) -> float:
+    # Share of gold sections present in the corpus at all: the ceiling for recall
+    gold = [g for item in questions for g in item["gold"]]
+    found = sum(1 for g in gold if any(is_relevant(c["metadata"], [g]) for c in chunks))
+    return found / len(gold) if gold else 0.0
+
+def build_store(collection: str, chunks: List[Dict[str, Any]], model: str, chunk_chars: int) -> str:
+    # Encoded once per (model, chunk size, collection); re-encoded only when the chunks change
+    digest = hashlib.sha1(json.dumps([model, [(c["id"], c["text"]) for c in chunks]]).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, model.replace("/", "__"), str(chunk_chars), collection)
+    if os.path.exists(path + MATRIX_SUFFIX) and load_store(path).info.get("source") == digest:
+        return path
+    t0 = time.perf_counter()
+    texts = [c["text"] for c in chunks]
+    vectors = encode(model, texts)
+    save_store(path, vectors, [c["id"] for c in chunks], texts, [c["metadata"] for c in chunks],
+               model=model, source=digest)
+    print(f"[encode] {collection}: {len(chunks)} chunks ({chunk_chars} chars) with {model} "
+          f"in {time.perf_counter() - t0:.2f}s")
+    return path
+
+def open_shard(path: str, collection: str, chunks: List[Dict[str, Any]], index: str) -> StoreShard:
+    build_quantized(path, None if index == "float" else index)
+    # Not a registered collection name, so the model comes from the store itself
+    shard = StoreShard(f"eval:{collection}", path)
+    shard.sections = SectionIndex.from_chunks(chunks)
+    return shard
+
+def index_size(shard: StoreShard) -> Dict[str, float]:
+    files = [shard.path + MATRIX_SUFFIX] + ([shard.path + QUANT_SUFFIX] if shard.kind in ("int8", "pq") else [])
+    resident = shard.index.nbytes if shard.kind in ("int8", "pq") else shard.store.vectors.nbytes
+    return {"disk_mb": round(sum(os.path.getsize(f) for f in files) / 2**20, 3),
+            "resident_mb": round(resident / 2**20, 3)}
+
+
+# One configuration over one collection's questions
+def run_config(cfg: Config, shard: StoreShard, questions: List[Dict[str, Any]], qvecs: Dict[str, Any],
+               encode_s: Dict[str, float], reranker, repeat: int) -> Dict[str, Any]:
+    fetch = max(cfg.k, RERANK_FETCH) if cfg.rerank else cfg.k
+    if cfg.rerank:
+        reranker.cache.clear()  # every configuration pays for its own cross-encoder scores
+    rows, latency = [], []
+    for rep in range(repeat):
+        for item in questions:
+            q = item["question"]
+            t0 = time.perf_counter()
+            ids, docs, sims, metas = shard.search(qvecs[q], fetch, q if cfg.lexical else None)
+            if cfg.rerank:
+                result = reranker.rerank(q, docs, cfg.k, budget_ms=600_000)
+                ids, docs, metas = ([xs[i] for i in result.order] for xs in (ids, docs, metas))
+            ids, docs, metas = ids[:cfg.k], docs[:cfg.k], metas[:cfg.k]
+            latency.append((time.perf_counter() - t0 + encode_s[q]) * 1000)
+            if rep:
+                continue
+            packed = pack_context(docs, ids, CHAT_MODEL, parents=[shard.parent(i) for i in ids])
+            rows.append({"question": q, "ids": ids,
+                         "recall": recall_at_k(metas, item["gold"], cfg.k),
+                         "rr": reciprocal_rank(metas, item["gold"], cfg.k),
+                         "ndcg": ndcg_at_k(metas, item["gold"], cfg.k),
+                         "prompt_tokens": packed.tokens + count_tokens(q, CHAT_MODEL)})
+    return {"rows": rows, "latency_ms": latency}
+
+def summarize(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    rows = [r for p in parts for r in p["rows"]]
+    n = len(rows) or 1
+    return {
+        "questions": len(rows),
+        "recall": round(sum(r["recall"] for r in rows) / n, 4),
+        "mrr": round(sum(r["rr"] for r in rows) / n, 4),
+        "ndcg": round(sum(r["ndcg"] for r in rows) / n, 4),
+        "latency_ms": percentiles([v for p in parts for v in p["latency_ms"]]),
+        "prompt_tokens": percentiles([r["prompt_tokens"] for r in rows]),
+    }
+
+
+def evaluate(args) -> Dict[str, Any]:
+    gold = load_gold(args.gold)
+    names = [c for c in (args.collections or list(gold)) if c in gold]
+    reranker = None
+    if "on" in args.rerank:
+        reranker = Reranker()
+        try:
+            reranker.warm_up().result()
+        except Exception as e:
+            print(f"[rerank] {reranker.model_name} unavailable offline, rerank=on skipped: {type(e).__name__}: {e}")
+            reranker = None
+
+    results, coverage = [], {}
+    for chunk_chars in args.chunk_chars:
+        corpus = load_corpus(names, chunk_chars)
+        coverage[chunk_chars] = {c: round(gold_coverage(corpus[c], gold[c]), 4) for c in names}
+        for model in args.models:
+            try:
+                stores = {c: build_store(c, corpus[c], model, chunk_chars) for c in names if corpus[c]}
+            except Exception as e:
+                print(f"[skip] {model}: {type(e).__name__}: {e}")
+                continue
+            # Query vectors once per model; their encode time is added to every configuration's latency
+            qvecs, encode_s = {}, {}
+            encode(model, ["warm up"])
+            for c in stores:
+                for item in gold[c]:
+                    t0 = time.perf_counter()
+                    qvecs[item["question"]] = encode(model, [item["question"]])[0]
+                    encode_s[item["question"]] = time.perf_counter() - t0
+            for index in args.index:
+                shards = {c: open_shard(p, c, corpus[c], index) for c, p in stores.items()}
+                sizes = [index_size(s) for s in shards.values()]
+                for lexical, rerank, k in itertools.product(args.lexical, args.rerank, args.k):
+                    if rerank == "on" and reranker is None:
+                        continue
+                    cfg = Config(model, chunk_chars, index, lexical == "on", rerank == "on", k)
+                    per = {c: run_config(cfg, s, gold[c], qvecs, encode_s, reranker, args.repeat)
+                           for c, s in shards.items()}
+                    results.append({
+                        "config": cfg._asdict(),
+                        **summarize(list(per.values())),
+                        "disk_mb": round(sum(s["disk_mb"] for s in sizes), 3),
+                        "resident_mb": round(sum(s["resident_mb"] for s in sizes), 3),
+                        "collections": {c: {**summarize([p]), "rows": p["rows"]} for c, p in per.items()},
+                    })
+                    print_row(results[-1])
+    return {"results": results, "gold_coverage": coverage}
+
+
+# Comparison table
+HEADER = (f"{'model':<24}{'chunk':>6}{'index':>7}{'bm25':>5}{'rerank':>7}{'k':>4}"
+          f"{'recall':>8}{'MRR':>7}{'nDCG':>7}{'p50 ms':>9}{'p95 ms':>9}{'disk MB':>9}{'RAM MB':>8}{'tokens':>8}")
+
+def print_row(r: Dict[str, Any]):
+    c = r["config"]
+    print(f"{c['model'].split('/')[-1][:23]:<24}{c['chunk_chars']:>6}{c['index']:>7}{'on' if c['lexical'] else 'off':>5}"
+          f"{'on' if c['rerank'] else 'off':>7}{c['k']:>4}{r['recall']:>8.3f}{r['mrr']:>7.3f}{r['ndcg']:>7.3f}"
+          f"{r['latency_ms']['p50']:>9.2f}{r['latency_ms']['p95']:>9.2f}{r['disk_mb']:>9.2f}{r['resident_mb']:>8.2f}"
+          f"{r['prompt_tokens']['p50']:>8.0f}")
+
+def print_table(report: Dict[str, Any]):
+    print("\n" + HEADER)
+    for r in report["results"]:
+        print_row(r)
+    for chunk_chars, cov in report["gold_coverage"].items():
+        print(f"gold sections in corpus at {chunk_chars} chars: " + ", ".join(f"{c}={v:.0%}" for c, v in cov.items()))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline recall / MRR / nDCG and cost comparison across retrieval settings.")
+    ap.add_argument("--collections", nargs="*", help="collections from the gold set (default: all)")
+    ap.add_argument("--gold", default=GOLD_PATH)
+    ap.add_argument("--models", nargs="+", default=[canonical(EMBED_MODEL)])
+    ap.add_argument("--chunk-chars", nargs="+", type=int, default=[CHUNK_CHARS])
+    ap.add_argument("--index", nargs="+", default=["float"], choices=("float", "int8", "pq"))
+    ap.add_argument("--lexical", nargs="+", default=["on"], choices=("on", "off"), help="BM25 fusion")
+    ap.add_argument("--rerank", nargs="+", default=["off"], choices=("on", "off"))
+    ap.add_argument("--k", nargs="+", type=int, default=[3, 6, 10])
+    ap.add_argument("--repeat", type=int, default=3, help="passes per configuration for the latency figures")
+    ap.add_argument("--out", default=OUT_FILE)
+    args = ap.parse_args(argv)
+    args.models = [canonical(m) for m in args.models]
+
+    print(HEADER)
+    report = {
+        "run": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+                "chat_model": CHAT_MODEL, "repeat": args.repeat},
+        **evaluate(args),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_table(report)
+    print(f"\n✅ Saved: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+# Shared test setup: the modules under Coding/ import each other by bare name
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Coding"))
@@ -0,0 +1,48 @@
+# Section-path chunk ids
+import copy
+
+import pytest
+
+import ingest
+from chunker import iter_chunks
+
+
+def plan(*sections):
+    return {"document_title": "Training Plan",
+            "sections": [{"number": n, "title": t, "content": [body]} for n, t, body in sections]}
+
+def ids(doc, max_chars=700):
+    return [c["id"] for c in iter_chunks(doc, "Training Plan.json", max_chars)]
+
+
+def test_inserting_a_section_keeps_later_ids():
+    before = plan(("1", "Purpose", "Why."), ("2", "Scope", "All staff."), ("3", "Schedule", "Quarterly."))
+    after = copy.deepcopy(before)
+    after["sections"].insert(1, {"number": "", "title": "Audience", "content": ["Project managers."]})
+    old, new = ids(before), ids(after)
+    assert old == ["Training Plan.json:Training Plan > 1 Purpose", "Training Plan.json:Training Plan > 2 Scope",
+                   "Training Plan.json:Training Plan > 3 Schedule"]
+    assert new == [old[0], "Training Plan.json:Training Plan > Audience", *old[1:]]
+
+def test_split_and_repeated_sections_get_numbered_ids():
+    long = " ".join(f"Sentence {n} of the training scope." for n in range(40))
+    doc = plan(("1", "Scope", long), ("2", "Notes", "First."), ("2", "Notes", "Second."))
+    chunks = list(iter_chunks(doc, "Training Plan.json", max_chars=200))
+    scope = [c for c in chunks if c["metadata"]["title"] == "Scope"]
+    assert len(scope) > 1 and scope[1]["id"] == scope[0]["id"] + "#2"
+    assert {c["metadata"]["parent_id"] for c in scope} == {scope[0]["id"]}
+    assert [c["id"] for c in chunks[-2:]] == ["Training Plan.json:Training Plan > 2 Notes",
+                                              "Training Plan.json:Training Plan > 2 Notes#2"]
+
+def test_editing_a_section_keeps_all_ids():
+    before = plan(("1", "Purpose", "Why."), ("2", "Scope", "All staff."))
+    after = copy.deepcopy(before)
+    after["sections"][0]["content"] = ["Why, reworded."]
+    assert ids(before) == ids(after)
+
+
+@pytest.mark.parametrize("collection", sorted(ingest.discover_sources()))
+def test_ids_unique_in_committed_cleaned_json(collection):
+    chunks = ingest.load_chunks(ingest.discover_sources()[collection])
+    seen = [c["id"] for c in chunks]
+    assert seen and len(seen) == len(set(seen))
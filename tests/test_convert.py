@@ -0,0 +1,122 @@
+# Raw template -> cleaned section JSON
+import os
+
+import pytest
+
+import convert
+from convert import Block, build_document, table_lines
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HHS_POLICY = os.path.join(ROOT, "Data", "HHS EPLC Website", "HHS EPLC Policy.docx")
+
+
+def titles(sections):
+    return [(s["number"], s["title"], titles(s.get("subsections", []))) for s in sections]
+
+
+# Blocks -> sections / subsections
+def test_build_document_nests_headings_and_drops_front_matter():
+    blocks = [Block("text", "Cover page"), Block("heading", "Purpose", 1, "1"), Block("text", "Why."),
+              Block("heading", "Roles", 1, "2"), Block("heading", "Managers", 2, "2.1"), Block("text", "Lead."),
+              Block("heading", "Owners", 2), Block("text", "Fund.")]
+    doc = build_document(blocks, "Plan", "plan.docx", "abc")
+    assert titles(doc["sections"]) == [("1", "Purpose", []),
+                                       ("2", "Roles", [("2.1", "Managers", []), ("2.2", "Owners", [])])]
+    assert doc["sections"][0]["content"] == "Why."
+    assert "Cover page" not in str(doc)
+    assert doc["converter"] == {"version": convert.CONVERTER_VERSION, "sha256": "abc"}
+
+def test_build_document_drops_empty_headings():
+    blocks = [Block("heading", "Purpose", 1, "1"), Block("text", "Why."),
+              Block("heading", "Blank", 1, "2"), Block("heading", "Also blank", 2, "2.1"),
+              Block("heading", "Scope", 1, "3"), Block("text", "All projects.")]
+    doc = build_document(blocks, "Plan", "plan.docx", "abc")
+    assert titles(doc["sections"]) == [("1", "Purpose", []), ("3", "Scope", [])]
+
+def test_build_document_without_headings_is_one_section():
+    doc = build_document([Block("text", "Only text."), Block("text", "More.")], "Memo", "memo.pdf", "abc")
+    assert doc["sections"] == [{"number": "1", "title": "Memo", "content": ["Only text.", "More."]}]
+
+def test_table_lines():
+    rows = (("Version", "Date", ""), ("1.0", "05/07/2008", "x"), ("", "", ""), ("2.0", "01/01/2010"))
+    assert table_lines(rows) == ["Version: 1.0; Date: 05/07/2008; x", "2.0 | 01/01/2010"]
+    assert table_lines((("Name", "Role"),)) == ["Columns: Name, Role"]
+
+
+# Readers
+def test_text_blocks_number_headings_by_depth():
+    blocks = list(convert._text_blocks(["3. Purpose", "This policy mandates", "the EPLC.",
+                                        "8.1. IT Project Managers", "Page 4 of 9", "They lead."]))
+    assert blocks == [Block("heading", "Purpose", 1, "3"), Block("text", "This policy mandates the EPLC."),
+                      Block("heading", "IT Project Managers", 2, "8.1"), Block("text", "They lead.")]
+
+def test_docx_without_heading_styles_takes_headings_from_text(tmp_path):
+    docx = pytest.importorskip("docx")
+    d = docx.Document()
+    for text in ("Policy", "1. Purpose", "Why the policy exists.", "2. Roles", "2.1. Project Managers",
+                 "Project Managers are responsible for:", "Planning phase activities."):
+        d.add_paragraph(text)
+    fp = str(tmp_path / "policy.docx")
+    d.save(fp)
+    doc = convert.convert_file(fp)
+    assert titles(doc["sections"]) == [("1", "Purpose", []), ("2", "Roles", [("2.1", "Project Managers", [])])]
+    assert doc["sections"][1]["subsections"][0]["content"] == [
+        "Project Managers are responsible for:", "Planning phase activities."]
+
+def test_docx_heading_styles_win_over_numbered_text(tmp_path):
+    docx = pytest.importorskip("docx")
+    d = docx.Document()
+    d.add_heading("Purpose", level=1)
+    d.add_paragraph("1. Numbered line kept as text")
+    fp = str(tmp_path / "styled.docx")
+    d.save(fp)
+    doc = convert.convert_file(fp)
+    assert titles(doc["sections"]) == [("1", "Purpose", [])]
+    assert doc["sections"][0]["content"] == "1. Numbered line kept as text"
+
+def test_hhs_policy_docx_keeps_its_section_tree():
+    pytest.importorskip("docx")
+    doc = convert.convert_file(HHS_POLICY)
+    top = [s["title"] for s in doc["sections"]]
+    assert top[:3] == ["Version History", "Nature of Changes", "Purpose"] and "Approvals" in top
+    roles = next(s for s in doc["sections"] if s["title"] == "Roles and Responsibilities")
+    assert [s["number"] for s in roles["subsections"]] == [f"8.{n}" for n in range(1, 9)]
+    # Heading lines don't leak into the body text
+    content = [c for s in doc["sections"] for c in ([s.get("content")] if isinstance(s.get("content"), str)
+                                                   else s.get("content", []))]
+    assert not any(c in ("Purpose", "Scope", "8.1. IT Project Managers") for c in content)
+
+def test_xls_column_rows_become_fields(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("openpyxl")
+    fp = str(tmp_path / "log.xlsx")
+    rows = [["Project Name: <required>", None, None],
+            [None, None, None],
+            ["Column", "Instructions For Completing This Document", None],
+            ["A", "ID: A unique number for each entry", None],
+            ["B", "Describe the lesson learned", None],
+            [None, None, None],
+            ["ID", "Lesson", "Owner"],
+            ["1", "Start early", "PM"]]
+    pd.DataFrame(rows).to_excel(fp, sheet_name="Lessons_Log", header=False, index=False)
+    doc = convert.convert_file(fp)
+    (sheet,) = doc["sections"]
+    assert (sheet["number"], sheet["title"]) == ("1", "Lessons Log")
+    assert sheet["content"] == "Project Name: <required>"
+    (instructions,) = sheet["subsections"]
+    assert instructions["title"] == "Instructions For Completing This Document"
+    assert instructions["fields"] == {"A": {"Field": "ID", "Instruction": "A unique number for each entry"},
+                                      "B": {"Instruction": "Describe the lesson learned"}}
+    # A run of 3+ cell rows is a table under the last heading
+    assert instructions["content"] == "ID: 1; Lesson: Start early; Owner: PM"
+
+
+# Discovery
+def test_discover_raw_skips_lock_temp_and_empty_files(tmp_path):
+    for name, data in (("Plan.docx", b"x"), ("Log.xls", b"x"), ("~$Plan.docx", b"x"), ("_$Plan.docx", b"x"),
+                       (".~lock.Log.xls#", b"x"), ("~WRL0001.tmp", b"x"), ("Notes.txt", b"x"), ("Empty.pdf", b"")):
+        (tmp_path / name).write_bytes(data)
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / ".hidden" / "Other.docx").write_bytes(b"x")
+    found = [os.path.basename(fp) for fp in convert.discover_raw([str(tmp_path)])]
+    assert found == ["Log.xls", "Plan.docx"]
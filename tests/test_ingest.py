@@ -0,0 +1,95 @@
+# Incremental re-indexing: only new / changed chunks are embedded, removed ids are deleted
+import json
+
+import numpy as np
+import pytest
+
+import ingest
+
+DOC = {"document_title": "Training Plan", "sections": [
+    {"number": "1", "title": "Purpose", "content": ["Why the training is delivered."]},
+    {"number": "2", "title": "Scope", "content": ["Who is trained and on which systems."]},
+    {"number": "3", "title": "Schedule", "content": ["Sessions run during the Development Phase."]},
+]}
+
+
+def write(fp, doc):
+    fp.write_text(json.dumps(doc), encoding="utf-8")
+    return str(fp)
+
+def edited(doc, number, text):
+    doc = json.loads(json.dumps(doc))
+    next(s for s in doc["sections"] if s["number"] == number)["content"] = [text]
+    return doc
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    # Everything ingest writes goes under tmp_path; encoding is a stub that records its input
+    src = tmp_path / "Training Plan.json"
+    monkeypatch.setattr(ingest, "VECTOR_DB_DIR", str(tmp_path / "db"))
+    monkeypatch.setattr(ingest, "STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(ingest, "discover_sources", lambda: {"Test_Phase": [str(src)]})
+    monkeypatch.setattr(ingest, "registered", lambda name: None)
+    monkeypatch.setattr(ingest, "register", lambda *a, **kw: None)
+    monkeypatch.setattr(ingest, "publish_snapshot", lambda name: None)
+    monkeypatch.setattr(ingest, "invalidate_collection", lambda name: 0)
+    encoded = []
+
+    def encode(texts, model, workers, batch_size):
+        encoded.append(list(texts))
+        return np.asarray([[len(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+    monkeypatch.setattr(ingest, "encode_texts", encode)
+    (tmp_path / "db" / "chroma_db_Test Phase").mkdir(parents=True)
+    return src, encoded
+
+
+def test_diff_manifest_embeds_only_edited_chunk(env):
+    src, _ = env
+    chunks = ingest.load_chunks([write(src, DOC)])
+    ingest.save_manifest("Test_Phase", "m", chunks, 3)
+    manifest = ingest.load_manifest("Test_Phase")
+    assert set(manifest["chunks"]) == {c["id"] for c in chunks}
+
+    after = ingest.load_chunks([write(src, edited(DOC, "2", "Everyone on the project team."))])
+    changed, removed, full = ingest.diff_manifest(manifest, after, "m")
+    assert not full and removed == []
+    assert [c["id"] for c in changed] == ["Training Plan.json:Training Plan > 2 Scope"]
+
+def test_diff_manifest_deletes_removed_sections(env):
+    src, _ = env
+    chunks = ingest.load_chunks([write(src, DOC)])
+    ingest.save_manifest("Test_Phase", "m", chunks, 3)
+    doc = dict(DOC, sections=[s for s in DOC["sections"] if s["number"] != "3"])
+    changed, removed, full = ingest.diff_manifest(ingest.load_manifest("Test_Phase"),
+                                                  ingest.load_chunks([write(src, doc)]), "m")
+    assert (changed, removed, full) == ([], ["Training Plan.json:Training Plan > 3 Schedule"], False)
+
+def test_diff_manifest_rebuilds_on_model_change(env):
+    src, _ = env
+    chunks = ingest.load_chunks([write(src, DOC)])
+    ingest.save_manifest("Test_Phase", "m", chunks, 3)
+    changed, removed, full = ingest.diff_manifest(ingest.load_manifest("Test_Phase"), chunks, "other")
+    assert full and len(changed) == len(chunks) and removed == []
+
+
+def test_reingest_upserts_changed_and_deletes_removed(env):
+    chromadb = pytest.importorskip("chromadb")
+    src, encoded = env
+    write(src, DOC)
+    ingest.ingest(["Test_Phase"], model_name="m", workers=1)
+    assert len(encoded[-1]) == 3
+
+    # A row no manifest knows about (an old positional id) is cleaned up on the next run
+    coll = chromadb.PersistentClient(path=ingest.db_path_for("Test_Phase")).get_collection("Test_Phase")
+    coll.add(ids=["section_0"], embeddings=[[1.0, 0.0, 0.0]], documents=["stale"])
+
+    doc = edited(DOC, "1", "Why and how the training is delivered.")
+    doc["sections"] = doc["sections"][:2]
+    write(src, doc)
+    ingest.ingest(["Test_Phase"], model_name="m", workers=1)
+    assert encoded[-1] == ["Why and how the training is delivered."]
+    ids = set(chromadb.PersistentClient(path=ingest.db_path_for("Test_Phase")).get_collection("Test_Phase")
+              .get(include=[])["ids"])
+    assert ids == {"Training Plan.json:Training Plan > 1 Purpose", "Training Plan.json:Training Plan > 2 Scope"}
+    assert set(ingest.load_manifest("Test_Phase")["chunks"]) == ids
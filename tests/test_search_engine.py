@@ -0,0 +1,48 @@
+# Top-k search over the in-process vector index
+import numpy as np
+import pytest
+
+from search_engine import VectorIndex, top_k_indices
+
+
+def full_sort(scores, k):
+    return np.argsort(-scores, axis=1, kind="stable")[:, :max(k, 0)]
+
+
+@pytest.mark.parametrize("k", [1, 3, 10, 99, 100, 101, 500])
+def test_top_k_matches_full_argsort(k):
+    scores = np.random.default_rng(0).standard_normal((4, 100)).astype(np.float32)
+    assert np.array_equal(top_k_indices(scores, k), full_sort(scores, k))
+
+@pytest.mark.parametrize("k", [1, 2, 7, 40])
+def test_top_k_ties_keep_index_order(k):
+    # Few distinct values, so the k-th score is nearly always shared with rows left out
+    scores = np.random.default_rng(1).integers(0, 3, (5, 40)).astype(np.float32)
+    assert np.array_equal(top_k_indices(scores, k), full_sort(scores, k))
+    assert top_k_indices(np.zeros((1, 50), dtype=np.float32), 3).tolist() == [[0, 1, 2]]
+
+def test_top_k_caps_k_at_n():
+    scores = np.array([[0.1, 0.9, 0.5]], dtype=np.float32)
+    assert top_k_indices(scores, 3).tolist() == [[1, 2, 0]]
+    assert top_k_indices(scores, 10).tolist() == [[1, 2, 0]]
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_top_k_non_positive_k_is_empty(k):
+    top = top_k_indices(np.ones((2, 4), dtype=np.float32), k)
+    assert top.shape == (2, 0) and top.dtype == np.int64
+
+
+def test_vector_index_search():
+    vectors = np.array([[1, 0], [0, 1], [1, 1], [1, 0]], dtype=np.float32)
+    index = VectorIndex(vectors, ids=["a", "b", "c", "d"], titles=["A", "B", "C", "D"])
+    hits = index.search(np.array([[2, 0], [0, 1]], dtype=np.float32), k=3)
+    # "a" and "d" tie; the earlier row comes first
+    assert [h.id for h in hits[0]] == ["a", "d", "c"]
+    assert [h.title for h in hits[1]] == ["B", "C", "A"]
+    assert hits[0][0].score == pytest.approx(1.0) and hits[0][2].score == pytest.approx(2 ** -0.5)
+    assert [h.id for h in index.search_one(np.array([1, 0]), k=10)] == ["a", "d", "c", "b"]
+    assert index.search(np.array([[1, 0]]), k=0) == [[]]
+
+def test_vector_index_rejects_mismatched_ids():
+    with pytest.raises(ValueError):
+        VectorIndex(np.ones((3, 2)), ids=["a", "b"])